@@ -1,9 +1,129 @@
 import os
 from pydantic import BaseModel
 
+# Relative data paths (database, caches, artifacts) resolve against DATA_DIR, so every
+# server process uses the same files whatever its working directory
+DATA_DIR = os.path.abspath(os.getenv("DATA_DIR", "."))
+
+def _data_path(name: str, default: str) -> str:
+    return os.path.join(DATA_DIR, os.getenv(name, default))
+
+def _default_exec_workers() -> int:
+    # Several server processes share the cores; a single one uses up to 4 workers
+    cores = os.cpu_count() or 1
+    web_workers = max(1, int(os.getenv("WEB_WORKERS", "1")))
+    return max(1, min(4, cores)) if web_workers == 1 else max(1, cores // web_workers)
+
 class Settings(BaseModel):
     GEMINI_API_KEY: str = os.getenv("GEMINI_API_KEY", "")
     GEMINI_MODEL: str = os.getenv("GEMINI_MODEL", "gemini-2.5-pro")
-    DATABASE_URL: str = "sqlite:///./cadquery_genai.db"
+    # LLM access: "gemini", or "stub" for offline load testing
+    LLM_BACKEND: str = os.getenv("LLM_BACKEND", "gemini")
+    LLM_MAX_CONCURRENCY: int = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))  # Across all server processes
+    LLM_TIMEOUT_SECONDS: float = float(os.getenv("LLM_TIMEOUT_SECONDS", "120"))
+    LLM_MAX_RETRIES: int = int(os.getenv("LLM_MAX_RETRIES", "4"))
+    LLM_BACKOFF_SECONDS: float = float(os.getenv("LLM_BACKOFF_SECONDS", "1.0"))
+    LLM_STUB_LATENCY_MS: int = int(os.getenv("LLM_STUB_LATENCY_MS", "200"))
+
+    # Persistent cache of LLM responses whose code executed successfully
+    LLM_CACHE_PATH: str = _data_path("LLM_CACHE_PATH", "cache/llm_cache.db")
+    LLM_CACHE_TTL_SECONDS: float = float(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+    LLM_CACHE_MAX_ENTRIES: int = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+
+    # Per-session LLM context: recent turns verbatim, older ones summarized, within a token budget
+    SESSION_RECENT_TURNS: int = int(os.getenv("SESSION_RECENT_TURNS", "4"))
+    SESSION_TOKEN_BUDGET: int = int(os.getenv("SESSION_TOKEN_BUDGET", "8000"))
+    SESSION_SUMMARY_CHARS: int = int(os.getenv("SESSION_SUMMARY_CHARS", "160"))
+    SESSION_CACHE_SIZE: int = int(os.getenv("SESSION_CACHE_SIZE", "256"))
+
+    # Speculative generation: N concurrent candidates, first one that executes wins (1 = off)
+    SPECULATIVE_CANDIDATES: int = int(os.getenv("SPECULATIVE_CANDIDATES", "1"))
+    SPECULATIVE_MAX_CANDIDATES: int = int(os.getenv("SPECULATIVE_MAX_CANDIDATES", "4"))  # Upper bound for a request's `candidates`
+    SPECULATIVE_TEMPERATURES: str = os.getenv("SPECULATIVE_TEMPERATURES", "0.2,0.7,1.0")
+    SPECULATIVE_BUDGET_SECONDS: float = float(os.getenv("SPECULATIVE_BUDGET_SECONDS", "90"))
+
+    # Refinement snapshots: uploaded once, downscaled/re-encoded and referenced by content hash
+    IMAGE_STORE_DIR: str = _data_path("IMAGE_STORE_DIR", "cache/images")
+    IMAGE_MAX_SIDE: int = int(os.getenv("IMAGE_MAX_SIDE", "768"))  # One 768px Gemini tile
+    IMAGE_JPEG_QUALITY: int = int(os.getenv("IMAGE_JPEG_QUALITY", "80"))
+    IMAGE_MAX_UPLOAD_MB: int = int(os.getenv("IMAGE_MAX_UPLOAD_MB", "10"))
+    IMAGE_MAX_MB: int = int(os.getenv("IMAGE_MAX_MB", "512"))
+    IMAGE_GC_INTERVAL_SECONDS: float = float(os.getenv("IMAGE_GC_INTERVAL_SECONDS", "600"))
+    IMAGE_GC_GRACE_SECONDS: float = float(os.getenv("IMAGE_GC_GRACE_SECONDS", "3600"))  # Between upload and the prompt using it
+
+    # Parameter edits (no LLM): slider-style updates per session are debounced, latest wins
+    PARAMETER_DEBOUNCE_MS: int = int(os.getenv("PARAMETER_DEBOUNCE_MS", "150"))
+
+    # Batch jobs (prompt lists / parameter sweeps): items run in the background, at most BATCH_MAX_PARALLEL at a time
+    BATCH_DIR: str = _data_path("BATCH_DIR", "cache/batches")  # Finished batches as zips
+    BATCH_MAX_ITEMS: int = int(os.getenv("BATCH_MAX_ITEMS", "500"))
+    BATCH_MAX_PARALLEL: int = int(os.getenv("BATCH_MAX_PARALLEL", "2"))
+    BATCH_POLL_SECONDS: float = float(os.getenv("BATCH_POLL_SECONDS", "2"))
+    BATCH_MAX_ATTEMPTS: int = int(os.getenv("BATCH_MAX_ATTEMPTS", "3"))  # Claims of an item interrupted by restarts before it is failed
+
+    DATABASE_URL: str = os.getenv("DATABASE_URL", f"sqlite:///{os.path.join(DATA_DIR, 'cadquery_genai.db')}")
+    SQLITE_BUSY_TIMEOUT_MS: int = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+    # Geometry cache (content-addressed BREP store for executed scripts)
+    GEOMETRY_CACHE_DIR: str = _data_path("GEOMETRY_CACHE_DIR", "cache/geometry")
+    GEOMETRY_CACHE_MEMORY_ENTRIES: int = int(os.getenv("GEOMETRY_CACHE_MEMORY_ENTRIES", "32"))
+    GEOMETRY_CACHE_MAX_MB: int = int(os.getenv("GEOMETRY_CACHE_MAX_MB", "512"))
+
+    # Statement-level checkpoints: scripts resume from the longest previously executed statement prefix
+    CHECKPOINTS: bool = os.getenv("CHECKPOINTS", "1") not in ("0", "false", "False")
+    CHECKPOINT_DIR: str = _data_path("CHECKPOINT_DIR", "cache/checkpoints")
+    CHECKPOINT_MEMORY_ENTRIES: int = int(os.getenv("CHECKPOINT_MEMORY_ENTRIES", "16"))
+    CHECKPOINT_MAX_MB: int = int(os.getenv("CHECKPOINT_MAX_MB", "1024"))
+    CHECKPOINT_MIN_MS: float = float(os.getenv("CHECKPOINT_MIN_MS", "25"))  # Only snapshot after this much execution
+
+    # Tessellation used for every exported format (GLB/STL/3MF)
+    MESH_TOLERANCE: float = float(os.getenv("MESH_TOLERANCE", "0.1"))
+    MESH_ANGULAR_TOLERANCE: float = float(os.getenv("MESH_ANGULAR_TOLERANCE", "0.1"))
+    # Vertices closer than this (mm) are merged after tessellation
+    MESH_WELD_TOLERANCE: float = float(os.getenv("MESH_WELD_TOLERANCE", "0.0001"))
+
+    # Printability report of every turn's mesh; PRINT_FEEDBACK also sends problems back to the LLM as a retry
+    PRINT_OVERHANG_ANGLE: float = float(os.getenv("PRINT_OVERHANG_ANGLE", "45"))  # Degrees from vertical that print without supports
+    PRINT_FEEDBACK: bool = os.getenv("PRINT_FEEDBACK", "0") not in ("0", "false", "False")
+    PRINT_MAX_OVERHANG_FRACTION: float = float(os.getenv("PRINT_MAX_OVERHANG_FRACTION", "0.1"))  # Of the surface area
+
+    # Level of detail: a coarse preview GLB is returned first, the fine mesh (MESH_TOLERANCE) follows in the background
+    LOD_PREVIEW_TOLERANCE: float = float(os.getenv("LOD_PREVIEW_TOLERANCE", "0.5"))
+    LOD_PREVIEW_ANGULAR_TOLERANCE: float = float(os.getenv("LOD_PREVIEW_ANGULAR_TOLERANCE", "0.5"))
+    GLB_QUANTIZE: bool = os.getenv("GLB_QUANTIZE", "1") not in ("0", "false", "False")
+
+    # Content-addressed store for exported models, served from /artifacts
+    # Models saved before the artifact store, served from /static
+    STATIC_DIR: str = _data_path("STATIC_DIR", "static")
+    ARTIFACT_DIR: str = _data_path("ARTIFACT_DIR", "artifacts")
+    ARTIFACT_MAX_MB: int = int(os.getenv("ARTIFACT_MAX_MB", "2048"))  # Referenced models are kept even beyond it
+    ARTIFACT_GC_INTERVAL_SECONDS: float = float(os.getenv("ARTIFACT_GC_INTERVAL_SECONDS", "600"))
+    ARTIFACT_GC_GRACE_SECONDS: float = float(os.getenv("ARTIFACT_GC_GRACE_SECONDS", "3600"))
+    ARTIFACT_COMPRESS_MIN_BYTES: int = int(os.getenv("ARTIFACT_COMPRESS_MIN_BYTES", "1024"))
+    ARTIFACT_GZIP_LEVEL: int = int(os.getenv("ARTIFACT_GZIP_LEVEL", "9"))
+    ARTIFACT_BROTLI_QUALITY: int = int(os.getenv("ARTIFACT_BROTLI_QUALITY", "9"))
+
+    # Execution engine (pool of pre-warmed CadQuery worker processes)
+    EXEC_WORKERS: int = int(os.getenv("EXEC_WORKERS", str(_default_exec_workers())))  # Per server process
+    EXEC_TIMEOUT_SECONDS: float = float(os.getenv("EXEC_TIMEOUT_SECONDS", "60"))
+    EXEC_MEMORY_LIMIT_MB: int = int(os.getenv("EXEC_MEMORY_LIMIT_MB", "2048"))  # Worker RSS, and address space beyond the warm worker
+    EXEC_MAX_JOBS_PER_WORKER: int = int(os.getenv("EXEC_MAX_JOBS_PER_WORKER", "200"))
+    EXEC_QUEUE_TIMEOUT_SECONDS: float = float(os.getenv("EXEC_QUEUE_TIMEOUT_SECONDS", "300"))  # Longest wait for a free worker
+    # Static pre-execution check: largest loop iteration / pattern instance count accepted
+    CODE_MAX_ITERATIONS: int = int(os.getenv("CODE_MAX_ITERATIONS", "10000"))
+
+    # Logging: DEBUG also logs prompts, LLM responses and executed code; LOG_FORMAT "text" or "json"
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
+    LOG_FORMAT: str = os.getenv("LOG_FORMAT", "text")
+
+    # cProfile capture: "off", "header" (requests sent with `X-Profile: 1`) or "all"
+    PROFILE_MODE: str = os.getenv("PROFILE_MODE", "off")
+    PROFILE_DIR: str = _data_path("PROFILE_DIR", "cache/profiles")
+
+    # Server processes (uvicorn workers) sharing DATA_DIR; background loops (batch queue,
+    # artifact GC) run in one of them at a time, elected through file locks in LOCK_DIR
+    DATA_DIR: str = DATA_DIR
+    WEB_WORKERS: int = max(1, int(os.getenv("WEB_WORKERS", "1")))
+    LOCK_DIR: str = _data_path("LOCK_DIR", "cache/locks")
 
 settings = Settings()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime
+from sqlalchemy import Column, Integer, String, Text, DateTime, Float, Index
 from sqlalchemy.sql import func
 from .database import Base
 
@@ -17,13 +17,76 @@ class ChatMessage(Base):
     role = Column(String)  # user, model
     content = Column(Text)
     code_snippet = Column(Text, nullable=True) # The code generated, if any
+    image_hash = Column(String, nullable=True) # Snapshot sent with this prompt (image store id)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
+    # Session history is read as "WHERE session_id = ? ORDER BY created_at"
+    __table_args__ = (Index("ix_chat_messages_session_created", "session_id", "created_at"),)
+
 class GeneratedModel(Base):
     __tablename__ = "generated_models"
 
     id = Column(Integer, primary_key=True, index=True)
     session_id = Column(Integer, index=True)
     filename = Column(String)
-    file_path = Column(String)
+    file_path = Column(String)  # Fine GLB (set once lod_status is "ready")
+    preview_path = Column(String, nullable=True)  # Coarse GLB returned first
+    lod_status = Column(String, nullable=True)  # pending, ready, failed
+    stl_path = Column(String, nullable=True)
+    threemf_path = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    # Latest model of a session
+    __table_args__ = (Index("ix_generated_models_session_created", "session_id", "created_at"),)
+
+class GenerationCandidate(Base):
+    """Outcome of one speculative candidate, kept for tuning N/temperatures/variants."""
+    __tablename__ = "generation_candidates"
+
+    id = Column(Integer, primary_key=True, index=True)
+    session_id = Column(Integer, index=True)
+    candidate_index = Column(Integer)
+    temperature = Column(Float, nullable=True)
+    variant = Column(String, nullable=True)
+    outcome = Column(String)  # success, failed, llm_error, cancelled
+    error = Column(Text, nullable=True)
+    llm_ms = Column(Integer, nullable=True)
+    exec_ms = Column(Integer, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class BatchJob(Base):
+    """A batch of prompts or a parameter sweep, worked off by the batch scheduler."""
+    __tablename__ = "batch_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, nullable=True)
+    kind = Column(String)  # prompts, sweep
+    status = Column(String, index=True)  # queued, running, completed, cancelled
+    formats = Column(String)  # Comma-separated formats included in the zip
+    session_id = Column(Integer, nullable=True)  # Sweep: session whose latest code was swept
+    zip_path = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+class BatchItem(Base):
+    __tablename__ = "batch_items"
+
+    id = Column(Integer, primary_key=True, index=True)
+    batch_id = Column(Integer, index=True)
+    item_index = Column(Integer)
+    prompt = Column(Text, nullable=True)  # Prompt items
+    overrides = Column(Text, nullable=True)  # Sweep items: JSON of the parameter values
+    code = Column(Text, nullable=True)  # Sweep items: the script to build; prompt items: the generated script
+    status = Column(String)  # queued, running, done, failed, cancelled
+    error = Column(Text, nullable=True)
+    session_id = Column(Integer, nullable=True)  # Prompt items: session created for the item
+    model_id = Column(Integer, nullable=True)
+    glb_path = Column(String, nullable=True)
+    stl_path = Column(String, nullable=True)
+    threemf_path = Column(String, nullable=True)
+    attempts = Column(Integer, default=0)
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+    # The scheduler claims "the next queued item" in batch order
+    __table_args__ = (Index("ix_batch_items_status_batch", "status", "batch_id", "item_index"),)
@@ -0,0 +1,56 @@
+import os
+import re
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import FileResponse
+
+from ..services.artifact_store import artifact_store
+
+router = APIRouter(
+    prefix="/artifacts",
+    tags=["artifacts"]
+)
+
+MEDIA_TYPES = {
+    "glb": "model/gltf-binary",
+    "stl": "model/stl",
+    "3mf": "model/3mf",
+}
+NAME_PATTERN = re.compile(r"[0-9a-f]{64}\.(glb|stl|3mf)")
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [t.strip().removeprefix("W/") for t in header.split(",")]
+    return "*" in tags or etag in tags
+
+def artifact_response(request: Request, path: str, filename: str = None, immutable: bool = True) -> Response:
+    """
+    Serves a stored artifact with its content hash as a strong ETag and the best
+    precompressed variant the client accepts. Names never change content, so
+    /artifacts URLs are immutable; other callers (e.g. "latest model" downloads)
+    pass immutable=False and rely on revalidation instead.
+    """
+    digest, _, extension = os.path.basename(path).partition(".")
+    served, encoding = artifact_store.variant(path, request.headers.get("accept-encoding"))
+    # One ETag per representation (identity, br, gzip)
+    etag = f'"{digest}-{encoding}"' if encoding else f'"{digest}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "public, max-age=31536000, immutable" if immutable else "no-cache",
+        "Vary": "Accept-Encoding",
+    }
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return FileResponse(served, media_type=MEDIA_TYPES.get(extension), headers=headers, filename=filename)
+
+@router.api_route("/{name}", methods=["GET", "HEAD"])
+def get_artifact(name: str, request: Request):
+    if not NAME_PATTERN.fullmatch(name):
+        raise HTTPException(status_code=404, detail="Artifact not found")
+    path = artifact_store.path_for(name)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Artifact not found")
+    return artifact_response(request, path)
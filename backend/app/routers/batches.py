@@ -0,0 +1,174 @@
+import asyncio
+import json
+import os
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import FileResponse, StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import settings
+from ..database import AsyncSessionLocal, get_db
+from ..models import BatchItem, BatchJob, ChatSession
+from ..schemas import BatchCreateRequest, BatchStatus, BatchItemStatus
+from ..services.artifact_store import artifact_store
+from ..services.batch_queue import batch_scheduler, sweep_items, PATH_COLUMNS
+from ..services.parameters import ParameterError
+from ..services.session_context import session_contexts
+from ..startup import require_database
+
+router = APIRouter(
+    prefix="/api",
+    tags=["batches"],
+    # Until startup has migrated the database
+    dependencies=[Depends(require_database)],
+)
+
+async def _status(db: AsyncSession, batch: BatchJob) -> BatchStatus:
+    items = (await db.execute(
+        select(BatchItem).where(BatchItem.batch_id == batch.id).order_by(BatchItem.item_index)
+    )).scalars().all()
+    counts = {}
+    for item in items:
+        counts[item.status] = counts.get(item.status, 0) + 1
+    return BatchStatus(
+        batch_id=batch.id,
+        name=batch.name,
+        kind=batch.kind,
+        status=batch.status,
+        counts=counts,
+        download_url=f"/api/batches/{batch.id}/download" if batch.status == "completed" else None,
+        items=[
+            BatchItemStatus(
+                index=item.item_index,
+                status=item.status,
+                prompt=item.prompt,
+                overrides=json.loads(item.overrides) if item.overrides else None,
+                error=item.error,
+                session_id=item.session_id,
+                model_id=item.model_id,
+                urls={fmt: artifact_store.url(getattr(item, column)) for fmt, column in PATH_COLUMNS.items() if getattr(item, column)},
+            )
+            for item in items
+        ],
+    )
+
+async def _get_batch(db: AsyncSession, batch_id: int) -> BatchJob:
+    batch = await db.get(BatchJob, batch_id)
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return batch
+
+@router.post("/batches", response_model=BatchStatus)
+async def create_batch(request: BatchCreateRequest, db: AsyncSession = Depends(get_db)):
+    """
+    Queues a batch: a list of prompts (each generated in its own session) or a
+    parameter sweep over a script (every combination is built without the LLM).
+    Items run in the background; poll GET /api/batches/{id} or stream
+    /api/batches/{id}/events, then download the zip.
+    """
+    if bool(request.prompts) == bool(request.sweep):
+        raise HTTPException(status_code=400, detail="Provide either prompts or sweep")
+    formats = [fmt.lower() for fmt in request.formats]
+    unknown = [fmt for fmt in formats if fmt not in PATH_COLUMNS]
+    if unknown or not formats:
+        raise HTTPException(status_code=400, detail=f"Unsupported format(s): {', '.join(unknown) or 'none given'}")
+
+    if request.prompts:
+        items = [BatchItem(item_index=i, prompt=prompt, status="queued") for i, prompt in enumerate(request.prompts)]
+    else:
+        sweep = request.sweep
+        code = sweep.code
+        if sweep.session_id is not None:
+            if not await db.get(ChatSession, sweep.session_id):
+                raise HTTPException(status_code=404, detail="Session not found")
+            code = (await session_contexts.get(db, sweep.session_id)).latest_code
+        if not code:
+            raise HTTPException(status_code=400, detail="The sweep needs code or a session with code")
+        combinations = 1
+        for values in sweep.parameters.values():
+            combinations *= len(values)
+        if combinations > settings.BATCH_MAX_ITEMS:
+            raise HTTPException(status_code=400, detail=f"Batch has {combinations} items; the limit is {settings.BATCH_MAX_ITEMS}")
+        try:
+            grid = sweep_items(code, sweep.parameters)
+        except ParameterError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        items = [
+            BatchItem(item_index=i, overrides=json.dumps(overrides), code=item_code, status="queued")
+            for i, (overrides, item_code) in enumerate(grid)
+        ]
+
+    if not items:
+        raise HTTPException(status_code=400, detail="The batch has no items")
+    if len(items) > settings.BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Batch has {len(items)} items; the limit is {settings.BATCH_MAX_ITEMS}")
+
+    batch = BatchJob(
+        name=request.name,
+        kind="prompts" if request.prompts else "sweep",
+        status="queued",
+        formats=",".join(dict.fromkeys(formats)),
+        session_id=request.sweep.session_id if request.sweep else None,
+    )
+    db.add(batch)
+    await db.flush() # Assigns batch.id
+    for item in items:
+        item.batch_id = batch.id
+        db.add(item)
+    await db.commit()
+    batch_scheduler.notify()
+    return await _status(db, batch)
+
+@router.get("/batches/{batch_id}", response_model=BatchStatus)
+async def get_batch(batch_id: int, db: AsyncSession = Depends(get_db)):
+    return await _status(db, await _get_batch(db, batch_id))
+
+@router.delete("/batches/{batch_id}", response_model=BatchStatus)
+async def cancel_batch(batch_id: int, db: AsyncSession = Depends(get_db)):
+    """Cancels the unfinished items of a batch. A completed batch is left as is."""
+    batch = await _get_batch(db, batch_id)
+    if batch.status not in ("completed", "cancelled"):
+        await batch_scheduler.cancel(db, batch)
+    return await _status(db, batch)
+
+@router.get("/batches/{batch_id}/events")
+async def batch_events(batch_id: int, http_request: Request):
+    """
+    Server-Sent Events: an `item` event whenever an item changes state, then
+    `done` with the final BatchStatus once the batch is completed or cancelled.
+    """
+    async with AsyncSessionLocal() as db:
+        await _get_batch(db, batch_id)
+
+    async def event_stream():
+        seen = {}
+        while True:
+            # Items are updated by the scheduler in other sessions (or processes)
+            async with AsyncSessionLocal() as db:
+                status = await _status(db, await db.get(BatchJob, batch_id))
+            for item in status.items:
+                key = (item.status, item.error)
+                if seen.get(item.index) != key:
+                    seen[item.index] = key
+                    yield f"event: item\ndata: {item.model_dump_json()}\n\n"
+            if status.status in ("completed", "cancelled"):
+                yield f"event: done\ndata: {status.model_dump_json()}\n\n"
+                return
+            if await http_request.is_disconnected():
+                return
+            await asyncio.sleep(1)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/batches/{batch_id}/download")
+async def download_batch(batch_id: int, db: AsyncSession = Depends(get_db)):
+    """Zip of the outputs (NNN.glb, NNN.stl, ...) and a manifest.json with every item's status and code."""
+    batch = await _get_batch(db, batch_id)
+    if batch.status != "completed" or not batch.zip_path or not os.path.exists(batch.zip_path):
+        raise HTTPException(status_code=409, detail="Batch is not completed yet")
+    filename = f"{batch.name or f'batch_{batch.id}'}.zip"
+    return FileResponse(batch.zip_path, media_type="application/zip", filename=filename)
@@ -0,0 +1,17 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from ..startup import startup
+
+router = APIRouter(tags=["health"])
+
+@router.get("/healthz")
+def healthz():
+    """Liveness: the process is up and serving, whether or not startup has finished."""
+    return {"status": "ok"}
+
+@router.get("/readyz")
+def readyz():
+    """Readiness: 200 once the database is migrated, executor workers are warm and imports are loaded; 503 until then."""
+    status = startup.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
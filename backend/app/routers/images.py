@@ -0,0 +1,43 @@
+from fastapi import APIRouter, HTTPException, Request
+
+from ..config import settings
+from ..schemas import ImageUploadResponse
+from ..services.image_store import image_store, InvalidImageError
+
+router = APIRouter(
+    prefix="/api",
+    tags=["images"]
+)
+
+@router.post("/images", response_model=ImageUploadResponse)
+async def upload_image(request: Request):
+    """
+    Uploads a viewer snapshot, either as multipart form data (field "file") or as
+    a raw image body (e.g. Content-Type: image/jpeg). Returns its image_id for
+    GenerateRequest.image_id; re-uploading identical bytes is deduplicated.
+    """
+    max_bytes = settings.IMAGE_MAX_UPLOAD_MB * 1024 * 1024
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > max_bytes:
+        raise HTTPException(status_code=413, detail=f"Image larger than {settings.IMAGE_MAX_UPLOAD_MB} MB")
+
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("file")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(status_code=400, detail="Missing 'file' field")
+        data = await upload.read()
+    else:
+        data = await request.body()
+
+    if not data:
+        raise HTTPException(status_code=400, detail="Empty upload")
+    if len(data) > max_bytes:
+        raise HTTPException(status_code=413, detail=f"Image larger than {settings.IMAGE_MAX_UPLOAD_MB} MB")
+
+    try:
+        # Decoding/downscaling runs in a thread, off the event loop
+        stored = await image_store.aput(data)
+    except InvalidImageError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return ImageUploadResponse(**stored)
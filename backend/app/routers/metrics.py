@@ -0,0 +1,24 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from ..services.artifact_store import artifact_store
+from ..services.executor import executor
+from ..telemetry import ARTIFACT_STORE_BYTES, EXECUTOR_RSS, EXECUTOR_WORKERS, registry
+
+router = APIRouter(tags=["metrics"])
+
+def _update_gauges():
+    # Point-in-time values are read at scrape time rather than tracked continuously
+    stats = executor.stats()
+    EXECUTOR_WORKERS.set(stats["size"], state="configured")
+    EXECUTOR_WORKERS.set(stats["ready"], state="ready")
+    EXECUTOR_WORKERS.set(stats["idle"], state="idle")
+    if stats["max_rss_mb"] is not None:
+        EXECUTOR_RSS.set(stats["max_rss_mb"] * 1024 * 1024)
+    ARTIFACT_STORE_BYTES.set(artifact_store.stats()["bytes"])
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus scrape endpoint (text exposition format)."""
+    _update_gauges()
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
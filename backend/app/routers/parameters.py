@@ -0,0 +1,70 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..database import get_db
+from ..models import ChatSession
+from ..schemas import ParameterSchema, ParameterUpdateRequest, ParameterUpdateResponse
+from ..services.errors import CadQueryExecutionError
+from ..services.executor import executor
+from ..services.jobs import build_preview
+from ..services.generation_pipeline import save_turn
+from ..services.parameters import extract_parameters, apply_overrides, parameter_updates, ParameterError
+from ..services.session_context import session_contexts
+from ..startup import require_database, require_executor
+
+router = APIRouter(
+    prefix="/api",
+    tags=["parameters"],
+    # Until startup has migrated the database
+    dependencies=[Depends(require_database)],
+)
+
+async def _latest_code(db: AsyncSession, session_id: int):
+    session = await db.get(ChatSession, session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    code = (await session_contexts.get(db, session_id)).latest_code
+    if not code:
+        raise HTTPException(status_code=404, detail="No code in this session yet")
+    return session, code
+
+@router.get("/sessions/{session_id}/parameters", response_model=ParameterSchema)
+async def get_parameters(session_id: int, db: AsyncSession = Depends(get_db)):
+    """Top-level literal assignments of the session's latest code, as a typed schema."""
+    _, code = await _latest_code(db, session_id)
+    try:
+        parameters = extract_parameters(code)
+    except ParameterError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return ParameterSchema(session_id=session_id, parameters=parameters)
+
+@router.post("/sessions/{session_id}/parameters", response_model=ParameterUpdateResponse, dependencies=[Depends(require_executor)])
+async def update_parameters(session_id: int, body: ParameterUpdateRequest, db: AsyncSession = Depends(get_db)):
+    """
+    Sets parameters in the session's latest code and rebuilds it without the LLM.
+    Rapid updates (sliders) are debounced per session: only the latest one is
+    built, earlier ones return superseded=true. A successful update is saved as
+    a turn, so later prompts build on the new values.
+    """
+    async def apply():
+        # Read after the debounce, so it builds on any update that just finished
+        session, code = await _latest_code(db, session_id)
+        try:
+            new_code = apply_overrides(code, body.values)
+        except ParameterError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        try:
+            # Validated first: e.g. a count slider pushed to a value that would take minutes to build
+            artifacts = await executor.submit(build_preview, new_code, validate=True)
+        except CadQueryExecutionError as e:
+            return ParameterUpdateResponse(session_id=session_id, code=new_code, error=str(e), parameters=extract_parameters(code))
+
+        prompt = "Set parameters: " + ", ".join(f"{name} = {value!r}" for name, value in body.values.items())
+        response = await save_turn(db, session, prompt, new_code, artifacts, model_content="Parameters Updated")
+        return ParameterUpdateResponse(**response, parameters=extract_parameters(new_code))
+
+    superseded, result = await parameter_updates.run(session_id, apply)
+    if superseded:
+        return ParameterUpdateResponse(session_id=session_id, superseded=True)
+    return result
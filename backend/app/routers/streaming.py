@@ -0,0 +1,61 @@
+import json
+import logging
+from fastapi import APIRouter, Depends, Request
+from fastapi.responses import StreamingResponse
+
+from ..database import AsyncSessionLocal
+from ..models import GeneratedModel
+from ..schemas import GenerateRequest
+from ..services.generation_pipeline import run_generation, wait_for_refinement, lod_urls
+from ..startup import require_database, require_executor
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(
+    prefix="/api",
+    tags=["generation"],
+    # Until startup has migrated the database
+    dependencies=[Depends(require_database)],
+)
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@router.post("/generate/stream", dependencies=[Depends(require_executor)])
+async def generate_model_stream(request: GenerateRequest, http_request: Request):
+    """
+    Server-Sent Events variant of /api/generate.
+    Emits the pipeline events (tokens, code, execution timings, retries) as they
+    happen, then a `done` event carrying the GenerateResponse (with the coarse
+    preview) and finally `lod_ready` once the fine mesh has been built.
+    Closing the connection cancels the in-flight LLM call and execution job.
+    """
+    async def event_stream():
+        # Own DB session: the stream outlives the request's dependency scope
+        db = AsyncSessionLocal()
+        events = run_generation(request, db, stream_tokens=True)
+        try:
+            async for event in events:
+                name = event.pop("event")
+                yield _sse(name, event)
+                if await http_request.is_disconnected():
+                    logger.info("Client disconnected, cancelling generation")
+                    return
+
+                model_id = event.get("response", {}).get("model_id") if name == "done" else None
+                if model_id:
+                    await wait_for_refinement(model_id)
+                    # Updated by the refinement job in its own session
+                    model = await db.get(GeneratedModel, model_id, populate_existing=True)
+                    yield _sse("lod_ready", {"model_id": model_id, "lod_status": model.lod_status, "lods": lod_urls(model)})
+        except Exception as e:
+            yield _sse("error", {"detail": f"System Error: {str(e)}"})
+        finally:
+            await events.aclose()
+            await db.close()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -1,13 +1,109 @@
-from pydantic import BaseModel
-from typing import List, Optional
+from pydantic import BaseModel, Field
+from typing import Dict, List, Optional, Union
+
+from .config import settings
 
 class GenerateRequest(BaseModel):
     prompt: str
     session_id: Optional[int] = None
-    image: Optional[str] = None # Base64 encoded image data
+    image_id: Optional[str] = None # Snapshot uploaded to /api/images
+    image: Optional[str] = None # Legacy inline base64 snapshot; prefer image_id
+    use_cache: bool = True # Set False to always ask the LLM
+    # Speculative candidates for this turn (default: SPECULATIVE_CANDIDATES), each one LLM call and execution job
+    candidates: Optional[int] = Field(None, ge=1, le=settings.SPECULATIVE_MAX_CANDIDATES)
+
+class BoundingBox(BaseModel):
+    min: List[float]
+    max: List[float]
+    size: List[float]
+
+class PrintabilityReport(BaseModel):
+    """Analysis of the preview mesh, as printed in its modelled orientation (Z up). Lengths in mm."""
+    parts: int
+    triangles: int
+    vertices: int
+    volume_mm3: Optional[float] = None # Only for a watertight mesh
+    surface_area_mm2: float
+    bbox: BoundingBox
+    watertight: bool
+    open_edges: int
+    non_manifold_edges: int
+    flipped_edges: int
+    overhang_angle: float # Faces steeper than this (degrees from vertical) count as overhangs
+    overhang_area_mm2: float
+    overhang_fraction: float # Of the surface area
 
 class GenerateResponse(BaseModel):
     session_id: int
     code: str
-    glb_url: str
+    glb_url: str # Coarse preview; the fine mesh follows under lods["fine"]
+    model_id: Optional[int] = None
+    lods: Dict[str, Optional[str]] = {}
+    printability: Optional[PrintabilityReport] = None
     error: Optional[str] = None
+
+class ImageUploadResponse(BaseModel):
+    image_id: str # SHA-256 of the uploaded bytes
+    bytes: int # Size after downscaling/re-encoding
+    deduplicated: bool # Already stored; nothing was processed
+
+class ModelStatus(BaseModel):
+    model_id: int
+    lod_status: Optional[str] = None
+    lods: Dict[str, Optional[str]] = {}
+
+ParameterValue = Union[bool, int, float, str]
+
+class Parameter(BaseModel):
+    name: str
+    type: str # bool, int, float or str
+    value: ParameterValue
+    line: int
+
+class ParameterSchema(BaseModel):
+    session_id: int
+    parameters: List[Parameter] = []
+
+class ParameterUpdateRequest(BaseModel):
+    values: Dict[str, ParameterValue]
+
+class ParameterUpdateResponse(BaseModel):
+    session_id: int
+    superseded: bool = False # A newer update for this session replaced this one
+    code: Optional[str] = None
+    glb_url: Optional[str] = None
+    model_id: Optional[int] = None
+    lods: Dict[str, Optional[str]] = {}
+    printability: Optional[PrintabilityReport] = None
+    parameters: List[Parameter] = []
+    error: Optional[str] = None
+
+class ParameterSweep(BaseModel):
+    session_id: Optional[int] = None # Sweep the latest code of this session...
+    code: Optional[str] = None # ...or this script
+    parameters: Dict[str, List[ParameterValue]] # Every combination (cartesian product) becomes one item
+
+class BatchCreateRequest(BaseModel):
+    name: Optional[str] = None
+    prompts: List[str] = [] # One new session per prompt
+    sweep: Optional[ParameterSweep] = None
+    formats: List[str] = ["glb", "stl"] # Included in the zip
+
+class BatchItemStatus(BaseModel):
+    index: int
+    status: str # queued, running, done, failed, cancelled
+    prompt: Optional[str] = None
+    overrides: Optional[Dict[str, ParameterValue]] = None
+    error: Optional[str] = None
+    session_id: Optional[int] = None
+    model_id: Optional[int] = None
+    urls: Dict[str, Optional[str]] = {}
+
+class BatchStatus(BaseModel):
+    batch_id: int
+    name: Optional[str] = None
+    kind: str
+    status: str # queued, running, completed, cancelled
+    counts: Dict[str, int] = {} # Items per status
+    download_url: Optional[str] = None # Zip of the outputs, once completed
+    items: List[BatchItemStatus] = []
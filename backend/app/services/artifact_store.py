@@ -0,0 +1,261 @@
+import asyncio
+import gzip
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from ..config import settings
+from ..database import SessionLocal
+from ..models import BatchItem, GeneratedModel
+from ..startup import startup
+from ..telemetry import ARTIFACT_BYTES
+from .locks import ProcessLock
+
+try:
+    import brotli
+except ImportError:  # Optional: without it only .gz variants are written
+    brotli = None
+
+# Formats worth precompressing (3MF is already a zip)
+COMPRESSIBLE = {"glb", "stl"}
+# Precompressed variants, in order of preference: (Content-Encoding, suffix)
+ENCODINGS = [("br", ".br"), ("gzip", ".gz")]
+
+logger = logging.getLogger(__name__)
+
+class ArtifactStore:
+    """
+    Content-addressed store for exported models (GLB/STL/3MF).
+    Files are named <sha256>.<format>, so identical artifacts are written once
+    and a name never changes content: they can be served as immutable with the
+    hash as a strong ETag. Compressible formats get .br/.gz siblings at write time.
+
+    Nothing is deleted on write. collect() counts references from GeneratedModel
+    and BatchItem rows and removes unreferenced files past a grace period. The
+    quota never evicts referenced files (their URLs live on in chat history);
+    it drops their precompressed variants instead, which serving falls back from.
+    """
+    def __init__(self, directory: str, max_bytes: int, grace_seconds: float):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.grace_seconds = grace_seconds
+        self._lock = threading.Lock()
+        self.writes = 0
+        self.deduplicated = 0
+        self.last_gc = None
+        self._gc_lock = ProcessLock("artifact-gc")
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path_for(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def owns(self, path: str) -> bool:
+        return bool(path) and os.path.dirname(os.path.abspath(path)) == os.path.abspath(self.directory)
+
+    def url(self, path: str) -> str:
+        """Public URL of a stored artifact (legacy files under static/ keep their /static URL)."""
+        if not path:
+            return None
+        prefix = "/artifacts" if self.owns(path) else "/static"
+        return f"{prefix}/{os.path.basename(path)}"
+
+    def _write(self, path: str, data: bytes):
+        # Temp file + rename, so readers never see a partial artifact
+        fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _compressed(self, data: bytes) -> dict:
+        variants = {".gz": gzip.compress(data, compresslevel=settings.ARTIFACT_GZIP_LEVEL, mtime=0)}
+        if brotli is not None:
+            variants[".br"] = brotli.compress(data, quality=settings.ARTIFACT_BROTLI_QUALITY)
+        # Only keep variants that actually save bytes
+        return {suffix: blob for suffix, blob in variants.items() if len(blob) < len(data)}
+
+    def put(self, data: bytes, fmt: str) -> str:
+        """Stores one artifact and returns its path; an existing identical file is reused."""
+        ARTIFACT_BYTES.observe(len(data), format=fmt)
+        path = self.path_for(f"{hashlib.sha256(data).hexdigest()}.{fmt}")
+        with self._lock:
+            # Touch so GC treats it as recently used; under the lock, so collect() can't
+            # delete it between this check and its own re-check
+            try:
+                os.utime(path)
+                self.deduplicated += 1
+                return path
+            except FileNotFoundError:
+                pass
+
+        if fmt in COMPRESSIBLE and len(data) >= settings.ARTIFACT_COMPRESS_MIN_BYTES:
+            for suffix, blob in self._compressed(data).items():
+                self._write(path + suffix, blob)
+        # Primary file last: once it exists, its variants do too
+        self._write(path, data)
+        with self._lock:
+            self.writes += 1
+        return path
+
+    def save(self, artifacts: dict) -> dict:
+        """Stores {format: bytes}; returns {format: path}."""
+        return {fmt: self.put(data, fmt) for fmt, data in artifacts.items()}
+
+    async def asave(self, artifacts: dict) -> dict:
+        # Hashing and compression of large meshes would otherwise block the event loop
+        return await asyncio.to_thread(self.save, artifacts)
+
+    def variant(self, path: str, accept_encoding: str):
+        """(path, Content-Encoding) of the best precompressed variant the client accepts, else (path, None)."""
+        accepted = {token.split(";")[0].strip() for token in (accept_encoding or "").split(",")}
+        for encoding, suffix in ENCODINGS:
+            if encoding in accepted and os.path.exists(path + suffix):
+                return path + suffix, encoding
+        return path, None
+
+    def _entries(self, clean: bool = False) -> dict:
+        """Primary files in the store -> (mtime, total bytes including variants)."""
+        entries = {}
+        sizes = Counter()
+        for entry in os.scandir(self.directory):
+            if not entry.is_file():
+                continue
+            name = entry.name
+            st = entry.stat()
+            if name.endswith(".tmp"):
+                if clean and time.time() - st.st_mtime > self.grace_seconds:
+                    # Left over from an interrupted write
+                    self._remove(entry.path)
+                continue
+            base = name[:-3] if name.endswith((".gz", ".br")) else name
+            sizes[base] += st.st_size
+            if base == name:
+                entries[name] = st.st_mtime
+        return {name: (mtime, sizes[name]) for name, mtime in entries.items()}
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _delete(self, name: str):
+        path = self.path_for(name)
+        # Primary first, so a concurrent put() rewrites the whole set
+        self._remove(path)
+        for _, suffix in ENCODINGS:
+            self._remove(path + suffix)
+
+    def _delete_if_stale(self, name: str, now: float) -> bool:
+        """Deletes an artifact unless put() wrote or reused it since it was scanned."""
+        with self._lock:
+            try:
+                if now - os.stat(self.path_for(name)).st_mtime <= self.grace_seconds:
+                    return False
+            except FileNotFoundError:
+                pass
+            self._delete(name)
+        return True
+
+    @staticmethod
+    def reference_counts(db) -> Counter:
+        """Number of GeneratedModel/BatchItem rows referencing each artifact name."""
+        refs = Counter()
+        queries = (
+            (GeneratedModel.file_path, GeneratedModel.preview_path, GeneratedModel.stl_path, GeneratedModel.threemf_path),
+            (BatchItem.glb_path, BatchItem.stl_path, BatchItem.threemf_path),
+        )
+        for columns in queries:
+            for row in db.query(*columns):
+                for path in row:
+                    if path:
+                        refs[os.path.basename(path)] += 1
+        return refs
+
+    def collect(self, db) -> dict:
+        """One GC pass: drop unreferenced artifacts, then enforce the disk quota."""
+        refs = self.reference_counts(db)
+        entries = self._entries(clean=True)
+        now = time.time()
+        removed = 0
+        freed = 0
+
+        # Artifacts whose rows were deleted (or that never got one). The grace period
+        # covers files written just before their GeneratedModel row is committed.
+        for name, (mtime, size) in list(entries.items()):
+            if refs[name] == 0 and now - mtime > self.grace_seconds and self._delete_if_stale(name, time.time()):
+                del entries[name]
+                removed += 1
+                freed += size
+
+        # Over quota: what is left is referenced or within its grace period, so only the
+        # .br/.gz variants of the least recently written files go
+        total = sum(size for _, size in entries.values())
+        for name in sorted(entries, key=lambda n: entries[n][0]):
+            if total <= self.max_bytes:
+                break
+            for _, suffix in ENCODINGS:
+                path = self.path_for(name) + suffix
+                try:
+                    size = os.path.getsize(path)
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                removed += 1
+                freed += size
+        if total > self.max_bytes:
+            logger.warning("Artifact store exceeds its quota with referenced models alone", extra={"bytes": total, "max_bytes": self.max_bytes})
+
+        self.last_gc = {"at": now, "removed": removed, "freed_bytes": freed, "entries": len(entries), "bytes": total}
+        if removed:
+            logger.info("Artifact GC removed %d files", removed, extra={"freed_bytes": freed})
+        return self.last_gc
+
+    def stats(self) -> dict:
+        entries = self._entries()
+        with self._lock:
+            return {
+                "entries": len(entries),
+                "bytes": sum(size for _, size in entries.values()),
+                "max_bytes": self.max_bytes,
+                "writes": self.writes,
+                "deduplicated": self.deduplicated,
+                "last_gc": self.last_gc,
+            }
+
+    def _collect_with_session(self) -> dict:
+        db = SessionLocal()
+        try:
+            return self.collect(db)
+        finally:
+            db.close()
+
+    async def run_gc(self, interval: float):
+        """Background GC loop, started from the app lifespan."""
+        # Reference counting reads the models tables
+        if not await startup.wait_for_database():
+            return
+        while True:
+            try:
+                # One server process collects; the others take over if it exits
+                if self._gc_lock.acquire(blocking=False):
+                    await asyncio.to_thread(self._collect_with_session)
+            except Exception as e:
+                logger.warning("Artifact GC failed: %s", e)
+            await asyncio.sleep(interval)
+
+artifact_store = ArtifactStore(
+    settings.ARTIFACT_DIR,
+    max_bytes=settings.ARTIFACT_MAX_MB * 1024 * 1024,
+    grace_seconds=settings.ARTIFACT_GC_GRACE_SECONDS,
+)
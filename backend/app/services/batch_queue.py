@@ -0,0 +1,269 @@
+import asyncio
+import itertools
+import json
+import logging
+import os
+import tempfile
+import zipfile
+from sqlalchemy import func, select, update
+
+from ..config import settings
+from ..database import AsyncSessionLocal
+from ..models import BatchItem, BatchJob, GeneratedModel
+from ..schemas import GenerateRequest
+from ..startup import startup
+from .artifact_store import artifact_store
+from .errors import CadQueryExecutionError
+from .jobs import build_artifacts
+from .executor import executor
+from .generation_pipeline import run_generation, wait_for_refinement
+from .locks import ProcessLock
+from .parameters import apply_overrides
+
+logger = logging.getLogger(__name__)
+
+# Item states that are final
+FINISHED = ("done", "failed", "cancelled")
+# Item format -> BatchItem column
+PATH_COLUMNS = {"glb": "glb_path", "stl": "stl_path", "3mf": "threemf_path"}
+
+def sweep_grid(parameters: dict) -> list:
+    """Every combination of the swept values, as {name: value} dicts in grid order."""
+    names = list(parameters)
+    return [dict(zip(names, values)) for values in itertools.product(*(parameters[n] for n in names))]
+
+def sweep_items(code: str, parameters: dict) -> list:
+    """(overrides, code) per grid point. Raises ParameterError for unknown names or mistyped values."""
+    return [(overrides, apply_overrides(code, overrides)) for overrides in sweep_grid(parameters)]
+
+def _zip_name(item: BatchItem, fmt: str) -> str:
+    return f"{item.item_index:03d}.{fmt}"
+
+def write_zip(path: str, batch: BatchJob, items: list):
+    """Zip of the batch outputs plus a manifest.json describing every item (including failures)."""
+    formats = batch.formats.split(",")
+    manifest = {"batch_id": batch.id, "name": batch.name, "kind": batch.kind, "items": []}
+    fd, tmp_path = tempfile.mkstemp(suffix=".zip.tmp", dir=os.path.dirname(path))
+    os.close(fd)
+    try:
+        with zipfile.ZipFile(tmp_path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+            for item in items:
+                files = {}
+                for fmt in formats:
+                    source = getattr(item, PATH_COLUMNS[fmt])
+                    if item.status == "done" and source and os.path.exists(source):
+                        files[fmt] = _zip_name(item, fmt)
+                        # 3MF is already a zip
+                        zf.write(source, files[fmt], compress_type=zipfile.ZIP_STORED if fmt == "3mf" else zipfile.ZIP_DEFLATED)
+                manifest["items"].append({
+                    "index": item.item_index,
+                    "status": item.status,
+                    "prompt": item.prompt,
+                    "overrides": json.loads(item.overrides) if item.overrides else None,
+                    "error": item.error,
+                    "session_id": item.session_id,
+                    "files": files,
+                    "code": item.code,
+                })
+            zf.writestr("manifest.json", json.dumps(manifest, indent=2))
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+class BatchScheduler:
+    """
+    Works off queued BatchItems in the background, at most max_parallel at a time,
+    so interactive requests keep executor workers available.
+
+    The queue is the batch_items table: an item is claimed with a conditional
+    UPDATE (queued -> running), so queued work survives a restart, and items
+    that were running when the server stopped are queued again on startup,
+    unless they have been claimed max_attempts times (they may be what stopped it).
+    When a batch has no unfinished items left, its outputs are zipped.
+    With several server processes, the one holding the "batch-queue" lock runs
+    the queue; the others wait to take over if it exits.
+    """
+    def __init__(self, max_parallel: int, poll_seconds: float, max_attempts: int):
+        self.max_parallel = max(1, max_parallel)
+        self.poll_seconds = poll_seconds
+        self.max_attempts = max(1, max_attempts)
+        self._wakeup = None
+        self._tasks = set()
+        self._finishing = None
+        self._leader = ProcessLock("batch-queue")
+
+    def notify(self):
+        """Called after new items were committed."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _recover(self):
+        async with AsyncSessionLocal() as db:
+            given_up = await db.execute(
+                update(BatchItem)
+                .where(BatchItem.status == "running", BatchItem.attempts >= self.max_attempts)
+                .values(status="failed", finished_at=func.now(),
+                        error=f"Interrupted {self.max_attempts} times while running (it may crash the server); not retried")
+            )
+            if given_up.rowcount:
+                logger.warning("Failed %d batch items interrupted %d times", given_up.rowcount, self.max_attempts)
+            await db.execute(update(BatchItem).where(BatchItem.status == "running").values(status="queued"))
+            await db.commit()
+            # Batches that finished while the zip was being written
+            unfinished = (await db.execute(
+                select(BatchJob.id).where(BatchJob.status.in_(("queued", "running")))
+            )).scalars().all()
+        for batch_id in unfinished:
+            await self._finish_if_done(batch_id)
+
+    async def _claim(self):
+        """Marks the next queued item running and returns its id, or None if the queue is empty."""
+        async with AsyncSessionLocal() as db:
+            while True:
+                item = (await db.execute(
+                    select(BatchItem.id, BatchItem.batch_id)
+                    .where(BatchItem.status == "queued")
+                    .order_by(BatchItem.batch_id, BatchItem.item_index)
+                    .limit(1)
+                )).first()
+                if item is None:
+                    return None
+                claimed = await db.execute(
+                    update(BatchItem)
+                    .where(BatchItem.id == item.id, BatchItem.status == "queued")
+                    .values(status="running", started_at=func.now(), attempts=BatchItem.attempts + 1)
+                )
+                await db.execute(
+                    update(BatchJob).where(BatchJob.id == item.batch_id, BatchJob.status == "queued").values(status="running")
+                )
+                await db.commit()
+                if claimed.rowcount:
+                    return item.id
+                # Taken by someone else in the meantime; try the next one
+
+    async def _run_prompt(self, item: BatchItem) -> dict:
+        response = None
+        async with AsyncSessionLocal() as db:
+            async for event in run_generation(GenerateRequest(prompt=item.prompt), db):
+                if event["event"] == "done":
+                    response = event["response"]
+        result = {"code": response["code"], "session_id": response["session_id"]}
+        if response["error"]:
+            return {**result, "status": "failed", "error": response["error"]}
+
+        # The full-resolution GLB/STL/3MF are built by the generation's fine-LOD job
+        await wait_for_refinement(response["model_id"])
+        async with AsyncSessionLocal() as db:
+            model = await db.get(GeneratedModel, response["model_id"])
+        if model.lod_status != "ready":
+            return {**result, "status": "failed", "error": "Export of the final model failed", "model_id": model.id}
+        return {
+            **result, "status": "done", "model_id": model.id,
+            "glb_path": model.file_path, "stl_path": model.stl_path, "threemf_path": model.threemf_path,
+        }
+
+    async def _run_sweep(self, item: BatchItem, formats: tuple) -> dict:
+        try:
+            # Only what goes into the zip
+            artifacts = await executor.submit(build_artifacts, item.code, formats=formats, validate=True)
+        except CadQueryExecutionError as e:
+            return {"status": "failed", "error": str(e)}
+        paths = await artifact_store.asave(artifacts)
+        return {"status": "done", **{PATH_COLUMNS[fmt]: paths[fmt] for fmt in formats}}
+
+    async def _process(self, item_id: int):
+        async with AsyncSessionLocal() as db:
+            item = await db.get(BatchItem, item_id)
+            batch = await db.get(BatchJob, item.batch_id)
+        try:
+            if item.prompt is not None:
+                result = await self._run_prompt(item)
+            else:
+                result = await self._run_sweep(item, tuple(batch.formats.split(",")))
+        except asyncio.CancelledError:
+            # Server shutting down: leave it running; it is queued again on the next start
+            raise
+        except Exception as e:
+            logger.warning("Batch item %s failed: %s", item_id, e)
+            result = {"status": "failed", "error": f"System Error: {e}"}
+
+        async with AsyncSessionLocal() as db:
+            # Unless the batch was cancelled meanwhile
+            await db.execute(
+                update(BatchItem)
+                .where(BatchItem.id == item_id, BatchItem.status == "running")
+                .values(**result, finished_at=func.now())
+            )
+            await db.commit()
+        await self._finish_if_done(item.batch_id)
+
+    async def _finish_if_done(self, batch_id: int):
+        async with self._finishing, AsyncSessionLocal() as db:
+            batch = await db.get(BatchJob, batch_id)
+            items = (await db.execute(
+                select(BatchItem).where(BatchItem.batch_id == batch_id).order_by(BatchItem.item_index)
+            )).scalars().all()
+            if batch is None or batch.status in ("completed", "cancelled") or any(i.status not in FINISHED for i in items):
+                return
+            os.makedirs(settings.BATCH_DIR, exist_ok=True)
+            path = os.path.join(settings.BATCH_DIR, f"batch_{batch_id}.zip")
+            await asyncio.to_thread(write_zip, path, batch, items)
+            batch.zip_path = path
+            batch.status = "completed"
+            batch.finished_at = func.now()
+            await db.commit()
+        logger.info("Batch %s completed", batch_id, extra={"items": len(items)})
+
+    async def cancel(self, db, batch: BatchJob):
+        """Cancels the batch's queued items; items already running finish but are recorded as cancelled."""
+        await db.execute(
+            update(BatchItem)
+            .where(BatchItem.batch_id == batch.id, BatchItem.status.in_(("queued", "running")))
+            .values(status="cancelled", finished_at=func.now())
+        )
+        batch.status = "cancelled"
+        batch.finished_at = func.now()
+        await db.commit()
+
+    async def run(self):
+        """Scheduler loop, started from the app lifespan."""
+        self._wakeup = asyncio.Event()
+        self._finishing = asyncio.Lock()
+        slots = asyncio.Semaphore(self.max_parallel)
+        if not await startup.wait_for_database():
+            return
+        while not self._leader.acquire(blocking=False):
+            await asyncio.sleep(self.poll_seconds)
+        try:
+            # Items still "running" belonged to a previous leader
+            await self._recover()
+            while True:
+                await slots.acquire()
+                try:
+                    item_id = await self._claim()
+                except Exception as e:
+                    logger.warning("Batch scheduler could not claim an item: %s", e)
+                    item_id = None
+                if item_id is None:
+                    slots.release()
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_seconds)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                task = asyncio.create_task(self._process(item_id))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+                task.add_done_callback(lambda _: slots.release())
+        finally:
+            for task in list(self._tasks):
+                task.cancel()
+            self._leader.release()
+
+batch_scheduler = BatchScheduler(
+    max_parallel=settings.BATCH_MAX_PARALLEL,
+    poll_seconds=settings.BATCH_POLL_SECONDS,
+    max_attempts=settings.BATCH_MAX_ATTEMPTS,
+)
@@ -1,7 +1,22 @@
 import cadquery as cq
 import tempfile
 import os
-import io
+import ast
+import hashlib
+import itertools
+import logging
+import pickle
+import threading
+import time
+import types
+from collections import OrderedDict
+
+from ..config import settings
+from ..telemetry import CHECKPOINT_STATEMENTS, CHECKPOINTS, GEOMETRY_CACHE, STAGE_SECONDS
+from .errors import CadQueryExecutionError
+from .export_service import _assembly_parts, export_artifacts
+
+logger = logging.getLogger(__name__)
 
 # Safe execution dictionary
 SAFE_LOCALS = {}
@@ -34,29 +49,376 @@ SAFE_GLOBALS["math"] = math
 import sys
 import traceback
 
-class CadQueryExecutionError(Exception):
-    def __init__(self, message, line_number=None):
-        super().__init__(message)
-        self.line_number = line_number
 
-def execute_cadquery(code_str: str):
+def _runtime_version() -> str:
+    """Version string of the geometry kernel stack, so cached BREPs never outlive an upgrade."""
+    try:
+        import OCP
+        ocp_version = getattr(OCP, "__version__", "unknown")
+    except ImportError:
+        ocp_version = "unknown"
+    return f"cadquery={cq.__version__};ocp={ocp_version}"
+
+def normalize_code(code_str: str) -> str:
     """
-    Executes the CadQuery code and returns the GLB bytes and the result object.
+    Canonical form of a script: the AST dump ignores comments, blank lines and
+    formatting, so trivially reformatted scripts map to the same key.
+    """
+    try:
+        return ast.dump(ast.parse(code_str), annotate_fields=False, include_attributes=False)
+    except SyntaxError:
+        # Not parseable; fall back to the raw text (execution will fail anyway)
+        return code_str.strip()
+
+def geometry_key(code_str: str) -> str:
+    payload = f"{_runtime_version()}\n{normalize_code(code_str)}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def _to_shape(result):
+    """Collapses a Workplane/Shape result into a single cq.Shape suitable for BREP serialization."""
+    if isinstance(result, cq.Workplane):
+        shapes = [v for v in result.vals() if isinstance(v, cq.Shape)]
+        if not shapes:
+            return None
+        return shapes[0] if len(shapes) == 1 else cq.Compound.makeCompound(shapes)
+    if isinstance(result, cq.Shape):
+        return result
+    return None
+
+def _assembly_entry(assy) -> tuple:
+    """
+    (name, parts) of an assembly, parts being (part name, shapes, color) with locations
+    applied and colors inherited: everything the exporters read, without the Workplanes.
+    """
+    parts = []
+    for name, group in itertools.groupby(_assembly_parts(assy), key=lambda part: part[0]):
+        group = list(group)
+        parts.append((name, [shape for _, shape, _ in group], group[0][2]))
+    return assy.name, parts
+
+def _rebuild_assembly(entry: tuple):
+    """A flat cq.Assembly that exports exactly like the one _assembly_entry() was taken from."""
+    name, parts = entry
+    objects = {part: (cq.Workplane().newObject(shapes), cq.Color(*color) if color else None) for part, shapes, color in parts}
+    obj, color = objects.pop(name, (None, None))
+    assy = cq.Assembly(obj, name=name, color=color)
+    for part, (obj, color) in objects.items():
+        assy.add(obj, name=part, color=color)
+    return assy
+
+class GeometryCache:
+    """
+    Content-addressed cache of built shapes.
+    Keyed by geometry_key(code); entries live as BREP files on disk with the
+    hottest ones also held in an in-memory LRU. Disk usage is bounded by
+    evicting the least recently used files.
+    Subclasses change the file format via suffix/_load()/_dump().
+    """
+    suffix = ".brep"
+    # Entries of every cache in the directory that count against max_bytes together
+    quota_suffixes = (".brep", ".assy")
+    metric = GEOMETRY_CACHE
+
+    def __init__(self, directory: str, memory_entries: int = 32, max_bytes: int = 512 * 1024 * 1024):
+        self.directory = directory
+        self.memory_entries = memory_entries
+        self.max_bytes = max_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}{self.suffix}")
+
+    def _load(self, path: str):
+        return cq.Shape.importBrep(path)
+
+    def _dump(self, value, path: str):
+        value.exportBrep(path)
+
+    def _remember(self, key: str, value):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                self.metric.inc(result="memory_hit")
+                return self._memory[key]
+
+        path = self._path(key)
+        try:
+            value = self._load(path)
+            # Touch so disk eviction treats it as recently used
+            os.utime(path)
+        except Exception:
+            # Missing or unreadable entry; treat as a miss
+            with self._lock:
+                self.misses += 1
+            self.metric.inc(result="miss")
+            return None
+
+        with self._lock:
+            self.disk_hits += 1
+            self._remember(key, value)
+        self.metric.inc(result="disk_hit")
+        return value
+
+    def contains(self, key: str) -> bool:
+        with self._lock:
+            if key in self._memory:
+                return True
+        return os.path.exists(self._path(key))
+
+    def put(self, key: str, value):
+        with self._lock:
+            self._remember(key, value)
+
+        path = self._path(key)
+        # Write to a temp file in the same directory and rename, so readers never see partial entries
+        fd, tmp_path = tempfile.mkstemp(suffix=f"{self.suffix}.tmp", dir=self.directory)
+        os.close(fd)
+        try:
+            self._dump(value, tmp_path)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning("Failed to write cache entry %s%s: %s", key, self.suffix, e)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        self._evict()
+
+    def _files(self, suffixes: tuple = None):
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(suffixes or self.suffix):
+                yield entry
+
+    def _evict(self):
+        entries = []
+        total = 0
+        for entry in self._files(self.quota_suffixes):
+            try:
+                st = entry.stat()
+            except OSError:
+                # Evicted meanwhile by the other cache in this directory
+                continue
+            entries.append((st.st_mtime, st.st_size, entry.path))
+            total += st.st_size
+        if total <= self.max_bytes:
+            return
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            disk_entries = 0
+            disk_bytes = 0
+            for entry in self._files():
+                disk_entries += 1
+                disk_bytes += entry.stat().st_size
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "memory_entries": len(self._memory),
+                "disk_entries": disk_entries,
+                "disk_bytes": disk_bytes,
+            }
+
+class CheckpointStore(GeometryCache):
+    """
+    Execution-scope snapshots keyed by statement-prefix hash (see _run_script).
+    Entries are pickled scopes (CadQuery objects pickle as BREP), kept as bytes
+    in memory too, so every restore is an independent copy.
+    """
+    suffix = ".ckpt"
+    quota_suffixes = (".ckpt",)
+    metric = CHECKPOINTS
+
+    def _load(self, path: str) -> bytes:
+        with open(path, "rb") as f:
+            return f.read()
+
+    def _dump(self, value: bytes, path: str):
+        with open(path, "wb") as f:
+            f.write(value)
+
+class AssemblyCache(GeometryCache):
+    """
+    Assembly results, which a BREP would flatten: entries are _assembly_entry() tuples,
+    pickled (shapes pickle as BREP). Shares the geometry cache directory, keys and disk quota.
+    """
+    suffix = ".assy"
+
+    def _load(self, path: str):
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+    def _dump(self, value, path: str):
+        with open(path, "wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+geometry_cache = GeometryCache(
+    settings.GEOMETRY_CACHE_DIR,
+    memory_entries=settings.GEOMETRY_CACHE_MEMORY_ENTRIES,
+    max_bytes=settings.GEOMETRY_CACHE_MAX_MB * 1024 * 1024,
+)
+
+assembly_cache = AssemblyCache(
+    settings.GEOMETRY_CACHE_DIR,
+    memory_entries=settings.GEOMETRY_CACHE_MEMORY_ENTRIES,
+    max_bytes=settings.GEOMETRY_CACHE_MAX_MB * 1024 * 1024,
+)
+
+checkpoint_store = CheckpointStore(
+    settings.CHECKPOINT_DIR,
+    memory_entries=settings.CHECKPOINT_MEMORY_ENTRIES,
+    max_bytes=settings.CHECKPOINT_MAX_MB * 1024 * 1024,
+)
+
+# Bump when the checkpoint format changes
+CHECKPOINT_VERSION = "1"
+
+# Statements re-executed (instead of pickled) when a checkpoint is restored
+REPLAYED = (ast.Import, ast.ImportFrom, ast.FunctionDef)
+
+def _statement_keys(statements: list) -> list:
+    """keys[i] identifies the prefix statements[:i + 1] (formatting and comments don't matter)."""
+    digest = hashlib.sha256(f"{CHECKPOINT_VERSION};{_runtime_version()}".encode("utf-8"))
+    keys = []
+    for statement in statements:
+        digest.update(ast.dump(statement, annotate_fields=False, include_attributes=False).encode("utf-8"))
+        digest.update(b"\0")
+        keys.append(digest.copy().hexdigest())
+    return keys
+
+def _exec_statement(statement, scope: dict):
+    # Compiled on its own, but with its original line numbers for error reporting
+    exec(compile(ast.Module(body=[statement], type_ignores=[]), "<string>", "exec"), scope)
+
+def _replayable(statement) -> bool:
+    if isinstance(statement, ast.FunctionDef):
+        # Re-running the def must not depend on names bound after it
+        args = statement.args
+        defaults = args.defaults + [d for d in args.kw_defaults if d is not None]
+        return not statement.decorator_list and all(isinstance(d, ast.Constant) for d in defaults)
+    return isinstance(statement, REPLAYED)
+
+def _save_checkpoint(scope: dict, prefix: list, key: str) -> bool:
+    """
+    Pickles the scope after prefix. Functions and modules are restored by replaying
+    their def/import statements; anything else that can't be pickled (lambdas,
+    instances of script classes, ...) means no checkpoint here.
+    """
+    if not all(_replayable(s) for s in prefix if isinstance(s, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef))):
+        return False
+    replayed_names = set()
+    for statement in prefix:
+        if isinstance(statement, ast.FunctionDef):
+            replayed_names.add(statement.name)
+        elif isinstance(statement, (ast.Import, ast.ImportFrom)):
+            replayed_names.update((alias.asname or alias.name).split(".")[0] for alias in statement.names)
+
+    values = {}
+    for name, value in scope.items():
+        if name == "__builtins__" or (name in SAFE_GLOBALS and SAFE_GLOBALS[name] is value):
+            continue
+        if isinstance(value, types.ModuleType):
+            if name not in replayed_names:
+                return False
+            continue
+        if isinstance(value, types.FunctionType) and value.__code__.co_filename == "<string>":
+            # Only functions still bound to the name their def gave them
+            if name not in replayed_names or value.__name__ != name:
+                return False
+            continue
+        values[name] = value
+    try:
+        with STAGE_SECONDS.time(stage="checkpoint_save"):
+            data = pickle.dumps(values, protocol=pickle.HIGHEST_PROTOCOL)
+    except Exception:
+        CHECKPOINTS.inc(result="unpicklable")
+        return False
+    checkpoint_store.put(key, data)
+    CHECKPOINTS.inc(result="saved")
+    return True
+
+def _restore_checkpoint(scope: dict, statements: list, keys: list) -> int:
+    """Loads the longest checkpointed prefix into scope; returns the index of the first statement left to run."""
+    for i in range(len(keys) - 1, -1, -1):
+        if not checkpoint_store.contains(keys[i]):
+            continue
+        data = checkpoint_store.get(keys[i])
+        if data is None:
+            continue
+        try:
+            with STAGE_SECONDS.time(stage="checkpoint_restore"):
+                values = pickle.loads(data)
+                for statement in statements[:i + 1]:
+                    if isinstance(statement, REPLAYED):
+                        _exec_statement(statement, scope)
+                scope.update(values)
+        except Exception as e:
+            logger.warning("Discarding unusable checkpoint %s: %s", keys[i][:12], e)
+            scope.clear()
+            scope.update(SAFE_GLOBALS)
+            continue
+        CHECKPOINT_STATEMENTS.inc(i + 1, result="skipped")
+        logger.debug("Resuming from checkpoint %s after statement %d", keys[i][:12], i + 1)
+        return i + 1
+    return 0
+
+def _run_script(code_str: str):
+    """
+    Executes the script in a fresh scope and returns its `result` object.
+
+    Top-level statements run one at a time. After statements that took at least
+    CHECKPOINT_MIN_MS (since the last checkpoint), the scope is snapshotted under
+    the hash of the statement prefix, so a later script that shares that prefix
+    (a refinement that only changes the last lines) resumes from it.
     """
     # Use a copy of SAFE_GLOBALS as the single execution scope.
     # This ensures that functions defined in the executed code can see variables defined in the execution scope.
     execution_scope = SAFE_GLOBALS.copy()
     
-    print(f"--- [DEBUG] Evaluating CadQuery Code ---\n{code_str}\n--------------------------------------")
+    logger.debug("Evaluating CadQuery code:\n%s", code_str)
 
+    executed = 0.0
     try:
-        exec(code_str, execution_scope)
+        statements = ast.parse(code_str).body
+        keys = _statement_keys(statements) if settings.CHECKPOINTS else []
+        first = _restore_checkpoint(execution_scope, statements, keys) if keys else 0
+        min_seconds = settings.CHECKPOINT_MIN_MS / 1000
+        since_checkpoint = 0.0
+        for i in range(first, len(statements)):
+            started = time.perf_counter()
+            _exec_statement(statements[i], execution_scope)
+            elapsed = time.perf_counter() - started
+            executed += elapsed
+            since_checkpoint += elapsed
+            if keys and since_checkpoint >= min_seconds and not checkpoint_store.contains(keys[i]):
+                if _save_checkpoint(execution_scope, statements[:i + 1], keys[i]):
+                    since_checkpoint = 0.0
+        CHECKPOINT_STATEMENTS.inc(len(statements) - first, result="executed")
     except Exception as e:
-        full_tb = traceback.format_exc()
-        print(f"--- [DEBUG] Error: {full_tb} ---")
+        logger.debug("CadQuery code failed", exc_info=True)
         # Extract line number from traceback
         cl, exc, tb = sys.exc_info()
-        line_number = None
+        line_number = e.lineno if isinstance(e, SyntaxError) else None
         # Walk traceback to find the frame corresponding to <string> (our code)
         for frame in traceback.extract_tb(tb):
             if frame.filename == "<string>":
@@ -64,58 +426,84 @@ def execute_cadquery(code_str: str):
         
         error_msg = f"Execution Error on line {line_number}: {str(e)}" if line_number else f"Execution Error: {str(e)}"
         raise CadQueryExecutionError(error_msg, line_number)
+    finally:
+        STAGE_SECONDS.observe(executed, stage="execute")
     
     if "result" not in execution_scope:
         raise ValueError("The code did not produce a 'result' variable.")
     
-    result = execution_scope["result"]
-    
-    # Export to GLTF (GLB)
-    with tempfile.NamedTemporaryFile(suffix=".glb", delete=False) as tmp:
-        tmp_path = tmp.name
-    
-    try:
-        # Check if Assembly or Workplane
+    return execution_scope["result"]
+
+def build_result(code_str: str, use_cache: bool = True):
+    """
+    Returns the result object for a script, served from the geometry cache when
+    an identical (AST-equivalent) script has been built before.
+    On a cache hit the result is the cached cq.Shape rather than the original Workplane,
+    or a flat cq.Assembly with the original part names, colors and placements.
+    """
+    key = geometry_key(code_str) if use_cache else None
+    if key:
+        if assembly_cache.contains(key):
+            cached = assembly_cache.get(key)
+            cached = _rebuild_assembly(cached) if cached is not None else None
+        else:
+            cached = geometry_cache.get(key)
+        if cached is not None:
+            logger.debug("Geometry cache hit %s", key[:12])
+            return cached
+
+    result = _run_script(code_str)
+
+    if key:
         if isinstance(result, cq.Assembly):
-            result.export(tmp_path, "GLTF")
-        elif isinstance(result, cq.Workplane):
-             # For Workplane, often needs to be converted to assembly for GLTF export 
-             # or use assembly wrapping
-             assembly = cq.Assembly(result)
-             assembly.save(tmp_path, "GLTF")
-        elif isinstance(result, cq.Shape):
-             assembly = cq.Assembly(result)
-             assembly.save(tmp_path, "GLTF")
+            assembly_cache.put(key, _assembly_entry(result))
         else:
-             # Try generic export or fail
-             assembly = cq.Assembly(result)
-             assembly.save(tmp_path, "GLTF")
+            shape = _to_shape(result)
+            if shape is not None:
+                geometry_cache.put(key, shape)
+    return result
 
-        with open(tmp_path, "rb") as f:
-            glb_data = f.read()
-            
-    finally:
-        if os.path.exists(tmp_path):
-            os.remove(tmp_path)
-            
+def execute_cadquery(code_str: str, use_cache: bool = True):
+    """
+    Executes the CadQuery code and returns the GLB bytes and the result object.
+    """
+    result = build_result(code_str, use_cache=use_cache)
+    glb_data = export_artifacts(result, formats=("glb",))["glb"]
     return glb_data, result
 
+def build_artifacts(code_str: str, formats=("glb", "stl", "3mf"), tolerance: float = None, angular_tolerance: float = None) -> dict:
+    """
+    Executor job: builds the script (cached when possible) and exports every
+    requested format from a single tessellation. Returns {format: bytes}.
+    """
+    result = build_result(code_str)
+    return export_artifacts(result, formats=formats, tolerance=tolerance, angular_tolerance=angular_tolerance)
+
+def build_preview(code_str: str) -> dict:
+    """
+    Executor job: coarse-tolerance GLB only, for the fast first response, plus the
+    printability report of that mesh. Returns {"glb": bytes, "printability": dict}.
+    """
+    result = build_result(code_str)
+    return export_artifacts(
+        result,
+        formats=("glb",),
+        tolerance=settings.LOD_PREVIEW_TOLERANCE,
+        angular_tolerance=settings.LOD_PREVIEW_ANGULAR_TOLERANCE,
+        analyze_mesh=True,
+    )
+
+def warmup():
+    """Builds and tessellates a trivial shape so the first real job doesn't pay OCCT initialization."""
+    cq.Workplane("XY").box(1, 1, 1).edges().fillet(0.1).val().tessellate(0.1)
+
 def export_stl(result_obj) -> str:
     """Exports result to STL file and returns path."""
-    with tempfile.NamedTemporaryFile(suffix=".stl", delete=False) as tmp:
-        path = tmp.name
-    
-    # STL export usually works on Workplane or Shapes. 
-    # Logic to extract shape if it's an assembly or just export whatever possible
     try:
-        if isinstance(result_obj, cq.Assembly):
-             # Assembly export to STL is tricky, usually needs component iteration or distinct file
-             # CadQuery 2.x Assembly export to STL might assume single merged solid for stl
-             result_obj.save(path, "STL")
-        else:
-             cq.exporters.export(result_obj, path, "STL")
+        stl_data = export_artifacts(result_obj, formats=("stl",))["stl"]
     except Exception as e:
-        # Fallback or specific error
         raise ValueError(f"STL Export Error: {e}")
-        
-    return path
+
+    with tempfile.NamedTemporaryFile(suffix=".stl", delete=False) as tmp:
+        tmp.write(stl_data)
+        return tmp.name
@@ -0,0 +1,308 @@
+import ast
+import builtins
+import functools
+
+from ..config import settings
+from ..telemetry import VALIDATION_FAILURES
+from .errors import CadQueryExecutionError
+
+# Modules the scripts already get (imports of them are redundant but harmless)
+ALLOWED_MODULES = {"cadquery", "math"}
+
+# Builtins that have no business in a geometry script
+BANNED_BUILTINS = {
+    "__import__", "eval", "exec", "compile", "open", "input", "breakpoint", "exit", "quit", "help",
+    "globals", "locals", "vars", "getattr", "setattr", "delattr", "memoryview",
+}
+
+# Attributes that lead from any object to frames, globals or arbitrary classes
+BANNED_ATTRIBUTES = {
+    "__class__", "__bases__", "__base__", "__mro__", "__subclasses__", "__globals__", "__builtins__",
+    "__code__", "__closure__", "__dict__", "__getattribute__", "__import__", "__loader__", "__spec__",
+    "gi_frame", "f_globals", "f_locals", "f_back", "tb_frame",
+}
+
+# CadQuery calls that repeat their work per element: method -> (position, name) of each count argument
+PATTERN_COUNTS = {"rarray": ((2, "xCount"), (3, "yCount")), "polarArray": ((3, "count"),)}
+
+MAX_REPORTED = 5
+
+@functools.cache
+def safe_globals() -> dict:
+    """The scripts' globals. Imported on first use: validation runs in the executor workers (see jobs.py), never in the server."""
+    from .cadquery_service import SAFE_GLOBALS
+    return SAFE_GLOBALS
+
+@functools.cache
+def known_names() -> frozenset:
+    return frozenset((set(safe_globals()) | set(dir(builtins))) - BANNED_BUILTINS)
+
+class CodeValidationError(CadQueryExecutionError):
+    """Raised before execution; carries the first offending line like execution errors do."""
+
+class _Issue(Exception):
+    def __init__(self, rule: str, line: int, message: str):
+        super().__init__(message)
+        self.rule = rule
+        self.line = line
+
+def _bound_names(tree: ast.AST) -> dict:
+    """Every name the script binds anywhere -> line of its first binding."""
+    bound = {}
+
+    def bind(name, node):
+        line = getattr(node, "lineno", 0)
+        if name not in bound or line < bound[name]:
+            bound[name] = line
+
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and isinstance(node.ctx, (ast.Store, ast.Del)):
+            bind(node.id, node)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            bind(node.name, node)
+        elif isinstance(node, ast.arg):
+            bind(node.arg, node)
+        elif isinstance(node, ast.alias):
+            bind((node.asname or node.name).split(".")[0], node)
+        elif isinstance(node, ast.ExceptHandler) and node.name:
+            bind(node.name, node)
+        elif isinstance(node, (ast.Global, ast.Nonlocal)):
+            for name in node.names:
+                bind(name, node)
+        elif isinstance(node, (ast.MatchAs, ast.MatchStar)) and node.name:
+            bind(node.name, node)
+        elif isinstance(node, ast.MatchMapping) and node.rest:
+            bind(node.rest, node)
+    return bound
+
+def _module_scope(statements):
+    """Nodes executed in module scope (function and class bodies run later / elsewhere)."""
+    stack = list(statements)
+    while stack:
+        node = stack.pop()
+        yield node
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda)):
+            # Defaults and decorators are evaluated at definition time
+            stack.extend(node.args.defaults + [d for d in node.args.kw_defaults if d])
+            stack.extend(getattr(node, "decorator_list", []))
+        elif isinstance(node, ast.ClassDef):
+            stack.extend(node.bases + node.decorator_list)
+        else:
+            stack.extend(ast.iter_child_nodes(node))
+
+class _Validator:
+    def __init__(self, tree: ast.Module):
+        self.tree = tree
+        self.issues = []
+        self.bound = _bound_names(tree)
+        # Names reassigned by the script itself (an `import cadquery as cq` keeps cq checkable)
+        self.reassigned = {
+            node.id for node in ast.walk(tree) if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store)
+        } | {node.arg for node in ast.walk(tree) if isinstance(node, ast.arg)}
+        self.known = set(known_names())
+        for node in ast.walk(tree):
+            if isinstance(node, ast.ImportFrom) and node.module in safe_globals() and any(a.name == "*" for a in node.names):
+                self.known |= {name for name in dir(safe_globals()[node.module]) if not name.startswith("_")}
+        self.constants = self._constants()
+
+    def report(self, rule: str, node, message: str):
+        self.issues.append(_Issue(rule, getattr(node, "lineno", None), message))
+
+    def _constants(self) -> dict:
+        """Top-level numeric names assigned exactly once, for estimating loop counts."""
+        assigned = {}
+        for node in _module_scope(self.tree.body):
+            if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store):
+                assigned[node.id] = assigned.get(node.id, 0) + 1
+        constants = {}
+        for node in self.tree.body:
+            if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+                name = node.targets[0].id
+                if assigned.get(name) == 1:
+                    value = self._evaluate(node.value, constants)
+                    if value is not None:
+                        constants[name] = value
+        return constants
+
+    def _evaluate(self, node, constants=None):
+        """Numeric value of a constant expression, or None if it can't be known statically."""
+        constants = self.constants if constants is None else constants
+        try:
+            if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+                return node.value
+            if isinstance(node, ast.Name):
+                return constants.get(node.id)
+            if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+                value = self._evaluate(node.operand, constants)
+                return None if value is None else (-value if isinstance(node.op, ast.USub) else value)
+            if isinstance(node, ast.BinOp):
+                left, right = self._evaluate(node.left, constants), self._evaluate(node.right, constants)
+                if left is None or right is None:
+                    return None
+                if isinstance(node.op, ast.Add):
+                    return left + right
+                if isinstance(node.op, ast.Sub):
+                    return left - right
+                if isinstance(node.op, ast.Mult):
+                    return left * right
+                if isinstance(node.op, ast.Div):
+                    return left / right
+                if isinstance(node.op, ast.FloorDiv):
+                    return left // right
+                if isinstance(node.op, ast.Pow) and abs(right) <= 64:
+                    return left ** right
+                return None
+            if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in ("int", "round") and len(node.args) == 1:
+                value = self._evaluate(node.args[0], constants)
+                return None if value is None else int(round(value) if node.func.id == "round" else value)
+        except (ArithmeticError, ValueError, TypeError):
+            return None
+        return None
+
+    def _range_count(self, node):
+        """Iteration count of `range(...)` (or a literal sequence), or None if unknown."""
+        if isinstance(node, (ast.List, ast.Tuple, ast.Set)):
+            return len(node.elts)
+        if not (isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == "range"):
+            return None
+        args = [self._evaluate(a) for a in node.args]
+        if not args or None in args:
+            return None
+        start, stop, step = (0, args[0], 1) if len(args) == 1 else (args[0], args[1], args[2] if len(args) > 2 else 1)
+        if not step:
+            return None
+        return max(0, -(-(stop - start) // step))
+
+    # Checks
+
+    def check_imports(self):
+        for node in ast.walk(self.tree):
+            if isinstance(node, ast.Import):
+                modules = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom):
+                modules = [node.module or ""]
+            else:
+                continue
+            for module in modules:
+                if module.split(".")[0] not in ALLOWED_MODULES:
+                    self.report("import", node, f"Import of '{module}' is not allowed; only {', '.join(sorted(ALLOWED_MODULES))} are available (`cq` and `math` are pre-imported).")
+
+    def check_names(self):
+        module_level = set()
+        for index, statement in enumerate(self.tree.body):
+            for node in _module_scope([statement]):
+                if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load):
+                    module_level.add(id(node))
+                    self._check_name(node, index)
+        # Names inside function/class bodies: only flag what is never bound anywhere
+        for node in ast.walk(self.tree):
+            if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load) and id(node) not in module_level:
+                self._check_name(node, None)
+
+        for node in ast.walk(self.tree):
+            if isinstance(node, ast.Attribute) and node.attr in BANNED_ATTRIBUTES:
+                self.report("attribute", node, f"Access to '{node.attr}' is not allowed.")
+            elif isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name) and node.value.id in ("cq", "cadquery", "math") \
+                    and node.value.id not in self.reassigned and not hasattr(safe_globals()[node.value.id], node.attr):
+                self.report("attribute", node, f"'{node.value.id}' has no attribute '{node.attr}'.")
+
+    def _check_name(self, node: ast.Name, statement_index):
+        name = node.id
+        if name in self.bound:
+            if statement_index is None:
+                return
+            # Module scope runs top to bottom: a name first bound by a later statement is not defined yet
+            first_binding = self.bound[name]
+            if first_binding > self.tree.body[statement_index].end_lineno and name not in self.known:
+                self.report("undefined", node, f"Name '{name}' is used before it is defined (first assigned on line {first_binding}).")
+            return
+        if name in BANNED_BUILTINS:
+            self.report("builtin", node, f"'{name}' is not allowed in CadQuery scripts.")
+        elif name not in self.known:
+            self.report("undefined", node, f"Name '{name}' is not defined.")
+
+    def check_result(self):
+        binds_result = any(
+            isinstance(node, ast.Name) and node.id == "result" and isinstance(node.ctx, ast.Store)
+            for node in _module_scope(self.tree.body)
+        ) or any(isinstance(node, ast.Global) and "result" in node.names for node in ast.walk(self.tree))
+        if not binds_result:
+            self.issues.append(_Issue("result", None, "The code does not assign a 'result' variable."))
+
+    def _count(self, node):
+        """How many times the children of node run per execution of node (None: once / unknown)."""
+        if isinstance(node, (ast.For, ast.AsyncFor)):
+            return self._range_count(node.iter)
+        if isinstance(node, (ast.ListComp, ast.SetComp, ast.GeneratorExp, ast.DictComp)):
+            counts = [self._range_count(g.iter) for g in node.generators]
+            if None in counts:
+                return None
+            total = 1
+            for c in counts:
+                total *= c
+            return total
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr in PATTERN_COUNTS:
+            keywords = {k.arg: k.value for k in node.keywords if k.arg}
+            counts = []
+            for position, name in PATTERN_COUNTS[node.func.attr]:
+                argument = node.args[position] if position < len(node.args) else keywords.get(name)
+                counts.append(None if argument is None else self._evaluate(argument))
+            if None in counts:
+                return None
+            total = 1
+            for c in counts:
+                total *= max(0, c)
+            return total
+        return None
+
+    def check_loops(self):
+        limit = settings.CODE_MAX_ITERATIONS
+
+        def visit(node, multiplier):
+            if isinstance(node, ast.While):
+                test = node.test.value if isinstance(node.test, ast.Constant) else self._evaluate(node.test)
+                if test and not any(isinstance(n, (ast.Break, ast.Return, ast.Raise)) for n in ast.walk(node)):
+                    self.report("loop", node, "This while loop never terminates.")
+                    return
+
+            count = self._count(node)
+            if count is not None:
+                if multiplier * count > limit:
+                    self.report("loop", node, f"About {int(multiplier * count)} iterations/instances (limit {limit}); reduce the counts.")
+                    return
+            for child in ast.iter_child_nodes(node):
+                # The iterable (or a pattern call's receiver) is evaluated once, not per iteration
+                once = child is getattr(node, "iter", None) or child is getattr(node, "func", None)
+                visit(child, multiplier if count is None or once else multiplier * count)
+
+        visit(self.tree, 1)
+
+def validate_code(code: str):
+    """
+    Static checks run before a script is executed: syntax, imports, undefined or
+    banned names, a missing `result`, and loops/patterns too large to build.
+    Raises CodeValidationError (a CadQueryExecutionError) listing the problems,
+    with the first offending line as line_number.
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError as e:
+        VALIDATION_FAILURES.inc(rule="syntax")
+        raise CodeValidationError(f"Syntax Error on line {e.lineno}: {e.msg}", e.lineno)
+
+    validator = _Validator(tree)
+    validator.check_imports()
+    validator.check_names()
+    validator.check_result()
+    validator.check_loops()
+    if not validator.issues:
+        return
+
+    issues = sorted(validator.issues, key=lambda i: (i.line is None, i.line or 0))
+    VALIDATION_FAILURES.inc(rule=issues[0].rule)
+    first = issues[0]
+    parts = [str(first)] + [f"Line {i.line}: {i}" if i.line else str(i) for i in issues[1:MAX_REPORTED]]
+    if len(issues) > MAX_REPORTED:
+        parts.append(f"({len(issues) - MAX_REPORTED} more problems.)")
+    header = f"Validation Error on line {first.line}" if first.line else "Validation Error"
+    raise CodeValidationError(f"{header}: " + " ".join(parts), first.line)
@@ -0,0 +1,8 @@
+class CadQueryExecutionError(Exception):
+    def __init__(self, message, line_number=None):
+        super().__init__(message)
+        self.line_number = line_number
+
+    def __reduce__(self):
+        # Keep line_number when the error crosses the executor process boundary
+        return (self.__class__, (str(self), self.line_number))
@@ -0,0 +1,353 @@
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import os
+import threading
+import time
+
+from ..config import settings
+from ..telemetry import EXECUTOR_SECONDS, configure_logging, profile_path, profiled, registry
+from .errors import CadQueryExecutionError
+
+logger = logging.getLogger(__name__)
+
+# Distinguishes the profiles of several jobs within one profiled request
+_profile_sequence = itertools.count(1)
+
+class ExecutionTimeoutError(CadQueryExecutionError):
+    pass
+
+class WorkerCrashedError(CadQueryExecutionError):
+    pass
+
+class ExecutionCancelledError(Exception):
+    pass
+
+class ExecutorUnavailableError(Exception):
+    """No worker to run the job: the pool failed to start, or none became free in time. Not the code's fault."""
+    pass
+
+def _limit_address_space(limit: int):
+    """
+    Hard memory cap for jobs: RLIMIT_AS at the warm worker's address space plus limit.
+    The mapped libraries count against RLIMIT_AS but are mostly not resident, so the
+    cap starts from what warmup already mapped. Allocations beyond it fail with MemoryError.
+    """
+    try:
+        import resource
+        with open("/proc/self/statm") as f:
+            mapped = int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    except (ImportError, OSError, ValueError, IndexError):
+        # No resource module or /proc (Windows, macOS): the RSS poll in _call is the only limit
+        return
+    resource.setrlimit(resource.RLIMIT_AS, (mapped + limit, mapped + limit))
+
+def _worker_main(conn, memory_limit: int = None):
+    """
+    Entry point of a pool worker.
+    Imports cadquery/OCP once, builds a warmup shape, caps its address space, then serves
+    jobs from the pipe until told to stop. Metrics recorded by a job are sent back with its result.
+    """
+    configure_logging()
+    registry.forwarding = True
+    from . import cadquery_service
+    try:
+        cadquery_service.warmup()
+    except Exception as e:
+        logger.warning("Executor worker warmup failed: %s", e)
+    if memory_limit:
+        _limit_address_space(memory_limit)
+    registry.drain()
+    conn.send(("ready", os.getpid(), []))
+
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            break
+        if message is None:
+            break
+
+        func, args, kwargs = message
+        try:
+            result = func(*args, **kwargs)
+        except MemoryError:
+            # Reported as a crash, so the pool replaces this worker
+            limit = f" of {memory_limit // (1024 * 1024)} MB" if memory_limit else ""
+            conn.send(("error", WorkerCrashedError(f"Execution exceeded the memory limit{limit}"), registry.drain()))
+            continue
+        except Exception as e:
+            try:
+                conn.send(("error", e, registry.drain()))
+            except Exception:
+                # The exception itself could not be pickled; send a plain description instead
+                conn.send(("error", CadQueryExecutionError(f"{type(e).__name__}: {e}"), []))
+            continue
+        conn.send(("ok", result, registry.drain()))
+
+class _Worker:
+    def __init__(self, ctx, memory_limit: int = None):
+        parent_conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn, memory_limit), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.conn = parent_conn
+        self.ready = False
+        self.jobs = 0
+
+    def rss_bytes(self):
+        """Resident memory of the worker, or None where /proc is unavailable."""
+        try:
+            with open(f"/proc/{self.process.pid}/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, IndexError):
+            return None
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout=1)
+        self.kill()
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join(timeout=1)
+        self.conn.close()
+
+class ExecutorPool:
+    """
+    Pool of pre-warmed worker processes that run CadQuery jobs off the event loop.
+    Each job gets a wall-clock and memory limit (a hard RLIMIT_AS cap in the worker,
+    plus a resident-memory poll); workers that crash, hang, exceed their limits or
+    serve too many jobs are killed and replaced in the background.
+    """
+    def __init__(self, size: int, timeout: float, memory_limit_mb: int, max_jobs_per_worker: int, queue_timeout: float = None):
+        self.size = max(1, size)
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        self.startup_error = None
+        self.memory_limit = memory_limit_mb * 1024 * 1024 if memory_limit_mb else None
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self._ctx = None
+        self._idle = None
+        self._workers = set()
+
+    def _context(self):
+        if self._ctx is None:
+            if "forkserver" in multiprocessing.get_all_start_methods():
+                # Workers fork from a server that has already imported cadquery,
+                # so replacing a crashed worker is cheap.
+                self._ctx = multiprocessing.get_context("forkserver")
+                self._ctx.set_forkserver_preload(["app.services.cadquery_service"])
+            else:
+                self._ctx = multiprocessing.get_context("spawn")
+        return self._ctx
+
+    def start(self):
+        if self._idle is not None:
+            return
+        self._idle = asyncio.Queue()
+        for _ in range(self.size):
+            self._idle.put_nowait(self._spawn())
+        logger.info("Executor pool started", extra={"workers": self.size})
+
+    async def astart(self):
+        """
+        start() without blocking the event loop: workers are spawned in threads and
+        only handed out once warm. Jobs submitted meanwhile wait for the first ready one.
+        """
+        if self._idle is not None:
+            return
+        self._idle = asyncio.Queue()
+        try:
+            self._context()
+            ready = await asyncio.gather(*(self._start_worker() for _ in range(self.size)))
+            if not any(ready):
+                raise RuntimeError("No executor worker became ready")
+        except Exception as e:
+            self._fail(str(e))
+            raise
+        logger.info("Executor pool ready", extra={"workers": sum(ready)})
+
+    async def _start_worker(self) -> bool:
+        try:
+            worker = await asyncio.to_thread(self._spawn)
+        except Exception as e:
+            logger.error("Could not start an executor worker: %s", e)
+            return False
+        await asyncio.to_thread(self._wait_ready, worker)
+        if not worker.ready:
+            self._workers.discard(worker)
+            worker.kill()
+            return False
+        if self._idle is not None:
+            self._idle.put_nowait(worker)
+        return True
+
+    def _fail(self, error: str):
+        """Startup failed: jobs fail at once from now on, including those already waiting for a worker."""
+        self.startup_error = error
+        if self._idle is not None:
+            # Passed on by every waiter that receives it (see _acquire)
+            self._idle.put_nowait(None)
+
+    @staticmethod
+    def _wait_ready(worker: _Worker):
+        """Blocks until the worker has imported CadQuery and built its warmup shape (or died)."""
+        try:
+            if worker.conn.poll(None):
+                kind, _, _ = worker.conn.recv()
+                worker.ready = kind == "ready"
+        except (EOFError, OSError):
+            pass
+
+    def stop(self):
+        for worker in list(self._workers):
+            worker.stop()
+        self._workers.clear()
+        self._idle = None
+        self.startup_error = None
+
+    def _spawn(self) -> _Worker:
+        worker = _Worker(self._context(), self.memory_limit)
+        self._workers.add(worker)
+        return worker
+
+    def _respawn(self, worker: _Worker) -> _Worker:
+        worker.kill()
+        return self._spawn()
+
+    def _replace(self, worker: _Worker):
+        """Kills the worker and queues a fresh one; forking and joining run in a thread, off the event loop."""
+        self._workers.discard(worker)
+        idle = self._idle
+        replacement = asyncio.get_running_loop().run_in_executor(None, self._respawn, worker)
+
+        def replaced(future):
+            if future.exception() is not None:
+                logger.error("Could not replace an executor worker: %s", future.exception())
+            elif idle is not None and idle is self._idle:
+                idle.put_nowait(future.result())
+            else:
+                # The pool was stopped meanwhile
+                self._workers.discard(future.result())
+                future.result().kill()
+
+        replacement.add_done_callback(replaced)
+
+    def _call(self, worker: _Worker, payload, timeout, cancelled: threading.Event):
+        """Blocking half of submit(); runs in a thread and watches the worker while the job runs."""
+        try:
+            worker.conn.send(payload)
+        except (OSError, ValueError):
+            raise WorkerCrashedError("Execution worker is not available")
+
+        started = time.monotonic()
+        while True:
+            try:
+                if worker.conn.poll(0.05):
+                    kind, value, metrics = worker.conn.recv()
+                    if kind == "ready":
+                        worker.ready = True
+                        # Warmup time does not count against the job
+                        started = time.monotonic()
+                        continue
+                    registry.replay(metrics)
+                    return kind, value
+            except (EOFError, OSError):
+                raise WorkerCrashedError("Execution worker crashed while running the code")
+
+            if cancelled.is_set():
+                raise ExecutionCancelledError()
+            if not worker.process.is_alive():
+                raise WorkerCrashedError(f"Execution worker crashed while running the code (exit code {worker.process.exitcode})")
+            if timeout and time.monotonic() - started > timeout:
+                raise ExecutionTimeoutError(f"Execution timed out after {timeout:.0f}s. Simplify the geometry or reduce feature counts.")
+            if self.memory_limit:
+                rss = worker.rss_bytes()
+                if rss is not None and rss > self.memory_limit:
+                    raise WorkerCrashedError(f"Execution exceeded the memory limit of {self.memory_limit // (1024 * 1024)} MB")
+
+    async def _acquire(self) -> _Worker:
+        """Next idle worker, waiting at most queue_timeout."""
+        if self.startup_error:
+            raise ExecutorUnavailableError(f"Execution engine is unavailable: {self.startup_error}")
+        try:
+            worker = await asyncio.wait_for(self._idle.get(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise ExecutorUnavailableError(f"No execution worker became free within {self.queue_timeout:.0f}s")
+        if worker is None:
+            self._idle.put_nowait(None)
+            raise ExecutorUnavailableError(f"Execution engine is unavailable: {self.startup_error}")
+        return worker
+
+    async def submit(self, func, *args, timeout: float = None, **kwargs):
+        """
+        Runs func(*args, **kwargs) in a worker process and returns its result.
+        func must be a module-level (picklable) function. Exceptions raised by the job are re-raised here;
+        ExecutorUnavailableError if there is no worker to run it.
+        """
+        self.start()
+        job = func.__name__
+        profile_base = profile_path()
+        if profile_base:
+            # Profiled request: the job writes its own cProfile dump next to the request's
+            args = (f"{profile_base}.{job}-{next(_profile_sequence)}", func, *args)
+            func = profiled
+
+        worker = await self._acquire()
+        with EXECUTOR_SECONDS.time(job=job, outcome="error") as labels:
+            cancelled = threading.Event()
+            healthy = False
+            try:
+                kind, value = await asyncio.to_thread(
+                    self._call, worker, (func, args, kwargs), timeout or self.timeout, cancelled
+                )
+                # A job that ran out of memory leaves the worker in an unknown state
+                healthy = not isinstance(value, WorkerCrashedError)
+                labels["outcome"] = kind if healthy else "crashed"
+            except asyncio.CancelledError:
+                # Client went away; the worker is still busy, so it gets recycled below
+                cancelled.set()
+                labels["outcome"] = "cancelled"
+                raise
+            except ExecutionTimeoutError:
+                labels["outcome"] = "timeout"
+                raise
+            except WorkerCrashedError:
+                labels["outcome"] = "crashed"
+                raise
+            finally:
+                if healthy:
+                    worker.jobs += 1
+                    if self.max_jobs_per_worker and worker.jobs >= self.max_jobs_per_worker:
+                        healthy = False
+                if not healthy:
+                    self._replace(worker)
+                elif self._idle is not None:
+                    self._idle.put_nowait(worker)
+
+        if kind == "error":
+            raise value
+        return value
+
+    def stats(self) -> dict:
+        rss = [r for r in (w.rss_bytes() for w in list(self._workers)) if r is not None]
+        return {
+            "size": self.size,
+            "idle": self._idle.qsize() if self._idle is not None and not self.startup_error else 0,
+            "ready": sum(1 for w in self._workers if w.ready),
+            "max_rss_mb": round(max(rss) / (1024 * 1024), 1) if rss else None,
+        }
+
+executor = ExecutorPool(
+    size=settings.EXEC_WORKERS,
+    timeout=settings.EXEC_TIMEOUT_SECONDS,
+    memory_limit_mb=settings.EXEC_MEMORY_LIMIT_MB,
+    max_jobs_per_worker=settings.EXEC_MAX_JOBS_PER_WORKER,
+    queue_timeout=settings.EXEC_QUEUE_TIMEOUT_SECONDS,
+)
@@ -0,0 +1,302 @@
+import io
+import json
+import struct
+import zipfile
+
+import numpy as np
+import cadquery as cq
+from OCP.BRepTools import BRepTools
+
+from ..config import settings
+from ..telemetry import STAGE_SECONDS
+from .mesh_processing import drop_degenerate, printability, weld
+
+DEFAULT_COLOR = (0.8, 0.8, 0.8, 1.0)
+
+class Mesh:
+    """Triangle mesh of a single part: float32 (N, 3) vertices in mm, uint32 (M, 3) triangles."""
+    def __init__(self, name: str, vertices, triangles, color=None):
+        self.name = name
+        self.vertices = np.asarray(vertices, dtype=np.float32).reshape(-1, 3)
+        self.triangles = np.asarray(triangles, dtype=np.uint32).reshape(-1, 3)
+        self.color = color or DEFAULT_COLOR
+
+    def cleaned(self, tolerance: float) -> "Mesh":
+        """
+        Without degenerate (zero-area or collapsed) triangles. Vertices on B-rep edges
+        stay split per face, which keeps the GLB shading sharp there.
+        """
+        vertices, triangles = drop_degenerate(self.vertices, self.triangles, min_area=0.5 * tolerance ** 2)
+        return Mesh(self.name, vertices, triangles, self.color)
+
+    def welded(self, tolerance: float) -> "Mesh":
+        """One vertex per position: the closed surface 3MF and the printability checks expect."""
+        vertices, triangles = weld(self.vertices, self.triangles, tolerance)
+        vertices, triangles = drop_degenerate(vertices, triangles, min_area=0.5 * tolerance ** 2)
+        return Mesh(self.name, vertices, triangles, self.color)
+
+    def face_normals(self, normalize: bool = True):
+        v = self.vertices[self.triangles]
+        n = np.cross(v[:, 1] - v[:, 0], v[:, 2] - v[:, 0])
+        if normalize:
+            length = np.linalg.norm(n, axis=1, keepdims=True)
+            n = np.divide(n, length, out=np.zeros_like(n), where=length > 0)
+        return n
+
+    def vertex_normals(self):
+        # Area-weighted average of adjacent face normals. OCCT tessellates each
+        # B-rep face separately, so shading stays sharp across model edges.
+        normals = np.zeros_like(self.vertices)
+        face_n = self.face_normals(normalize=False)
+        for corner in range(3):
+            np.add.at(normals, self.triangles[:, corner], face_n)
+        length = np.linalg.norm(normals, axis=1, keepdims=True)
+        return np.divide(normals, length, out=np.zeros_like(normals), where=length > 0)
+
+def _shapes_of(obj):
+    if isinstance(obj, cq.Workplane):
+        return [v for v in obj.vals() if isinstance(v, cq.Shape)]
+    if isinstance(obj, cq.Shape):
+        return [obj]
+    return []
+
+def _assembly_parts(assy, parent_loc=None, parent_color=None):
+    """Yields (name, shape, color) for every part of an assembly, with locations applied."""
+    loc = parent_loc * assy.loc if parent_loc is not None else assy.loc
+    color = assy.color.toTuple() if assy.color is not None else parent_color
+    for shape in _shapes_of(assy.obj):
+        yield assy.name, shape.moved(loc), color
+    for child in assy.children:
+        yield from _assembly_parts(child, loc, color)
+
+def _parts(result):
+    if isinstance(result, cq.Assembly):
+        return list(_assembly_parts(result))
+    shapes = _shapes_of(result)
+    if not shapes:
+        raise ValueError(f"Cannot export result of type {type(result).__name__}")
+    shape = shapes[0] if len(shapes) == 1 else cq.Compound.makeCompound(shapes)
+    return [("result", shape, None)]
+
+def tessellate(result, tolerance: float = None, angular_tolerance: float = None) -> list:
+    """Tessellates every part of the result exactly once."""
+    tolerance = tolerance or settings.MESH_TOLERANCE
+    angular_tolerance = angular_tolerance or settings.MESH_ANGULAR_TOLERANCE
+    meshes = []
+    for name, shape, color in _parts(result):
+        # Drop triangulation left by an earlier (e.g. coarser LOD) pass; otherwise
+        # OCCT keeps it as long as the linear deflection check passes.
+        BRepTools.Clean_s(shape.wrapped)
+        vertices, triangles = shape.tessellate(tolerance, angular_tolerance)
+        if not triangles:
+            continue
+        meshes.append(Mesh(name, [v.toTuple() for v in vertices], triangles, color))
+    return meshes
+
+def _quantize_positions(vertices):
+    """
+    KHR_mesh_quantization: uint16 positions on a uniform grid over the bounding box.
+    Returns (padded (N, 4) uint16 array, translation, scale) for the mesh node that dequantizes them.
+    A uniform scale keeps normals valid without re-deriving them in quantized space.
+    """
+    low = vertices.min(axis=0)
+    step = max(float((vertices.max(axis=0) - low).max()) / 65535.0, 1e-9)
+    quantized = np.zeros((len(vertices), 4), dtype=np.uint16)
+    quantized[:, :3] = np.clip(np.rint((vertices - low) / step), 0, 65535)
+    return quantized, low.tolist(), [step, step, step]
+
+def _quantize_normals(normals):
+    """Normalized int8 normals, padded to 4 bytes per vertex as the extension requires."""
+    quantized = np.zeros((len(normals), 4), dtype=np.int8)
+    quantized[:, :3] = np.clip(np.rint(normals * 127.0), -127, 127)
+    return quantized
+
+def to_glb(meshes: list, quantize: bool = None) -> bytes:
+    """
+    Binary glTF 2.0 with one node per part. A root node converts CadQuery's Z-up millimetres to glTF's Y-up metres.
+    With quantize (default GLB_QUANTIZE) vertex data uses KHR_mesh_quantization (uint16 positions,
+    int8 normals, uint16 indices where possible), roughly halving the file size.
+    """
+    if quantize is None:
+        quantize = settings.GLB_QUANTIZE
+    gltf = {
+        "asset": {"version": "2.0", "generator": "cadquery-genai"},
+        "scene": 0,
+        "scenes": [{"nodes": [0]}],
+        # Rotate -90 degrees about X (Z-up -> Y-up) and scale mm -> m
+        "nodes": [{"name": "root", "rotation": [-0.70710678, 0.0, 0.0, 0.70710678], "scale": [0.001, 0.001, 0.001], "children": []}],
+        "meshes": [],
+        "materials": [],
+        "accessors": [],
+        "bufferViews": [],
+    }
+    chunks = []
+    offset = 0
+
+    def add_view(data: bytes, target: int, stride: int = None) -> int:
+        nonlocal offset
+        view = {"buffer": 0, "byteOffset": offset, "byteLength": len(data), "target": target}
+        if stride:
+            view["byteStride"] = stride
+        gltf["bufferViews"].append(view)
+        chunks.append(data)
+        padding = (4 - len(data) % 4) % 4
+        chunks.append(b"\x00" * padding)
+        offset += len(data) + padding
+        return len(gltf["bufferViews"]) - 1
+
+    def add_accessor(view: int, component_type: int, count: int, kind: str, **extra) -> int:
+        gltf["accessors"].append({"bufferView": view, "componentType": component_type, "count": count, "type": kind, **extra})
+        return len(gltf["accessors"]) - 1
+
+    for mesh in meshes:
+        positions = mesh.vertices
+        node = {"name": mesh.name}
+        if quantize:
+            if len(positions) <= 65535:
+                indices = add_accessor(add_view(mesh.triangles.astype(np.uint16).tobytes(), 34963), 5123, mesh.triangles.size, "SCALAR")
+            else:
+                indices = add_accessor(add_view(mesh.triangles.tobytes(), 34963), 5125, mesh.triangles.size, "SCALAR")
+            quantized, node["translation"], node["scale"] = _quantize_positions(positions)
+            position = add_accessor(
+                add_view(quantized.tobytes(), 34962, stride=8), 5123, len(positions), "VEC3",
+                min=quantized[:, :3].min(axis=0).tolist(), max=quantized[:, :3].max(axis=0).tolist()
+            )
+            normal = add_accessor(
+                add_view(_quantize_normals(mesh.vertex_normals()).tobytes(), 34962, stride=4), 5120, len(positions), "VEC3",
+                normalized=True
+            )
+        else:
+            indices = add_accessor(add_view(mesh.triangles.tobytes(), 34963), 5125, mesh.triangles.size, "SCALAR")
+            position = add_accessor(
+                add_view(positions.tobytes(), 34962), 5126, len(positions), "VEC3",
+                min=positions.min(axis=0).tolist(), max=positions.max(axis=0).tolist()
+            )
+            normal = add_accessor(add_view(mesh.vertex_normals().astype(np.float32).tobytes(), 34962), 5126, len(positions), "VEC3")
+
+        gltf["materials"].append({
+            "pbrMetallicRoughness": {"baseColorFactor": list(mesh.color), "metallicFactor": 0.0, "roughnessFactor": 0.6},
+            "alphaMode": "BLEND" if mesh.color[3] < 1.0 else "OPAQUE",
+        })
+        gltf["meshes"].append({
+            "name": mesh.name,
+            "primitives": [{
+                "attributes": {"POSITION": position, "NORMAL": normal},
+                "indices": indices,
+                "material": len(gltf["materials"]) - 1,
+            }],
+        })
+        node["mesh"] = len(gltf["meshes"]) - 1
+        gltf["nodes"].append(node)
+        gltf["nodes"][0]["children"].append(len(gltf["nodes"]) - 1)
+
+    if quantize:
+        gltf["extensionsUsed"] = ["KHR_mesh_quantization"]
+        gltf["extensionsRequired"] = ["KHR_mesh_quantization"]
+
+    binary = b"".join(chunks)
+    gltf["buffers"] = [{"byteLength": len(binary)}]
+
+    json_chunk = json.dumps(gltf, separators=(",", ":")).encode("utf-8")
+    json_chunk += b" " * ((4 - len(json_chunk) % 4) % 4)
+
+    total = 12 + 8 + len(json_chunk) + 8 + len(binary)
+    out = io.BytesIO()
+    out.write(struct.pack("<4sII", b"glTF", 2, total))
+    out.write(struct.pack("<I4s", len(json_chunk), b"JSON"))
+    out.write(json_chunk)
+    out.write(struct.pack("<I4s", len(binary), b"BIN\x00"))
+    out.write(binary)
+    return out.getvalue()
+
+STL_RECORD = np.dtype([("normal", "<f4", (3,)), ("vertices", "<f4", (3, 3)), ("attr", "<u2")])
+
+def to_stl(meshes: list) -> bytes:
+    """Binary STL of all parts merged into one triangle soup."""
+    count = sum(len(m.triangles) for m in meshes)
+    records = np.zeros(count, dtype=STL_RECORD)
+    start = 0
+    for mesh in meshes:
+        end = start + len(mesh.triangles)
+        records["normal"][start:end] = mesh.face_normals()
+        records["vertices"][start:end] = mesh.vertices[mesh.triangles]
+        start = end
+    header = b"cadquery-genai binary STL".ljust(80, b" ")
+    return header + struct.pack("<I", count) + records.tobytes()
+
+THREEMF_CONTENT_TYPES = """<?xml version="1.0" encoding="UTF-8"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="model" ContentType="application/vnd.ms-package.3dmanufacturing-3dmodel+xml"/>
+</Types>"""
+
+THREEMF_RELS = """<?xml version="1.0" encoding="UTF-8"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Target="/3D/3dmodel.model" Id="rel0" Type="http://schemas.microsoft.com/3dmanufacturing/2013/01/3dmodel"/>
+</Relationships>"""
+
+def _hex_color(color) -> str:
+    return "#" + "".join(f"{round(max(0.0, min(1.0, c)) * 255):02X}" for c in color)
+
+def to_3mf(meshes: list) -> bytes:
+    """3MF package (millimetres) with one object and base material per part; vertices are shared so each part is manifold."""
+    meshes = [mesh.welded(settings.MESH_WELD_TOLERANCE) for mesh in meshes]
+    parts = [
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<model unit="millimeter" xml:lang="en-US" xmlns="http://schemas.microsoft.com/3dmanufacturing/core/2015/02">\n'
+        '<resources>\n<basematerials id="1">\n'
+    ]
+    for i, mesh in enumerate(meshes):
+        parts.append(f'<base name="part{i}" displaycolor="{_hex_color(mesh.color)}"/>\n')
+    parts.append("</basematerials>\n")
+
+    for i, mesh in enumerate(meshes):
+        parts.append(f'<object id="{i + 2}" type="model" pid="1" pindex="{i}">\n<mesh>\n<vertices>\n')
+        parts.extend(f'<vertex x="{x:.6g}" y="{y:.6g}" z="{z:.6g}"/>\n' for x, y, z in mesh.vertices.tolist())
+        parts.append("</vertices>\n<triangles>\n")
+        parts.extend(f'<triangle v1="{a}" v2="{b}" v3="{c}"/>\n' for a, b, c in mesh.triangles.tolist())
+        parts.append("</triangles>\n</mesh>\n</object>\n")
+
+    parts.append("</resources>\n<build>\n")
+    parts.extend(f'<item objectid="{i + 2}"/>\n' for i in range(len(meshes)))
+    parts.append("</build>\n</model>\n")
+
+    out = io.BytesIO()
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("[Content_Types].xml", THREEMF_CONTENT_TYPES)
+        zf.writestr("_rels/.rels", THREEMF_RELS)
+        zf.writestr("3D/3dmodel.model", "".join(parts))
+    return out.getvalue()
+
+WRITERS = {
+    "glb": to_glb,
+    "stl": to_stl,
+    "3mf": to_3mf,
+}
+
+def analyze(meshes: list) -> dict:
+    """Printability report (volume, bounding box, watertightness, overhangs) of the exported mesh."""
+    welded = [mesh.welded(settings.MESH_WELD_TOLERANCE) for mesh in meshes]
+    return printability([(m.vertices, m.triangles) for m in welded], overhang_angle=settings.PRINT_OVERHANG_ANGLE)
+
+def export_artifacts(result, formats=("glb", "stl", "3mf"), tolerance: float = None, angular_tolerance: float = None,
+                     analyze_mesh: bool = False) -> dict:
+    """
+    Tessellates the result once and writes every requested format from that single mesh buffer.
+    Returns {format: bytes}; with analyze_mesh also {"printability": analyze()}.
+    """
+    with STAGE_SECONDS.time(stage="tessellate"):
+        meshes = tessellate(result, tolerance=tolerance, angular_tolerance=angular_tolerance)
+    with STAGE_SECONDS.time(stage="mesh_cleanup"):
+        meshes = [mesh.cleaned(settings.MESH_WELD_TOLERANCE) for mesh in meshes]
+        meshes = [mesh for mesh in meshes if len(mesh.triangles)]
+    if not meshes:
+        raise ValueError("The result has no geometry to export.")
+    artifacts = {}
+    if analyze_mesh:
+        with STAGE_SECONDS.time(stage="printability"):
+            artifacts["printability"] = analyze(meshes)
+    for fmt in formats:
+        with STAGE_SECONDS.time(stage=f"export_{fmt}"):
+            artifacts[fmt] = WRITERS[fmt](meshes)
+    return artifacts
@@ -1,6 +1,16 @@
-from google import genai
+import asyncio
+import logging
+import math
+import os
+import random
 import re
+import sys
+import time
 from ..config import settings
+from ..telemetry import LLM_RETRIES, LLM_SECONDS, LLM_TOKENS
+from .llm_cache import cache_key
+
+logger = logging.getLogger(__name__)
 
 SYSTEM_PROMPT = """
 You are a CadQuery expert. Your goal is to generate Python code using the CadQuery library to create 3D models based on user requests.
@@ -12,92 +22,249 @@ Rules:
 5. If the user asks for a modification, the history will be provided. Generate the complete updated code, not just the diff.
 6. Keep the design parametric if possible, using variables at the top.
 7. Most objects will be used on a 3d printer. Avoid sharp overhangs where possible, and optimize for printing without supports where possible.
+8. Only `cadquery` and `math` are available. Do not import other modules or use eval/exec/open.
 """
 
-class GeminiService:
+# HTTP status codes worth retrying with backoff (rate limited / overloaded)
+RETRYABLE_STATUS = {429, 500, 503}
+
+class LLMTimeoutError(Exception):
+    pass
+
+class GeminiBackend:
+    """Gemini via the SDK's async client. The client and request config are built once and reused."""
     def __init__(self):
+        # The SDK takes about a second to import; only this backend needs it
+        from google import genai
+        self.genai = genai
         self.client = None
+        self.config = genai.types.GenerateContentConfig(system_instruction=SYSTEM_PROMPT)
 
     def _get_client(self):
         if not self.client:
             # Re-read key from setting/env to ensure it's picked up after main.py execution
-            # Note: settings might be cached, so we check env var fallback or rely on mutable settings if possible.
-            # But settings is Pydantic. Let's try to read from settings, assuming settings might need refresh or we access os.environ directly if settings is stale.
-            import os
             key = settings.GEMINI_API_KEY or os.environ.get("GEMINI_API_KEY")
             if not key:
                 # Can't init properly without key
                 raise ValueError("Gemini API Key not found. Please provide it via --gemini-key or GEMINI_API_KEY env var.")
-            self.client = genai.Client(api_key=key)
+            self.client = self.genai.Client(api_key=key)
         return self.client
 
-    async def generate_code(self, prompt: str, history: list = None, image_data: str = None) -> str:
-        client = self._get_client()
-        
-        # Note: The new SDK manages chat slightly differently or implies using generate_content with history context
-        # For simplicity in this migration, we'll construct the prompt or use the chat feature if available.
-        # The new SDK has client.chats.create()
-        
-        chat_history = []
-        
+    def _contents(self, prompt: str, history: list = None, image: bytes = None) -> list:
+        contents = []
         if history:
             for entry in history:
                 # Map roles: 'user' -> 'user', 'model' -> 'model'
                 role = "user" if entry['role'] == 'user' else "model"
-                chat_history.append(genai.types.Content(role=role, parts=[genai.types.Part(text=entry['content'])]))
-        
-        if chat_history:
-            print(f"--- [DEBUG] History: {len(chat_history)} messages ---")
-
-        print(f"--- [DEBUG] Prompt sent to Gemini ({settings.GEMINI_MODEL}) ---\n{prompt}\n")
-        
-        chat = client.chats.create(
+                contents.append(self.genai.types.Content(role=role, parts=[self.genai.types.Part(text=entry['content'])]))
+
+        logger.debug("Prompt sent to Gemini (%s, %d history messages):\n%s", settings.GEMINI_MODEL, len(contents), prompt)
+        message_parts = [self.genai.types.Part(text=prompt)]
+
+        if image:
+            # Already downscaled and re-encoded as JPEG by the image store
+            logger.debug("Attaching image context (%d bytes)", len(image))
+            message_parts.append(self.genai.types.Part.from_bytes(data=image, mime_type="image/jpeg"))
+
+        contents.append(self.genai.types.Content(role="user", parts=message_parts))
+        return contents
+
+    @staticmethod
+    def _record_usage(usage):
+        if usage is None:
+            return
+        LLM_TOKENS.inc(usage.prompt_token_count or 0, kind="prompt")
+        LLM_TOKENS.inc(usage.candidates_token_count or 0, kind="completion")
+
+    def _config_for(self, temperature: float = None):
+        if temperature is None:
+            return self.config
+        return self.config.model_copy(update={"temperature": temperature})
+
+    async def generate(self, prompt: str, history: list = None, image: bytes = None, temperature: float = None) -> str:
+        response = await self._get_client().aio.models.generate_content(
+            model=settings.GEMINI_MODEL,
+            contents=self._contents(prompt, history, image),
+            config=self._config_for(temperature),
+        )
+        self._record_usage(response.usage_metadata)
+        return response.text or ""
+
+    async def stream(self, prompt: str, history: list = None, image: bytes = None):
+        stream = await self._get_client().aio.models.generate_content_stream(
             model=settings.GEMINI_MODEL,
-            config=genai.types.GenerateContentConfig(
-                system_instruction=SYSTEM_PROMPT
-            ),
-            history=chat_history
+            contents=self._contents(prompt, history, image),
+            config=self.config,
+        )
+        usage = None
+        try:
+            async for chunk in stream:
+                # Cumulative; the last chunk carries the totals
+                usage = chunk.usage_metadata or usage
+                if chunk.text:
+                    yield chunk.text
+        finally:
+            self._record_usage(usage)
+
+class StubBackend:
+    """
+    Offline stand-in for load testing: answers after LLM_STUB_LATENCY_MS with a
+    box script whose dimensions are the first three numbers in the prompt.
+    """
+    async def generate(self, prompt: str, history: list = None, image: bytes = None, temperature: float = None) -> str:
+        await asyncio.sleep(settings.LLM_STUB_LATENCY_MS / 1000)
+        return self.script_for(prompt)
+
+    async def stream(self, prompt: str, history: list = None, image: bytes = None):
+        code = await self.generate(prompt, history, image)
+        for line in code.splitlines(keepends=True):
+            yield line
+
+    @staticmethod
+    def script_for(prompt: str) -> str:
+        numbers = [float(n) for n in re.findall(r"\d+(?:\.\d+)?", prompt)] + [20.0, 20.0, 10.0]
+        length, width, height = numbers[:3]
+        return (
+            f"length = {length}\n"
+            f"width = {width}\n"
+            f"height = {height}\n"
+            "result = cq.Workplane(\"XY\").box(length, width, height)\n"
         )
-        
-        message_parts = [genai.types.Part(text=prompt)]
-        
-        if image_data:
-            import base64
-            print("--- [DEBUG] Attaching Image Context ---")
-            try:
-                # Remove header if present (e.g., "data:image/jpeg;base64,")
-                if "," in image_data:
-                    image_data = image_data.split(",")[1]
-                
-                image_bytes = base64.b64decode(image_data)
-                image_part = genai.types.Part.from_bytes(data=image_bytes, mime_type="image/jpeg")
-                message_parts.append(image_part)
-            except Exception as e:
-                print(f"--- [ERROR] Failed to process image data: {e}")
-
-        print("------------------------------------------------")
-        
-        response = chat.send_message(message_parts)
-        print(f"--- [DEBUG] Response from Gemini ---\n{response.text}\n----------------------------------")
-        
-        # Cleaning response to ensure just code
-        code = response.text
-        if not code:
-            return ""
-
-        # Remove markdown code blocks if present using regex
-        # Look for ```python ... ``` or just ``` ... ```
-        pattern = r"```(?:python)?\s*(.*?)```"
-        match = re.search(pattern, code, re.DOTALL)
-        if match:
-             code = match.group(1)
-        else:
-             # If no blocks, maybe the whole thing is code, or we just strip lines?
-             # But if there is text and NO backticks, we might struggle.
-             # The existing logic just stripped backticks if they were at start/end.
-             # Let's trust regex first. If no match, we fallback to original raw text but maybe strip simplistic start/end.
-             pass
-            
-        return code.strip()
+
+BACKENDS = {
+    "gemini": GeminiBackend,
+    "stub": StubBackend,
+}
+
+class GeminiService:
+    """
+    Non-blocking LLM access shared by all requests.
+    Bounds concurrent calls with a semaphore, applies a per-request timeout and
+    retries rate-limited/overloaded responses with exponential backoff.
+    The backend is selected with LLM_BACKEND ("gemini" or "stub").
+    """
+    def __init__(self):
+        self.backend = None
+        self._semaphore = None
+
+    def _get_backend(self):
+        if self.backend is None:
+            if settings.LLM_BACKEND not in BACKENDS:
+                raise ValueError(f"Unknown LLM backend '{settings.LLM_BACKEND}'")
+            self.backend = BACKENDS[settings.LLM_BACKEND]()
+        return self.backend
+
+    def _get_semaphore(self):
+        # Created lazily so it binds to the running event loop; each server process gets its share of the limit
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(max(1, math.ceil(settings.LLM_MAX_CONCURRENCY / settings.WEB_WORKERS)))
+        return self._semaphore
+
+    def cache_key(self, prompt: str, history: list = None, image_id: str = None) -> str:
+        """Key for the response cache: model, system prompt, normalized history/prompt and image id (a content hash)."""
+        model = f"{settings.LLM_BACKEND}:{settings.GEMINI_MODEL}"
+        return cache_key(model, SYSTEM_PROMPT, history, prompt, image_id)
+
+    @staticmethod
+    def _is_retryable(error: Exception) -> bool:
+        # Without the SDK loaded there is no API error to retry
+        genai = sys.modules.get("google.genai")
+        return genai is not None and isinstance(error, genai.errors.APIError) and error.code in RETRYABLE_STATUS
+
+    async def _backoff(self, attempt: int, error: Exception):
+        delay = settings.LLM_BACKOFF_SECONDS * (2 ** attempt) * (0.5 + random.random())
+        logger.warning("LLM call failed (%s); retrying in %.1fs", error, delay)
+        LLM_RETRIES.inc()
+        await asyncio.sleep(delay)
+
+    async def generate_code(self, prompt: str, history: list = None, image: bytes = None, temperature: float = None) -> str:
+        backend = self._get_backend()
+        with LLM_SECONDS.time(backend=settings.LLM_BACKEND, mode="generate", outcome="error") as labels:
+            async with self._get_semaphore():
+                for attempt in range(settings.LLM_MAX_RETRIES + 1):
+                    try:
+                        text = await asyncio.wait_for(
+                            backend.generate(prompt, history, image, temperature=temperature),
+                            timeout=settings.LLM_TIMEOUT_SECONDS
+                        )
+                        break
+                    except asyncio.TimeoutError:
+                        labels["outcome"] = "timeout"
+                        raise LLMTimeoutError(f"LLM did not respond within {settings.LLM_TIMEOUT_SECONDS:.0f}s")
+                    except asyncio.CancelledError:
+                        labels["outcome"] = "cancelled"
+                        raise
+                    except Exception as e:
+                        if attempt < settings.LLM_MAX_RETRIES and self._is_retryable(e):
+                            await self._backoff(attempt, e)
+                            continue
+                        raise
+            labels["outcome"] = "ok"
+
+        logger.debug("Response from LLM:\n%s", text)
+        return extract_code(text)
+
+    async def stream_code(self, prompt: str, history: list = None, image: bytes = None):
+        """
+        Streams the raw response text as it is generated.
+        Cancelling the consumer aborts the request. The timeout applies to the
+        wait for each chunk; rate-limit retries only happen before the first chunk.
+        Callers should run the joined text through extract_code().
+        """
+        backend = self._get_backend()
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            async with self._get_semaphore():
+                for attempt in range(settings.LLM_MAX_RETRIES + 1):
+                    chunks = backend.stream(prompt, history, image)
+                    received = False
+                    try:
+                        while True:
+                            try:
+                                text = await asyncio.wait_for(chunks.__anext__(), timeout=settings.LLM_TIMEOUT_SECONDS)
+                            except StopAsyncIteration:
+                                outcome = "ok"
+                                return
+                            except asyncio.TimeoutError:
+                                outcome = "timeout"
+                                raise LLMTimeoutError(f"LLM did not respond within {settings.LLM_TIMEOUT_SECONDS:.0f}s")
+                            received = True
+                            yield text
+                    except LLMTimeoutError:
+                        raise
+                    except (asyncio.CancelledError, GeneratorExit):
+                        outcome = "cancelled"
+                        raise
+                    except Exception as e:
+                        if not received and attempt < settings.LLM_MAX_RETRIES and self._is_retryable(e):
+                            await self._backoff(attempt, e)
+                            continue
+                        raise
+                    finally:
+                        await chunks.aclose()
+        finally:
+            LLM_SECONDS.observe(time.perf_counter() - started, backend=settings.LLM_BACKEND, mode="stream", outcome=outcome)
+
+def extract_code(text: str) -> str:
+    """Cleans an LLM response down to just the Python code."""
+    code = text
+    if not code:
+        return ""
+
+    # Remove markdown code blocks if present using regex
+    # Look for ```python ... ``` or just ``` ... ```
+    pattern = r"```(?:python)?\s*(.*?)```"
+    match = re.search(pattern, code, re.DOTALL)
+    if match:
+         code = match.group(1)
+    else:
+         # If no blocks, maybe the whole thing is code, or we just strip lines?
+         # But if there is text and NO backticks, we might struggle.
+         # The existing logic just stripped backticks if they were at start/end.
+         # Let's trust regex first. If no match, we fallback to original raw text but maybe strip simplistic start/end.
+         pass
+
+    return code.strip()
 
 gemini_service = GeminiService()
@@ -0,0 +1,338 @@
+import asyncio
+import logging
+import os
+import time
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import settings
+from ..database import AsyncSessionLocal
+from ..models import ChatSession, ChatMessage, GeneratedModel, GenerationCandidate
+from ..schemas import GenerateRequest
+from ..telemetry import LLM_CACHE, TURN_RETRIES, TURN_SECONDS, TURNS
+from .artifact_store import artifact_store
+from .gemini_service import gemini_service, extract_code
+from .errors import CadQueryExecutionError
+from .jobs import build_artifacts, build_preview
+from .executor import executor
+from .image_store import image_store
+from .llm_cache import llm_cache
+from .session_context import session_contexts
+from .speculative import speculate
+
+logger = logging.getLogger(__name__)
+
+MAX_RETRIES = 3
+
+# Background fine-LOD jobs by GeneratedModel id
+_refinements = {}
+
+def _elapsed_ms(started: float) -> int:
+    return int((time.perf_counter() - started) * 1000)
+
+def lod_urls(model: GeneratedModel) -> dict:
+    return {
+        "preview": artifact_store.url(model.preview_path),
+        "fine": artifact_store.url(model.file_path) if model.lod_status == "ready" else None,
+    }
+
+async def _refine(model_id: int, code: str):
+    """Builds the fine LOD (GLB plus STL/3MF) for a model whose preview was already returned."""
+    try:
+        artifacts = await executor.submit(build_artifacts, code)
+        paths = await artifact_store.asave(artifacts)
+        status = "ready"
+    except Exception as e:
+        logger.warning("Fine LOD for model %s failed: %s", model_id, e)
+        paths = {}
+        status = "failed"
+
+    async with AsyncSessionLocal() as db:
+        model = await db.get(GeneratedModel, model_id)
+        if model:
+            model.lod_status = status
+            if paths:
+                model.filename = os.path.basename(paths["glb"])
+                model.file_path = paths["glb"]
+                model.stl_path = paths.get("stl")
+                model.threemf_path = paths.get("3mf")
+            await db.commit()
+
+def schedule_refinement(model_id: int, code: str):
+    task = asyncio.create_task(_refine(model_id, code))
+    _refinements[model_id] = task
+    task.add_done_callback(lambda _: _refinements.pop(model_id, None))
+
+async def wait_for_refinement(model_id: int):
+    """Waits for a pending fine-LOD job, if any. Shielded so a cancelled waiter doesn't cancel the job."""
+    task = _refinements.get(model_id)
+    if task:
+        await asyncio.shield(task)
+    elif settings.WEB_WORKERS > 1:
+        # The job may be running in another server process: watch the row instead
+        deadline = time.monotonic() + settings.EXEC_TIMEOUT_SECONDS
+        while time.monotonic() < deadline:
+            async with AsyncSessionLocal() as db:
+                status = await db.scalar(select(GeneratedModel.lod_status).where(GeneratedModel.id == model_id))
+            if status != "pending":
+                return
+            await asyncio.sleep(0.1)
+
+def _retry_prompt(error: Exception) -> str:
+    return f"The code you generated caused an error:\n{str(error)}\nPlease fix the code and regenerate it completely. Ensure variables are defined before use."
+
+def _printability_issues(report: dict) -> list:
+    """Problems of a built model worth a PRINT_FEEDBACK retry, as sentences for the LLM."""
+    issues = []
+    if report and not report["watertight"]:
+        issues.append(
+            f"The mesh is not watertight ({report['open_edges']} open, {report['non_manifold_edges']} non-manifold "
+            f"and {report['flipped_edges']} inconsistently oriented edges). Make sure the result is a single closed solid "
+            "(union touching parts, avoid zero-thickness walls and coincident faces)."
+        )
+    if report and report["overhang_fraction"] > settings.PRINT_MAX_OVERHANG_FRACTION:
+        issues.append(
+            f"{report['overhang_fraction']:.0%} of the surface ({report['overhang_area_mm2']:.0f} mm²) overhangs more than "
+            f"{report['overhang_angle']:.0f}° from vertical and would need supports. Add chamfers under overhangs or "
+            "reorient the part so large faces rest on the build plate."
+        )
+    return issues
+
+def _printability_prompt(issues: list) -> str:
+    problems = "\n".join(f"- {issue}" for issue in issues)
+    return f"The model builds, but it would not print well:\n{problems}\nPlease fix the design and regenerate the code completely, keeping the requested shape and dimensions."
+
+def _candidate_rows(outcomes: list) -> list:
+    return [
+        GenerationCandidate(
+            candidate_index=o["index"],
+            temperature=o["temperature"],
+            variant=o["variant"],
+            outcome=o["outcome"],
+            error=o["error"],
+            llm_ms=o["llm_ms"],
+            exec_ms=o["exec_ms"],
+        )
+        for o in outcomes
+    ]
+
+async def _commit_turn(db: AsyncSession, session: ChatSession, rows: list) -> ChatSession:
+    """
+    Writes everything a turn produced (a new session, messages, model, candidate
+    outcomes) in one transaction, so the write lock is held once and briefly.
+    """
+    if session is None:
+        session = ChatSession()
+        db.add(session)
+        await db.flush() # Assigns session.id
+    for row in rows:
+        row.session_id = session.id
+        db.add(row)
+    await db.commit()
+    return session
+
+async def save_turn(db: AsyncSession, session: ChatSession, prompt: str, code: str, artifacts: dict,
+                    image_id: str = None, model_content: str = "Generated Code", extra_rows: list = ()) -> dict:
+    """
+    Saves a successful turn: stores the coarse preview, writes the messages and the
+    model in one transaction (creating the session if None), and schedules the
+    fine LOD (and STL/3MF) in the background. Returns the GenerateResponse fields.
+    """
+    preview_path = (await artifact_store.asave({"glb": artifacts["glb"]}))["glb"]
+
+    user_msg = ChatMessage(role="user", content=prompt, image_hash=image_id)
+    model_msg = ChatMessage(role="model", content=model_content, code_snippet=code)
+    gen_model = GeneratedModel(
+        filename=os.path.basename(preview_path),
+        preview_path=preview_path,
+        lod_status="pending"
+    )
+    session = await _commit_turn(db, session, [user_msg, model_msg, gen_model, *extra_rows])
+    session_contexts.record_turn(session.id, prompt, code, model_msg.id)
+    schedule_refinement(gen_model.id, code)
+
+    return {
+        "session_id": session.id,
+        "code": code,
+        "glb_url": artifact_store.url(preview_path),
+        "model_id": gen_model.id,
+        "lods": lod_urls(gen_model),
+        "printability": artifacts.get("printability"),
+        "error": None,
+    }
+
+async def run_generation(request: GenerateRequest, db: AsyncSession, stream_tokens: bool = False):
+    """
+    Runs one generation turn (LLM -> execute -> retry on error -> save) as an
+    async generator of progress events. Each event is a dict with an "event" key:
+
+        session       {session_id}           (a new session is saved with its first turn, so
+                                              its id arrives just before done)
+        llm_start     {attempt}
+        token         {text}                  (only with stream_tokens)
+        code          {attempt, code, llm_ms}
+        cache_hit     {attempt}               (code served from the response cache)
+        exec_start    {attempt}
+        exec_done     {attempt, ok, exec_ms}
+        retry         {attempt, reason}
+        speculate     {candidates}            (speculative mode only)
+        candidate_done {index, ok, llm_ms, exec_ms, error}
+        done          {response}              (GenerateResponse fields; glb_url is the coarse preview)
+
+    Non-execution failures (e.g. Gemini errors, unknown or invalid images) are raised to the caller.
+    Cancelling the consumer cancels the in-flight LLM call or worker job.
+    """
+    started = time.perf_counter()
+    retries = 0
+    outcome = "error"
+    events = _generation_events(request, db, stream_tokens)
+    try:
+        async for event in events:
+            if event["event"] == "retry":
+                retries += 1
+            elif event["event"] == "done":
+                outcome = "failed" if event["response"]["error"] else "ok"
+            yield event
+    except (asyncio.CancelledError, GeneratorExit):
+        if outcome == "error":  # Closed before the turn finished
+            outcome = "cancelled"
+        raise
+    finally:
+        await events.aclose()
+        TURNS.inc(outcome=outcome)
+        TURN_SECONDS.observe(time.perf_counter() - started, outcome=outcome)
+        if outcome in ("ok", "failed"):
+            TURN_RETRIES.observe(retries)
+
+async def _generation_events(request: GenerateRequest, db: AsyncSession, stream_tokens: bool):
+    """The turn itself, see run_generation()."""
+    # Snapshot for refinements, by image store id (legacy inline base64 is ingested first)
+    image_id = request.image_id
+    if not image_id and request.image:
+        image_id = (await image_store.aput_base64(request.image))["image_id"]
+    image = await image_store.aget(image_id) if image_id else None
+
+    # 1. Get the session (None: new session, or restart if the requested one is invalid)
+    session = await db.get(ChatSession, request.session_id) if request.session_id else None
+    if session:
+        yield {"event": "session", "session_id": session.id}
+
+    # 2. Get history (compact per-session context: latest code, summary, recent turns)
+    history = (await session_contexts.get(db, session.id)).history() if session else []
+    candidate_rows = []
+
+    # 3. Generate & Execute Code with Retry
+    # We maintain a working history specific to this generation attempt
+    # so we can append error contexts without corrupting the main DB.
+    working_history = list(history)
+    code = ""
+
+    # Responses are cached against the original request; retries are never looked up
+    cache_key = gemini_service.cache_key(request.prompt, history, image_id) if request.use_cache else None
+    cached_code = await llm_cache.aget(cache_key) if cache_key else None
+    if cache_key:
+        LLM_CACHE.inc(result="hit" if cached_code else "miss")
+    artifacts = None
+
+    # 3a. Speculative mode: N concurrent candidates, first successful execution wins.
+    # If none succeeds, the first failure seeds the regular error-feedback retry loop.
+    candidates = min(request.candidates or settings.SPECULATIVE_CANDIDATES, settings.SPECULATIVE_MAX_CANDIDATES)
+    if candidates > 1 and not cached_code:
+        yield {"event": "speculate", "candidates": candidates}
+        async for event in speculate(request.prompt, history, image, candidates):
+            if event["event"] != "speculation_done":
+                yield event
+                continue
+            candidate_rows = _candidate_rows(event["outcomes"])
+            winner = event["winner"]
+            if winner:
+                code, artifacts = winner["code"], winner["artifacts"]
+            else:
+                failed = [o for o in event["outcomes"] if o["outcome"] == "failed"]
+                if failed:
+                    working_history.append({"role": "model", "content": failed[0]["code"]})
+                    working_history.append({"role": "user", "content": _retry_prompt(failed[0]["error"])})
+                    yield {"event": "retry", "attempt": 1, "reason": failed[0]["error"]}
+
+    # 3b. Sequential generate -> execute with error-feedback retries
+    # (and, with PRINT_FEEDBACK, printability feedback; the last model that built is kept as a fallback)
+    fallback = None
+    for attempt in range(1 + MAX_RETRIES if artifacts is None else 0): # Initial + retries
+        # If it's a retry, the working_history has the previous bad code and error appended.
+        started = time.perf_counter()
+        if attempt == 0 and cached_code:
+            code = cached_code
+            yield {"event": "cache_hit", "attempt": attempt + 1}
+        elif stream_tokens:
+            yield {"event": "llm_start", "attempt": attempt + 1}
+            chunks = []
+            async for text in gemini_service.stream_code(request.prompt, history=working_history, image=image):
+                chunks.append(text)
+                yield {"event": "token", "text": text}
+            code = extract_code("".join(chunks))
+        else:
+            yield {"event": "llm_start", "attempt": attempt + 1}
+            code = await gemini_service.generate_code(request.prompt, history=working_history, image=image)
+        yield {"event": "code", "attempt": attempt + 1, "code": code, "llm_ms": _elapsed_ms(started)}
+
+        # 4. Execute Code (in the worker pool, so the event loop stays free)
+        yield {"event": "exec_start", "attempt": attempt + 1}
+        started = time.perf_counter()
+        try:
+            # Fails fast (before any geometry work) on code that cannot run
+            artifacts = await executor.submit(build_preview, code, validate=True)
+        except CadQueryExecutionError as e:
+            yield {"event": "exec_done", "attempt": attempt + 1, "ok": False, "exec_ms": _elapsed_ms(started)}
+            logger.info("Generation attempt %d failed: %s", attempt + 1, e)
+            if attempt == 0 and cached_code:
+                # Stale entry (e.g. after a CadQuery upgrade); drop it
+                await llm_cache.ainvalidate(cache_key)
+
+            if attempt < MAX_RETRIES:
+                # Append context for retry
+                # 1. The bad code that was generated (as 'model' response)
+                working_history.append({"role": "model", "content": code})
+
+                # 2. The error message (as 'user' feedback)
+                working_history.append({"role": "user", "content": _retry_prompt(e)})
+
+                yield {"event": "retry", "attempt": attempt + 1, "reason": str(e)}
+                continue
+
+            if fallback is not None:
+                code, artifacts = fallback
+                break
+
+            # Retries exhausted
+            logger.warning("Generation failed after %d retries: %s", MAX_RETRIES, e)
+            is_new = session is None
+            session = await _commit_turn(db, session, candidate_rows) # Keep candidate outcomes
+            if is_new:
+                yield {"event": "session", "session_id": session.id}
+            yield {"event": "done", "response": {
+                "session_id": session.id,
+                "code": code, # Return the failing code
+                "glb_url": "",
+                "error": str(e),
+            }}
+            return
+
+        yield {"event": "exec_done", "attempt": attempt + 1, "ok": True, "exec_ms": _elapsed_ms(started)}
+        issues = _printability_issues(artifacts.get("printability")) if settings.PRINT_FEEDBACK else []
+        if issues and attempt < MAX_RETRIES:
+            fallback = (code, artifacts)
+            working_history.append({"role": "model", "content": code})
+            working_history.append({"role": "user", "content": _printability_prompt(issues)})
+            yield {"event": "retry", "attempt": attempt + 1, "reason": " ".join(issues)}
+            continue
+        break
+
+    if cache_key and code != cached_code:
+        await llm_cache.aput(cache_key, code)
+
+    # 5./6. Save the preview and the turn
+    is_new = session is None
+    response = await save_turn(db, session, request.prompt, code, artifacts, image_id=image_id, extra_rows=candidate_rows)
+    if is_new:
+        yield {"event": "session", "session_id": response["session_id"]}
+    yield {"event": "done", "response": response}
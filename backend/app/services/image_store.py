@@ -0,0 +1,187 @@
+import asyncio
+import base64
+import binascii
+import hashlib
+import io
+import logging
+import os
+import re
+import tempfile
+import time
+from PIL import Image, UnidentifiedImageError
+
+from ..config import settings
+from ..database import SessionLocal
+from ..models import ChatMessage
+from ..startup import startup
+from .locks import ProcessLock
+
+logger = logging.getLogger(__name__)
+
+class ImageNotFoundError(Exception):
+    pass
+
+class InvalidImageError(ValueError):
+    pass
+
+class ImageStore:
+    """
+    Content-addressed store for refinement snapshots.
+    An upload's id is the SHA-256 of the uploaded bytes; it is downscaled to
+    max_side and re-encoded as JPEG once, so re-sending an unchanged snapshot
+    costs neither processing nor storage. Methods are blocking; the async
+    wrappers run them in a thread.
+
+    collect() works like the artifact store's GC: images no ChatMessage refers to
+    are removed after a grace period, then the least recently used ones until the
+    store fits its quota. Images are only read by the prompt they are sent with,
+    so past the grace period referenced ones can go too.
+    """
+    ID_PATTERN = re.compile(r"[0-9a-f]{64}")
+
+    def __init__(self, directory: str, max_side: int, quality: int, max_bytes: int, grace_seconds: float):
+        self.directory = directory
+        self.max_side = max_side
+        self.quality = quality
+        self.max_bytes = max_bytes
+        self.grace_seconds = grace_seconds
+        self.last_gc = None
+        self._gc_lock = ProcessLock("image-gc")
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, image_id: str) -> str:
+        if not self.ID_PATTERN.fullmatch(image_id or ""):
+            raise ImageNotFoundError(f"Invalid image id '{image_id}'")
+        return os.path.join(self.directory, f"{image_id}.jpg")
+
+    def _downscale(self, data: bytes) -> bytes:
+        try:
+            image = Image.open(io.BytesIO(data))
+            image.thumbnail((self.max_side, self.max_side), Image.LANCZOS)
+            out = io.BytesIO()
+            image.convert("RGB").save(out, format="JPEG", quality=self.quality, optimize=True)
+        except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as e:
+            raise InvalidImageError(f"Unreadable image: {e}")
+        return out.getvalue()
+
+    def put(self, data: bytes) -> dict:
+        """Stores an uploaded image; returns {image_id, bytes, deduplicated}."""
+        image_id = hashlib.sha256(data).hexdigest()
+        path = self._path(image_id)
+        if os.path.exists(path):
+            # Touch so quota eviction treats it as recently used
+            os.utime(path)
+            return {"image_id": image_id, "bytes": os.path.getsize(path), "deduplicated": True}
+
+        processed = self._downscale(data)
+        # Temp file + rename, so concurrent readers never see a partial image
+        fd, tmp_path = tempfile.mkstemp(suffix=".jpg.tmp", dir=self.directory)
+        with os.fdopen(fd, "wb") as f:
+            f.write(processed)
+        os.replace(tmp_path, path)
+        logger.info("Stored image %s", image_id[:12], extra={"uploaded_bytes": len(data), "stored_bytes": len(processed)})
+        return {"image_id": image_id, "bytes": len(processed), "deduplicated": False}
+
+    def put_base64(self, image_data: str) -> dict:
+        """Legacy inline snapshots (optionally a data URL, e.g. "data:image/jpeg;base64,...")."""
+        if "," in image_data:
+            image_data = image_data.split(",", 1)[1]
+        try:
+            data = base64.b64decode(image_data)
+        except (binascii.Error, ValueError) as e:
+            raise InvalidImageError(f"Invalid base64 image data: {e}")
+        return self.put(data)
+
+    def get(self, image_id: str) -> bytes:
+        try:
+            with open(self._path(image_id), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            raise ImageNotFoundError(f"Image '{image_id}' not found; upload it to /api/images first")
+
+    async def aput(self, data: bytes) -> dict:
+        return await asyncio.to_thread(self.put, data)
+
+    async def aput_base64(self, image_data: str) -> dict:
+        return await asyncio.to_thread(self.put_base64, image_data)
+
+    async def aget(self, image_id: str) -> bytes:
+        return await asyncio.to_thread(self.get, image_id)
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def collect(self, db) -> dict:
+        """One GC pass: drop unreferenced images, then enforce the disk quota."""
+        refs = {image_id for image_id, in db.query(ChatMessage.image_hash).filter(ChatMessage.image_hash.isnot(None))}
+        now = time.time()
+        entries = {}
+        for entry in os.scandir(self.directory):
+            if not entry.is_file():
+                continue
+            st = entry.stat()
+            if entry.name.endswith(".tmp"):
+                if now - st.st_mtime > self.grace_seconds:
+                    # Left over from an interrupted write
+                    self._remove(entry.path)
+                continue
+            entries[entry.name] = (st.st_mtime, st.st_size)
+        removed = 0
+        freed = 0
+
+        # Uploads never sent with a prompt; the grace period covers upload -> generate
+        for name, (mtime, size) in list(entries.items()):
+            if name.removesuffix(".jpg") not in refs and now - mtime > self.grace_seconds:
+                self._remove(os.path.join(self.directory, name))
+                del entries[name]
+                removed += 1
+                freed += size
+
+        # Over quota: least recently used first, never within the grace period
+        total = sum(size for _, size in entries.values())
+        for name, (mtime, size) in sorted(entries.items(), key=lambda e: e[1][0]):
+            if total <= self.max_bytes or now - mtime <= self.grace_seconds:
+                break
+            self._remove(os.path.join(self.directory, name))
+            del entries[name]
+            total -= size
+            removed += 1
+            freed += size
+
+        self.last_gc = {"at": now, "removed": removed, "freed_bytes": freed, "entries": len(entries), "bytes": total}
+        if removed:
+            logger.info("Image GC removed %d files", removed, extra={"freed_bytes": freed})
+        return self.last_gc
+
+    def _collect_with_session(self) -> dict:
+        db = SessionLocal()
+        try:
+            return self.collect(db)
+        finally:
+            db.close()
+
+    async def run_gc(self, interval: float):
+        """Background GC loop, started from the app lifespan."""
+        # Reference counting reads the chat messages
+        if not await startup.wait_for_database():
+            return
+        while True:
+            try:
+                # One server process collects; the others take over if it exits
+                if self._gc_lock.acquire(blocking=False):
+                    await asyncio.to_thread(self._collect_with_session)
+            except Exception as e:
+                logger.warning("Image GC failed: %s", e)
+            await asyncio.sleep(interval)
+
+image_store = ImageStore(
+    settings.IMAGE_STORE_DIR,
+    max_side=settings.IMAGE_MAX_SIDE,
+    quality=settings.IMAGE_JPEG_QUALITY,
+    max_bytes=settings.IMAGE_MAX_MB * 1024 * 1024,
+    grace_seconds=settings.IMAGE_GC_GRACE_SECONDS,
+)
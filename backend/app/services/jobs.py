@@ -0,0 +1,26 @@
+"""
+Executor job entry points.
+The server only pickles references to these; CadQuery is imported in the
+worker processes (and preloaded by the forkserver), never on the request path.
+With validate, the script first goes through the static checks of code_validator
+(which need CadQuery's names), failing with CodeValidationError before any geometry work.
+"""
+
+def _validate(code_str: str):
+    from .code_validator import validate_code
+    validate_code(code_str)
+
+def build_preview(code_str: str, validate: bool = False) -> dict:
+    """Coarse-tolerance GLB plus its printability report. Returns {"glb": bytes, "printability": dict}."""
+    if validate:
+        _validate(code_str)
+    from .cadquery_service import build_preview
+    return build_preview(code_str)
+
+def build_artifacts(code_str: str, formats=("glb", "stl", "3mf"), tolerance: float = None, angular_tolerance: float = None,
+                    validate: bool = False) -> dict:
+    """Every requested format from a single tessellation. Returns {format: bytes}."""
+    if validate:
+        _validate(code_str)
+    from .cadquery_service import build_artifacts
+    return build_artifacts(code_str, formats=formats, tolerance=tolerance, angular_tolerance=angular_tolerance)
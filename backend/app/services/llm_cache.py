@@ -0,0 +1,114 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from ..config import settings
+
+def _normalize_text(text: str) -> str:
+    # Near-identical prompts ("Simple box  100x100x50") share a key
+    return re.sub(r"\s+", " ", (text or "").strip().lower())
+
+def cache_key(model: str, system_prompt: str, history: list, prompt: str, image_hash: str = None) -> str:
+    payload = json.dumps({
+        "model": model,
+        "system": system_prompt,
+        # Verbatim: history holds generated code, where case and indentation matter
+        "history": [(entry["role"], entry["content"]) for entry in (history or [])],
+        "prompt": _normalize_text(prompt),
+        "image": image_hash,
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class LLMResponseCache:
+    """
+    Persistent (SQLite) cache of LLM code responses with TTL and LRU eviction.
+    Only code that executed successfully should be put() here.
+    Methods are blocking; the async wrappers run them in a thread.
+    """
+    def __init__(self, path: str, ttl_seconds: float, max_entries: int):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connection(self):
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # Shared by all server processes: WAL and a busy timeout instead of "database is locked"
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=settings.SQLITE_BUSY_TIMEOUT_MS / 1000)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, code TEXT NOT NULL, created_at REAL NOT NULL, "
+                "last_access REAL NOT NULL, hits INTEGER NOT NULL DEFAULT 0)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS ix_llm_cache_last_access ON llm_cache (last_access)")
+            self._conn.commit()
+        return self._conn
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT code FROM llm_cache WHERE key = ? AND created_at > ?", (key, now - self.ttl_seconds)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            conn.execute("UPDATE llm_cache SET last_access = ?, hits = hits + 1 WHERE key = ?", (now, key))
+            conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, code: str):
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, code, created_at, last_access, hits) VALUES (?, ?, ?, ?, 0)",
+                (key, code, now, now)
+            )
+            conn.execute("DELETE FROM llm_cache WHERE created_at <= ?", (now - self.ttl_seconds,))
+            conn.execute(
+                "DELETE FROM llm_cache WHERE key IN ("
+                "SELECT key FROM llm_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            conn.commit()
+
+    def invalidate(self, key: str):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._connection().execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+            return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+    async def aget(self, key: str):
+        return await asyncio.to_thread(self.get, key)
+
+    async def aput(self, key: str, code: str):
+        await asyncio.to_thread(self.put, key, code)
+
+    async def ainvalidate(self, key: str):
+        await asyncio.to_thread(self.invalidate, key)
+
+llm_cache = LLMResponseCache(
+    settings.LLM_CACHE_PATH,
+    ttl_seconds=settings.LLM_CACHE_TTL_SECONDS,
+    max_entries=settings.LLM_CACHE_MAX_ENTRIES,
+)
@@ -0,0 +1,58 @@
+import os
+import threading
+
+from ..config import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: a single server process is assumed
+    fcntl = None
+
+class ProcessLock:
+    """
+    Advisory file lock shared by the server processes (uvicorn workers) using one DATA_DIR.
+    Used to elect the process that runs a background loop and to serialize migrations.
+    The OS releases it when the holder exits, so another process can take over.
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self._fd = None
+        self._lock = threading.Lock()
+
+    @property
+    def path(self) -> str:
+        return os.path.join(settings.LOCK_DIR, f"{self.name}.lock")
+
+    @property
+    def held(self) -> bool:
+        return self._fd is not None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        """True if this process holds the lock (already, or now)."""
+        with self._lock:
+            if self._fd is not None:
+                return True
+            os.makedirs(settings.LOCK_DIR, exist_ok=True)
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT | getattr(os, "O_CLOEXEC", 0), 0o644)
+            if fcntl is not None:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    os.close(fd)
+                    return False
+            self._fd = fd
+            return True
+
+    def release(self):
+        with self._lock:
+            if self._fd is not None:
+                # Closing the descriptor drops the lock
+                os.close(self._fd)
+                self._fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
@@ -0,0 +1,127 @@
+"""
+Vectorized post-processing and analysis of tessellated meshes (NumPy only).
+Vertices are float (N, 3) arrays in mm, triangles integer (M, 3) index arrays.
+"""
+import math
+
+import numpy as np
+
+def _row_keys(keys):
+    """Integer rows as single int64 keys when their ranges allow it (1-D unique is much faster), else the rows."""
+    low = keys.min(axis=0)
+    spans = [int(s) for s in keys.max(axis=0) - low + 1]
+    if math.prod(spans) >= 2 ** 63:
+        return keys
+    keys = keys - low
+    flat = keys[:, 0]
+    for column, span in enumerate(spans[1:], start=1):
+        flat = flat * span + keys[:, column]
+    return flat
+
+def _run_lengths(values):
+    """Occurrence count of every distinct value (via a sort; faster than np.unique's hashing here)."""
+    ordered = np.sort(values)
+    starts = np.flatnonzero(np.concatenate([[True], ordered[1:] != ordered[:-1]]))
+    return np.diff(np.append(starts, len(ordered)))
+
+def weld(vertices, triangles, tolerance: float):
+    """
+    Merges vertices that fall into the same tolerance-sized grid cell.
+    Returns (vertices, triangles); vertices keep their first-occurrence order.
+    """
+    keys = np.rint(vertices / tolerance).astype(np.int64)
+    keys = _row_keys(keys) if len(keys) else keys
+    _, first, inverse = np.unique(keys, axis=0 if keys.ndim == 2 else None, return_index=True, return_inverse=True)
+    order = np.argsort(first)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    keep = first[order]
+    triangles = rank[inverse.reshape(-1)][triangles].astype(np.uint32)
+    return vertices[keep], triangles
+
+def triangle_areas(vertices, triangles):
+    v = vertices[triangles].astype(np.float64)
+    return 0.5 * np.linalg.norm(np.cross(v[:, 1] - v[:, 0], v[:, 2] - v[:, 0]), axis=1)
+
+def drop_degenerate(vertices, triangles, min_area: float):
+    """Removes triangles with repeated corners or (near) zero area, then the vertices nothing references."""
+    t = triangles
+    valid = (t[:, 0] != t[:, 1]) & (t[:, 1] != t[:, 2]) & (t[:, 2] != t[:, 0])
+    valid &= triangle_areas(vertices, t) > min_area
+    t = t[valid]
+    used = np.zeros(len(vertices), dtype=bool)
+    used[t.reshape(-1)] = True
+    if used.all():
+        return vertices, t
+    remap = np.cumsum(used) - 1
+    return vertices[used], remap[t].astype(np.uint32)
+
+def edge_stats(triangles, vertex_count: int) -> dict:
+    """Open, non-manifold and inconsistently oriented edges of a position-welded mesh."""
+    t = triangles.astype(np.int64)
+    start = t.reshape(-1)
+    end = t[:, [1, 2, 0]].reshape(-1)
+    undirected = np.minimum(start, end) * vertex_count + np.maximum(start, end)
+    counts = _run_lengths(undirected)
+    # In a consistently oriented closed surface every directed edge occurs exactly once
+    directed = np.sort(start * vertex_count + end)
+    flipped = int((directed[1:] == directed[:-1]).sum())
+    return {
+        "open_edges": int((counts == 1).sum()),
+        "non_manifold_edges": int((counts > 2).sum()),
+        "flipped_edges": int(flipped),
+    }
+
+def printability(meshes: list, overhang_angle: float, bed_tolerance: float = 1e-3) -> dict:
+    """
+    Print-readiness of a model as printed in its modelled orientation (Z up, lowest point on the bed).
+    meshes are (vertices, triangles) pairs, position-welded. A face overhangs when it faces
+    down more steeply than overhang_angle (degrees from vertical); faces lying on the bed do not.
+    """
+    volume = area = overhang = 0.0
+    triangle_count = vertex_count = 0
+    edges = {"open_edges": 0, "non_manifold_edges": 0, "flipped_edges": 0}
+    low = np.full(3, np.inf)
+    high = np.full(3, -np.inf)
+    for vertices, _ in meshes:
+        if len(vertices):
+            low = np.minimum(low, vertices.min(axis=0))
+            high = np.maximum(high, vertices.max(axis=0))
+    bed = low[2] + bed_tolerance
+    threshold = math.sin(math.radians(overhang_angle))
+
+    for vertices, triangles in meshes:
+        v = vertices[triangles].astype(np.float64)
+        cross = np.cross(v[:, 1] - v[:, 0], v[:, 2] - v[:, 0])
+        doubled = np.linalg.norm(cross, axis=1)
+        areas = 0.5 * doubled
+        # Divergence theorem: signed tetrahedra against the origin
+        volume += float(np.einsum("ij,ij->i", v[:, 0], cross).sum()) / 6.0
+        area += float(areas.sum())
+        down = np.divide(-cross[:, 2], doubled, out=np.zeros(len(v)), where=doubled > 0)
+        on_bed = v[:, :, 2].max(axis=1) <= bed
+        overhang += float(areas[(down > threshold) & ~on_bed].sum())
+        for name, count in edge_stats(triangles, len(vertices)).items():
+            edges[name] += count
+        triangle_count += len(triangles)
+        vertex_count += len(vertices)
+
+    watertight = not any(edges.values())
+    return {
+        "parts": len(meshes),
+        "triangles": triangle_count,
+        "vertices": vertex_count,
+        # Only meaningful for a closed surface
+        "volume_mm3": round(abs(volume), 3) if watertight else None,
+        "surface_area_mm2": round(area, 3),
+        "bbox": {
+            "min": [round(float(x), 4) for x in low],
+            "max": [round(float(x), 4) for x in high],
+            "size": [round(float(x), 4) for x in high - low],
+        },
+        "watertight": watertight,
+        **edges,
+        "overhang_angle": overhang_angle,
+        "overhang_area_mm2": round(overhang, 3),
+        "overhang_fraction": round(overhang / area, 4) if area else 0.0,
+    }
@@ -0,0 +1,129 @@
+import ast
+import asyncio
+import itertools
+
+from ..config import settings
+
+class ParameterError(ValueError):
+    pass
+
+# Names that are never parameters
+RESERVED = {"result"}
+
+def _literal(node: ast.expr):
+    """(type name, value) of a literal assignment value, or None for anything else."""
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub) and isinstance(node.operand, ast.Constant):
+        literal = _literal(node.operand)
+        if literal and literal[0] in ("int", "float"):
+            return literal[0], -literal[1]
+        return None
+    if not isinstance(node, ast.Constant):
+        return None
+    value = node.value
+    # bool before int: True is an int too
+    for kind in (bool, int, float, str):
+        if isinstance(value, kind):
+            return kind.__name__, value
+    return None
+
+def _assignments(code: str) -> dict:
+    """Top-level `name = <literal>` statements, first occurrence per name."""
+    try:
+        tree = ast.parse(code)
+    except SyntaxError as e:
+        raise ParameterError(f"Code could not be parsed: {e}")
+    found = {}
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+            name = node.targets[0].id
+            literal = _literal(node.value)
+            if literal and name not in RESERVED and name not in found:
+                found[name] = (literal[0], literal[1], node.value)
+    return found
+
+def extract_parameters(code: str) -> list:
+    """Typed parameter schema of a script: [{name, type, value, line}] in source order."""
+    return [
+        {"name": name, "type": kind, "value": value, "line": node.lineno}
+        for name, (kind, value, node) in _assignments(code).items()
+    ]
+
+def _coerce(name: str, kind: str, value):
+    if kind == "bool":
+        if isinstance(value, bool):
+            return value
+    elif kind in ("int", "float"):
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            if kind == "float":
+                return float(value)
+            if float(value).is_integer():
+                return int(value)
+    elif kind == "str":
+        if isinstance(value, str):
+            return value
+    raise ParameterError(f"Parameter '{name}' expects {kind}, got {value!r}")
+
+def apply_overrides(code: str, overrides: dict) -> str:
+    """
+    Returns the script with the given parameters set. Only the literal of each
+    assignment is replaced (located via the AST), so comments and formatting survive.
+    """
+    assignments = _assignments(code)
+    unknown = [name for name in overrides if name not in assignments]
+    if unknown:
+        raise ParameterError(f"Unknown parameter(s): {', '.join(unknown)}")
+
+    lines = code.split("\n")
+    # Character offset of each line start, to turn AST (line, col) into string positions
+    starts = [0, *itertools.accumulate(len(line) + 1 for line in lines)]
+
+    def position(lineno: int, col: int) -> int:
+        # col_offset counts UTF-8 bytes
+        return starts[lineno - 1] + len(lines[lineno - 1].encode("utf-8")[:col].decode("utf-8"))
+
+    edits = []
+    for name, value in overrides.items():
+        kind, _, node = assignments[name]
+        new_value = _coerce(name, kind, value)
+        edits.append((position(node.lineno, node.col_offset), position(node.end_lineno, node.end_col_offset), repr(new_value)))
+
+    # Apply back to front so earlier offsets stay valid
+    for start, end, text in sorted(edits, reverse=True):
+        code = code[:start] + text + code[end:]
+    return code
+
+class LatestWins:
+    """
+    Debounce for slider-style updates: per key, a request only proceeds if no newer
+    one arrived within the debounce window, and requests for a key run one at a time.
+    A request that has been overtaken (before or while waiting its turn) is superseded.
+    """
+    def __init__(self, debounce_seconds: float):
+        self.debounce_seconds = debounce_seconds
+        self._sequence = itertools.count(1)
+        self._latest = {}
+        self._locks = {}
+
+    def _is_latest(self, key, ticket: int) -> bool:
+        return self._latest.get(key) == ticket
+
+    async def run(self, key, func, *args):
+        """Awaits func(*args) if this is still the latest request for key; returns (superseded, result)."""
+        ticket = next(self._sequence)
+        self._latest[key] = ticket
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        try:
+            await asyncio.sleep(self.debounce_seconds)
+            if not self._is_latest(key, ticket):
+                return True, None
+            async with lock:
+                if not self._is_latest(key, ticket):
+                    return True, None
+                return False, await func(*args)
+        finally:
+            if self._is_latest(key, ticket):
+                del self._latest[key]
+                if not lock.locked():
+                    self._locks.pop(key, None)
+
+parameter_updates = LatestWins(debounce_seconds=settings.PARAMETER_DEBOUNCE_MS / 1000)
@@ -0,0 +1,127 @@
+import threading
+from collections import OrderedDict, deque
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import settings
+from ..models import ChatMessage
+
+def estimate_tokens(text: str) -> int:
+    # Rough but cheap: ~4 characters per token for English/code
+    return len(text or "") // 4 + 1
+
+class SessionContext:
+    """
+    Compact LLM context for one chat session:
+    the latest working code, a rolling summary of older turns and the most
+    recent turns verbatim, kept within a token budget.
+    """
+    def __init__(self, session_id: int):
+        self.session_id = session_id
+        self.latest_code = None
+        self.summary = []
+        self.recent = deque()
+        # Newest ChatMessage id folded in, to notice turns saved by other server processes
+        self.last_message_id = None
+
+    def add_turn(self, prompt: str, code: str = None, message_id: int = None):
+        if message_id is not None:
+            self.last_message_id = message_id
+        self.recent.append(prompt)
+        if code:
+            self.latest_code = code
+        self._compact()
+
+    def _budget_used(self) -> int:
+        return (
+            estimate_tokens(self.latest_code)
+            + sum(estimate_tokens(s) for s in self.summary)
+            + sum(estimate_tokens(p) for p in self.recent)
+        )
+
+    def _compact(self):
+        # Fold turns beyond the verbatim window into the summary
+        while len(self.recent) > settings.SESSION_RECENT_TURNS:
+            self.summary.append(self._summarize(self.recent.popleft()))
+        # Then drop the oldest summary lines until we fit the budget
+        while self.summary and self._budget_used() > settings.SESSION_TOKEN_BUDGET:
+            self.summary.pop(0)
+
+    @staticmethod
+    def _summarize(prompt: str) -> str:
+        line = " ".join(prompt.split())
+        limit = settings.SESSION_SUMMARY_CHARS
+        return line if len(line) <= limit else line[:limit - 3] + "..."
+
+    def history(self) -> list:
+        """History entries ({"role", "content"}) to send to the LLM ahead of the new prompt."""
+        entries = []
+        if self.summary:
+            earlier = "\n".join(f"- {s}" for s in self.summary)
+            entries.append({"role": "user", "content": f"Earlier requests in this session (summarized):\n{earlier}"})
+            entries.append({"role": "model", "content": "Understood."})
+        for prompt in self.recent:
+            entries.append({"role": "user", "content": prompt})
+            entries.append({"role": "model", "content": "Generated Code"})
+        if self.latest_code:
+            # Replace the placeholder of the last turn with the code the next change should build on
+            if entries and entries[-1]["role"] == "model":
+                entries.pop()
+            entries.append({"role": "model", "content": self.latest_code})
+        return entries
+
+class SessionContextManager:
+    """
+    In-memory LRU of SessionContexts; loaded from the DB once per session, then updated per turn.
+    A cached context is reloaded when the session has a newer message (saved by another server process).
+    """
+    def __init__(self, max_sessions: int):
+        self.max_sessions = max_sessions
+        self._contexts = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def get(self, db: AsyncSession, session_id: int) -> SessionContext:
+        with self._lock:
+            context = self._contexts.get(session_id)
+        if context is not None:
+            latest = await db.scalar(select(func.max(ChatMessage.id)).where(ChatMessage.session_id == session_id))
+            if latest == context.last_message_id:
+                with self._lock:
+                    if session_id in self._contexts:
+                        self._contexts.move_to_end(session_id)
+                return context
+
+        context = await self._load(db, session_id)
+        with self._lock:
+            self._contexts[session_id] = context
+            while len(self._contexts) > self.max_sessions:
+                self._contexts.popitem(last=False)
+        return context
+
+    async def _load(self, db: AsyncSession, session_id: int) -> SessionContext:
+        context = SessionContext(session_id)
+        # created_at has one-second resolution; id keeps the turn order within a second
+        records = (await db.execute(
+            select(ChatMessage).where(ChatMessage.session_id == session_id).order_by(ChatMessage.created_at, ChatMessage.id)
+        )).scalars().all()
+        pending_prompt = None
+        for record in records:
+            if record.role == "user":
+                if pending_prompt is not None:
+                    context.add_turn(pending_prompt)
+                pending_prompt = record.content
+            elif pending_prompt is not None:
+                context.add_turn(pending_prompt, record.code_snippet)
+                pending_prompt = None
+        if pending_prompt is not None:
+            context.add_turn(pending_prompt)
+        context.last_message_id = max((record.id for record in records), default=None)
+        return context
+
+    def record_turn(self, session_id: int, prompt: str, code: str = None, message_id: int = None):
+        with self._lock:
+            context = self._contexts.get(session_id)
+        if context is not None:
+            context.add_turn(prompt, code, message_id)
+
+session_contexts = SessionContextManager(max_sessions=settings.SESSION_CACHE_SIZE)
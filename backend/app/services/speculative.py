@@ -0,0 +1,94 @@
+import asyncio
+import time
+
+from ..config import settings
+from .gemini_service import gemini_service
+from .errors import CadQueryExecutionError
+from .jobs import build_preview
+from .executor import executor
+
+# Prompt variants cycled across candidates alongside the temperatures
+VARIANT_HINTS = [
+    None,
+    "Prefer simple, robust operations; avoid fillets and chamfers on complex edge selections.",
+    "Build the part from simple primitives combined with boolean operations.",
+]
+
+def candidate_plan(n: int) -> list:
+    """(temperature, variant hint) for each of the n candidates."""
+    temperatures = [float(t) for t in settings.SPECULATIVE_TEMPERATURES.split(",") if t.strip()] or [None]
+    return [(temperatures[i % len(temperatures)], VARIANT_HINTS[i % len(VARIANT_HINTS)]) for i in range(n)]
+
+def _elapsed_ms(started: float) -> int:
+    return int((time.perf_counter() - started) * 1000)
+
+async def _run_candidate(index: int, temperature: float, variant: str, prompt: str, history: list, image: bytes) -> dict:
+    outcome = {
+        "index": index, "temperature": temperature, "variant": variant,
+        "outcome": None, "code": None, "error": None, "llm_ms": None, "exec_ms": None, "artifacts": None,
+    }
+    if variant:
+        prompt = f"{prompt}\n\n(Approach hint: {variant})"
+
+    started = time.perf_counter()
+    try:
+        outcome["code"] = await gemini_service.generate_code(prompt, history=history, image=image, temperature=temperature)
+    except Exception as e:
+        outcome.update(outcome="llm_error", error=str(e), llm_ms=_elapsed_ms(started))
+        return outcome
+    outcome["llm_ms"] = _elapsed_ms(started)
+
+    started = time.perf_counter()
+    try:
+        outcome["artifacts"] = await executor.submit(build_preview, outcome["code"], validate=True)
+        outcome["outcome"] = "success"
+    except CadQueryExecutionError as e:
+        outcome.update(outcome="failed", error=str(e))
+    except Exception as e:
+        # e.g. a result with no geometry to export; fails this candidate, not the turn
+        outcome.update(outcome="failed", error=f"{type(e).__name__}: {e}")
+    outcome["exec_ms"] = _elapsed_ms(started)
+    return outcome
+
+async def speculate(prompt: str, history: list, image: bytes, n: int):
+    """
+    Fires n candidate generations concurrently (varied temperature / prompt variant),
+    executing each as soon as it arrives. The first one that executes wins and the
+    rest are cancelled. Yields `candidate_done` events, then a final
+    `speculation_done` event with the winning outcome (or None) and all outcomes.
+    """
+    tasks = {
+        asyncio.create_task(_run_candidate(i, temperature, variant, prompt, history, image)): (i, temperature, variant)
+        for i, (temperature, variant) in enumerate(candidate_plan(n))
+    }
+    outcomes = []
+    winner = None
+    deadline = time.monotonic() + settings.SPECULATIVE_BUDGET_SECONDS
+    pending = set(tasks)
+    try:
+        while pending and winner is None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                outcome = task.result()
+                outcomes.append(outcome)
+                yield {
+                    "event": "candidate_done", "index": outcome["index"], "ok": outcome["outcome"] == "success",
+                    "llm_ms": outcome["llm_ms"], "exec_ms": outcome["exec_ms"], "error": outcome["error"],
+                }
+                if winner is None and outcome["outcome"] == "success":
+                    winner = outcome
+    finally:
+        for task in pending:
+            task.cancel()
+            i, temperature, variant = tasks[task]
+            outcomes.append({
+                "index": i, "temperature": temperature, "variant": variant, "outcome": "cancelled",
+                "code": None, "error": None, "llm_ms": None, "exec_ms": None, "artifacts": None,
+            })
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    yield {"event": "speculation_done", "winner": winner, "outcomes": outcomes}
@@ -0,0 +1,94 @@
+import asyncio
+import logging
+import time
+
+from fastapi import HTTPException
+
+from .database import migrate
+from .services.executor import executor
+from .services.locks import ProcessLock
+
+logger = logging.getLogger(__name__)
+
+def _migrate():
+    # Server processes start together; one at a time brings the schema up to date
+    with ProcessLock("migrate"):
+        migrate()
+
+def _warmup():
+    """Imports what the request path would otherwise load on first use (the LLM SDK)."""
+    from .services.gemini_service import gemini_service
+    gemini_service._get_backend()
+
+class Startup:
+    """
+    Brings the server up in the background so it accepts connections right away.
+    The database is migrated first; then the executor workers start and the
+    server-side imports are warmed in parallel. Each step is a readiness check:
+    "pending", "ok" or the error it failed with.
+    """
+    def __init__(self):
+        self.checks = {"database": "pending", "executor": "pending", "warmup": "pending"}
+        self.started_at = None
+        self.seconds = None
+        self._database = None
+
+    @property
+    def ready(self) -> bool:
+        return all(state == "ok" for state in self.checks.values())
+
+    async def _step(self, name: str, coro):
+        try:
+            await coro
+            self.checks[name] = "ok"
+        except Exception as e:
+            logger.error("Startup step %s failed: %s", name, e)
+            self.checks[name] = f"failed: {e}"
+
+    async def _executor(self):
+        await executor.astart()
+        if not executor.stats()["ready"]:
+            raise RuntimeError("No executor worker became ready")
+
+    async def run(self):
+        """Started from the app lifespan."""
+        self._database = asyncio.Event()
+        self.started_at = time.monotonic()
+        try:
+            # Create tables (and add columns introduced since the database was created)
+            await self._step("database", asyncio.to_thread(_migrate))
+        finally:
+            self._database.set()
+        await asyncio.gather(
+            self._step("executor", self._executor()),
+            self._step("warmup", asyncio.to_thread(_warmup)),
+        )
+        self.seconds = round(time.monotonic() - self.started_at, 2)
+        logger.info("Startup finished", extra={"seconds": self.seconds, **self.checks})
+
+    async def wait_for_database(self) -> bool:
+        """Waits for the migration; False if it failed. Returns at once when startup was never run."""
+        if self._database is None:
+            return True
+        await self._database.wait()
+        return self.checks["database"] == "ok"
+
+    def status(self) -> dict:
+        return {
+            "ready": self.ready,
+            "checks": dict(self.checks),
+            "startup_seconds": self.seconds,
+            "executor": executor.stats(),
+        }
+
+startup = Startup()
+
+async def require_database():
+    """Router dependency: holds requests until the database is migrated, 503 if that failed."""
+    if not await startup.wait_for_database():
+        raise HTTPException(status_code=503, detail="Database is not available")
+
+async def require_executor():
+    """Router dependency for routes that execute code: 503 right away (before any LLM call) if the worker pool failed to start."""
+    if executor.startup_error:
+        raise HTTPException(status_code=503, detail=f"Execution engine is unavailable: {executor.startup_error}")
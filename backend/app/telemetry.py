@@ -0,0 +1,282 @@
+"""
+Instrumentation: Prometheus-format metrics, structured logging and optional
+per-request cProfile capture.
+
+Metrics recorded inside executor workers are forwarded to the server process
+with each job result (see executor._worker_main), so /metrics covers both.
+"""
+import bisect
+import contextlib
+import contextvars
+import cProfile
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+from .config import settings
+
+# ---------------------------------------------------------------- metrics
+
+def _label_key(labelnames: tuple, labels: dict) -> tuple:
+    return tuple(str(labels.get(name, "")) for name in labelnames)
+
+def _escape(text: str, quote: bool = True) -> str:
+    text = str(text).replace("\\", "\\\\").replace("\n", "\\n")
+    return text.replace('"', '\\"') if quote else text
+
+def _format_labels(labelnames: tuple, key: tuple, extra: dict = None) -> str:
+    pairs = list(zip(labelnames, key)) + list((extra or {}).items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+class _Metric:
+    kind = None
+
+    def __init__(self, registry, name: str, documentation: str, labelnames: tuple = ()):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _record(self, op: str, value: float, labels: dict):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._apply(op, key, value)
+        self.registry._forward(self.name, op, value, labels)
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        self._record("inc", amount, labels)
+
+    def _apply(self, op, key, value):
+        self._values[key] = self._values.get(key, 0) + value
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, {}, value) for key, value in self._values.items()]
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        self._record("set", value, labels)
+
+    def _apply(self, op, key, value):
+        self._values[key] = value
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, {}, value) for key, value in self._values.items()]
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, registry, name, documentation, labelnames=(), buckets=None):
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = tuple(buckets or (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60))
+
+    def observe(self, value: float, **labels):
+        self._record("observe", value, labels)
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        """Observes the duration of the block; labels may be filled in inside it (e.g. outcome)."""
+        started = time.perf_counter()
+        try:
+            yield labels
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _apply(self, op, key, value):
+        counts, total = self._values.get(key) or ([0] * (len(self.buckets) + 1), 0.0)
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self._values[key] = (counts, total + value)
+
+    def samples(self):
+        out = []
+        with self._lock:
+            for key, (counts, total) in self._values.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    out.append((f"{self.name}_bucket", key, {"le": "+Inf" if bound == float("inf") else repr(bound)}, cumulative))
+                out.append((f"{self.name}_sum", key, {}, total))
+                out.append((f"{self.name}_count", key, {}, cumulative))
+        return out
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        # In worker processes, recorded values are also queued for the server process
+        self.forwarding = False
+        self._pending = []
+
+    def _add(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()) -> Counter:
+        return self._add(Counter(self, name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()) -> Gauge:
+        return self._add(Gauge(self, name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=None) -> Histogram:
+        return self._add(Histogram(self, name, documentation, labelnames, buckets))
+
+    def _forward(self, name, op, value, labels):
+        if self.forwarding:
+            self._pending.append((name, op, value, labels))
+
+    def drain(self) -> list:
+        """Worker side: the values recorded since the last drain."""
+        pending, self._pending = self._pending, []
+        return pending
+
+    def replay(self, events: list):
+        """Server side: applies values drained in a worker."""
+        for name, op, value, labels in events or ():
+            metric = self._metrics.get(name)
+            if metric is not None:
+                with metric._lock:
+                    metric._apply(op, _label_key(metric.labelnames, labels), value)
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {_escape(metric.documentation, quote=False)}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, key, extra, value in metric.samples():
+                lines.append(f"{name}{_format_labels(metric.labelnames, key, extra)} {value}")
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+SIZE_BUCKETS = (1e3, 1e4, 1e5, 1e6, 5e6, 1e7, 5e7, 1e8)
+
+LLM_SECONDS = registry.histogram("cq_llm_request_seconds", "LLM call latency", ("backend", "mode", "outcome"))
+LLM_TOKENS = registry.counter("cq_llm_tokens_total", "LLM tokens reported by the API", ("kind",))
+LLM_RETRIES = registry.counter("cq_llm_retries_total", "LLM calls retried after a rate-limit/overload error")
+LLM_CACHE = registry.counter("cq_llm_cache_total", "LLM response cache lookups", ("result",))
+GEOMETRY_CACHE = registry.counter("cq_geometry_cache_total", "Geometry cache lookups", ("result",))
+CHECKPOINTS = registry.counter("cq_checkpoint_total", "Execution checkpoint lookups and writes", ("result",))
+CHECKPOINT_STATEMENTS = registry.counter("cq_checkpoint_statements_total", "Top-level statements executed vs. skipped by resuming from a checkpoint", ("result",))
+STAGE_SECONDS = registry.histogram("cq_stage_seconds", "Time per execution stage inside workers", ("stage",))
+EXECUTOR_SECONDS = registry.histogram("cq_executor_job_seconds", "Executor job latency including queueing", ("job", "outcome"))
+VALIDATION_FAILURES = registry.counter("cq_validation_failures_total", "Generated scripts rejected before execution", ("rule",))
+TURN_SECONDS = registry.histogram("cq_turn_seconds", "Generation turn latency (until the preview is saved)", ("outcome",))
+TURN_RETRIES = registry.histogram("cq_turn_retries", "Error-feedback retries per turn", buckets=(0, 1, 2, 3))
+TURNS = registry.counter("cq_turns_total", "Generation turns", ("outcome",))
+ARTIFACT_BYTES = registry.histogram("cq_artifact_bytes", "Size of exported artifacts", ("format",), buckets=SIZE_BUCKETS)
+EXECUTOR_WORKERS = registry.gauge("cq_executor_workers", "Executor workers by state", ("state",))
+EXECUTOR_RSS = registry.gauge("cq_executor_max_rss_bytes", "Largest resident set size among executor workers")
+ARTIFACT_STORE_BYTES = registry.gauge("cq_artifact_store_bytes", "Bytes in the artifact store")
+
+# ---------------------------------------------------------------- logging
+
+_RESERVED = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+class StructuredFormatter(logging.Formatter):
+    """One line per record: JSON (LOG_FORMAT=json) or "time level logger message key=value ..."."""
+    def __init__(self, fmt: str):
+        super().__init__()
+        self.json = fmt == "json"
+
+    def format(self, record):
+        fields = {k: v for k, v in vars(record).items() if k not in _RESERVED}
+        request_id = _request_id.get()
+        if request_id:
+            fields.setdefault("request_id", request_id)
+        message = record.getMessage()
+        if record.exc_info:
+            fields["exc"] = self.formatException(record.exc_info)
+        if self.json:
+            return json.dumps({
+                "ts": round(record.created, 3), "level": record.levelname, "logger": record.name,
+                "msg": message, **fields,
+            }, default=str)
+        extras = " ".join(f"{k}={v!r}" if isinstance(v, str) and " " in v else f"{k}={v}" for k, v in fields.items() if k != "exc")
+        line = f"{self.formatTime(record)} {record.levelname:7} {record.name} {message}" + (f" {extras}" if extras else "")
+        return line + (f"\n{fields['exc']}" if "exc" in fields else "")
+
+def configure_logging():
+    """Root handler for the app's loggers; LOG_LEVEL=DEBUG also logs prompts, responses and code."""
+    logger = logging.getLogger("app")
+    if getattr(logger, "_configured", False):
+        return
+    handler = logging.StreamHandler()
+    handler.setFormatter(StructuredFormatter(settings.LOG_FORMAT))
+    logger.addHandler(handler)
+    logger.setLevel(settings.LOG_LEVEL.upper())
+    logger.propagate = False
+    logger._configured = True
+
+# ---------------------------------------------------------------- profiling
+
+_request_id = contextvars.ContextVar("request_id", default=None)
+_profile_path = contextvars.ContextVar("profile_path", default=None)
+_profile_lock = threading.Lock()
+
+def profile_path() -> str:
+    """Base path (without extension) for the current request's profiles, or None when not profiling."""
+    return _profile_path.get()
+
+def profiled(path: str, func, *args, **kwargs):
+    """Executor job wrapper: runs func under cProfile and writes <path>.prof."""
+    profile = cProfile.Profile()
+    try:
+        return profile.runcall(func, *args, **kwargs)
+    finally:
+        profile.dump_stats(f"{path}.prof")
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware for PROFILE_MODE: "header" profiles requests sent with
+    `X-Profile: 1`, "all" profiles every request, "off" disables it.
+    The server-side profile covers the whole request (including streamed bodies)
+    and is written to PROFILE_DIR/<id>.server.prof; executor jobs of the request
+    write <id>.<job>.prof. Only one request is profiled at a time (cProfile is
+    per-thread and the event loop is shared), so its server profile also
+    includes whatever else the loop ran meanwhile.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or settings.PROFILE_MODE == "off":
+            return await self.app(scope, receive, send)
+        wanted = settings.PROFILE_MODE == "all" or (b"x-profile", b"1") in scope.get("headers", [])
+        if not wanted or not _profile_lock.acquire(blocking=False):
+            return await self.app(scope, receive, send)
+
+        profile_id = uuid.uuid4().hex[:12]
+        os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+        base = os.path.join(settings.PROFILE_DIR, profile_id)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", profile_id.encode())]
+            await send(message)
+
+        request_token = _request_id.set(profile_id)
+        path_token = _profile_path.set(base)
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            profile.disable()
+            profile.dump_stats(f"{base}.server.prof")
+            _profile_path.reset(path_token)
+            _request_id.reset(request_token)
+            _profile_lock.release()
+            logging.getLogger(__name__).info("Profile captured", extra={"profile_id": profile_id, "path": settings.PROFILE_DIR})
@@ -0,0 +1,9 @@
+"""
+Offline benchmarks for the generate -> execute -> export pipeline.
+
+    cd backend
+    python -m benchmarks.run --iterations 5 --output bench.json
+    python -m benchmarks.run --baseline bench.json      # compare against a previous run
+
+See benchmarks/run.py for the measured stages and the output format.
+"""
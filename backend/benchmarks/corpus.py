@@ -0,0 +1,138 @@
+"""
+Reference CadQuery scripts for the benchmarks, written the way the LLM is asked
+to write them (parametric, `cq` pre-imported, final object in `result`).
+Cover the shapes we see in practice: plain solids, shelled enclosures,
+fillet-heavy parts, assemblies and large patterned arrays.
+"""
+
+BOX = """
+length = 80.0
+width = 60.0
+height = 20.0
+result = cq.Workplane("XY").box(length, width, height)
+"""
+
+ENCLOSURE = """
+length = 120.0
+width = 80.0
+height = 40.0
+wall = 2.0
+post_d = 6.0
+hole_d = 2.5
+
+body = cq.Workplane("XY").box(length, width, height).edges("|Z").fillet(5.0)
+body = body.faces(">Z").shell(-wall)
+
+posts = (
+    cq.Workplane("XY")
+    .workplane(offset=-height / 2 + wall)
+    .rect(length - 16, width - 16, forConstruction=True)
+    .vertices()
+    .circle(post_d / 2)
+    .circle(hole_d / 2)
+    .extrude(height - 2 * wall)
+)
+result = body.union(posts)
+result = result.faces("<X").workplane(centerOption="CenterOfBoundBox").rect(20, 10).cutBlind(-wall)
+"""
+
+FILLETED_BRACKET = """
+thickness = 6.0
+width = 40.0
+leg = 60.0
+hole_d = 6.5
+
+bracket = (
+    cq.Workplane("XZ")
+    .polyline([(0, 0), (leg, 0), (leg, thickness), (thickness, thickness), (thickness, leg), (0, leg)])
+    .close()
+    .extrude(width)
+)
+bracket = bracket.edges("|Y").fillet(2.0)
+bracket = bracket.faces("<Z").workplane(centerOption="CenterOfBoundBox").pushPoints([(-10, 0), (10, 0)]).hole(hole_d)
+bracket = bracket.faces("<X").workplane(centerOption="CenterOfBoundBox").pushPoints([(-10, 0), (10, 0)]).hole(hole_d)
+result = bracket.edges().fillet(0.8)
+"""
+
+KNOB = """
+diameter = 40.0
+height = 18.0
+grip_count = 24
+grip_d = 4.0
+
+knob = cq.Workplane("XY").circle(diameter / 2).extrude(height).faces(">Z").edges().fillet(3.0)
+grips = (
+    cq.Workplane("XY")
+    .polarArray(diameter / 2, 0, 360, grip_count)
+    .circle(grip_d / 2)
+    .extrude(height)
+)
+knob = knob.cut(grips)
+knob = knob.faces("<Z").workplane().hole(6.0, 12.0)
+result = knob
+"""
+
+ASSEMBLY = """
+plate_size = 100.0
+plate_t = 5.0
+standoff_h = 15.0
+
+plate = cq.Workplane("XY").box(plate_size, plate_size, plate_t).edges("|Z").fillet(4.0)
+standoff = cq.Workplane("XY").circle(4.0).circle(1.6).extrude(standoff_h)
+lid = cq.Workplane("XY").box(plate_size, plate_size, plate_t).faces(">Z").workplane().rarray(20, 20, 4, 4).hole(3.0)
+
+result = cq.Assembly(name="stack")
+result.add(plate, name="base", color=cq.Color("gray"))
+offset = plate_size / 2 - 10
+for i, (x, y) in enumerate([(-offset, -offset), (-offset, offset), (offset, -offset), (offset, offset)]):
+    result.add(standoff, name=f"standoff_{i}", loc=cq.Location(cq.Vector(x, y, plate_t / 2)), color=cq.Color("gold"))
+result.add(lid, name="lid", loc=cq.Location(cq.Vector(0, 0, plate_t + standoff_h)), color=cq.Color("blue"))
+"""
+
+PEGBOARD = """
+cols = 12
+rows = 8
+pitch = 6.0
+hole_d = 3.0
+thickness = 3.0
+
+result = (
+    cq.Workplane("XY")
+    .box(cols * pitch, rows * pitch, thickness)
+    .faces(">Z")
+    .workplane()
+    .rarray(pitch, pitch, cols, rows)
+    .hole(hole_d)
+)
+"""
+
+PIN_ARRAY = """
+cols = 6
+rows = 6
+pitch = 5.0
+pin_d = 2.0
+pin_h = 8.0
+
+base = cq.Workplane("XY").box(cols * pitch, rows * pitch, 2.0)
+pins = (
+    cq.Workplane("XY")
+    .workplane(offset=1.0)
+    .rarray(pitch, pitch, cols, rows)
+    .circle(pin_d / 2)
+    .extrude(pin_h)
+    .faces(">Z")
+    .edges()
+    .fillet(0.4)
+)
+result = base.union(pins)
+"""
+
+CORPUS = {
+    "box": BOX,
+    "enclosure": ENCLOSURE,
+    "filleted_bracket": FILLETED_BRACKET,
+    "knob": KNOB,
+    "assembly": ASSEMBLY,
+    "pegboard": PEGBOARD,
+    "pin_array": PIN_ARRAY,
+}
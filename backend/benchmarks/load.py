@@ -0,0 +1,152 @@
+"""
+Local load test of the multi-worker server mode. Runs fully offline (LLM_BACKEND=stub).
+
+For each --workers count, starts `main.py --workers N` on a scratch DATA_DIR, waits
+for /readyz, then sends --requests POST /api/generate calls from --concurrency
+client threads. Every prompt is distinct, so no cache answers for the executor.
+Afterwards each session's model is downloaded, which also checks that any server
+process can serve a session created by another one.
+
+Reports throughput, p50/p95 latency and the speedup over the first worker count.
+"""
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _request(url: str, payload: dict = None, timeout: float = 300):
+    data = json.dumps(payload).encode() if payload is not None else None
+    request = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return response.status, response.read()
+
+def _wait_ready(base: str, workers: int, timeout: float):
+    """Until /readyz answered 200 several times in a row (requests spread over the server processes)."""
+    deadline = time.monotonic() + timeout
+    streak = 0
+    while streak < 4 * workers:
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"Server at {base} did not become ready within {timeout:.0f}s")
+        try:
+            status, _ = _request(f"{base}/readyz", timeout=5)
+            streak = streak + 1 if status == 200 else 0
+        except (urllib.error.URLError, ConnectionError, OSError):
+            streak = 0
+            time.sleep(0.2)
+
+def _generate(base: str, index: int):
+    # Distinct dimensions per request: the stub backend turns them into a distinct box
+    prompt = f"box {20 + index % 50} {20 + index // 50 % 50} {5 + index // 2500}"
+    started = time.perf_counter()
+    try:
+        _, body = _request(f"{base}/api/generate", {"prompt": prompt, "use_cache": False})
+        response = json.loads(body)
+        error = response.get("error")
+    except (urllib.error.URLError, OSError, ValueError) as e:
+        response, error = {}, str(e)
+    return (time.perf_counter() - started) * 1000, response.get("session_id"), error
+
+def _download(base: str, session_id: int) -> bool:
+    try:
+        status, body = _request(f"{base}/api/download/{session_id}?format=stl")
+        return status == 200 and len(body) > 0
+    except (urllib.error.URLError, OSError):
+        return False
+
+def run(workers: int, args, workdir: str) -> dict:
+    data_dir = os.path.join(workdir, f"workers-{workers}")
+    os.makedirs(data_dir, exist_ok=True)
+    env = {
+        **os.environ,
+        "LLM_BACKEND": "stub",
+        "LLM_STUB_LATENCY_MS": str(args.llm_latency_ms),
+        "SPECULATIVE_CANDIDATES": "1",
+        "CHECKPOINTS": "0",
+        "LOG_LEVEL": "WARNING",
+    }
+    if args.exec_workers:
+        env["EXEC_WORKERS"] = str(args.exec_workers)
+    base = f"http://127.0.0.1:{args.port}"
+    log = open(os.path.join(data_dir, "server.log"), "w")
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(BACKEND_DIR, "main.py"), "--workers", str(workers),
+         "--data-dir", data_dir, "--host", "127.0.0.1", "--port", str(args.port)],
+        cwd=data_dir, env=env, stdout=subprocess.DEVNULL, stderr=log,
+    )
+    try:
+        _wait_ready(base, workers, args.startup_timeout)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(args.concurrency) as pool:
+            results = list(pool.map(lambda i: _generate(base, i), range(args.requests)))
+        elapsed = time.perf_counter() - started
+        sessions = [session_id for _, session_id, error in results if not error and session_id]
+        with ThreadPoolExecutor(args.concurrency) as pool:
+            downloads = list(pool.map(lambda s: _download(base, s), sessions))
+    finally:
+        server.send_signal(signal.SIGINT)
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        log.close()
+
+    latencies = np.asarray([ms for ms, _, error in results if not error], dtype=float)
+    errors = [error for _, _, error in results if error]
+    return {
+        "workers": workers,
+        "requests": args.requests,
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "seconds": round(elapsed, 2),
+        "throughput_rps": round((args.requests - len(errors)) / elapsed, 2),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 1) if len(latencies) else None,
+        "p95_ms": round(float(np.percentile(latencies, 95)), 1) if len(latencies) else None,
+        "downloads_failed": downloads.count(False),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput of the server with 1..N worker processes (offline).")
+    parser.add_argument("--workers", default=",".join(str(n) for n in sorted({1, 2, os.cpu_count() or 1})),
+                        help="Comma-separated server process counts (default: 1,2,<cores>)")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--exec-workers", type=int, help="CadQuery workers per server process (default: cores / workers)")
+    parser.add_argument("--llm-latency-ms", type=int, default=0, help="Simulated LLM latency of the stub backend")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--startup-timeout", type=float, default=180)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--workdir", help="Scratch directory for the data dirs (default: a temp dir)")
+    args = parser.parse_args()
+
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="cq-load-"))
+    print(f"workdir {workdir}", file=sys.stderr)
+    results = []
+    for workers in (int(n) for n in args.workers.split(",")):
+        print(f"workers={workers} ...", file=sys.stderr)
+        results.append(run(workers, args, workdir))
+
+    baseline = results[0]["throughput_rps"] or 1e-9
+    for r in results:
+        print(
+            f"workers {r['workers']:3}  {r['throughput_rps']:8.2f} req/s  x{r['throughput_rps'] / baseline:5.2f}  "
+            f"p50 {r['p50_ms']} ms  p95 {r['p95_ms']} ms  errors {r['errors']}  downloads failed {r['downloads_failed']}"
+        )
+        if r["first_error"]:
+            print(f"           first error: {r['first_error']}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"cores": os.cpu_count(), "results": results}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+"""
+Benchmark runner. Runs fully offline against the corpus in benchmarks/corpus.py.
+
+Per corpus script, in a fresh process (so peak RSS is per script):
+    execute      build_result() without the geometry cache
+    tessellate   export_service.tessellate() at MESH_TOLERANCE
+    glb / stl    to_glb() / to_stl() from that tessellation
+    export_stl   cadquery_service.export_stl() (tessellate + write a temp file)
+
+End to end, through the FastAPI app with the LLM replaced by the corpus:
+    generate     POST /api/generate until the preview response
+    fine         ... until /api/download has the fine GLB (background LOD done)
+
+Reports p50/p95 latency, peak RSS and artifact sizes; --output writes JSON,
+--baseline compares p50s against an earlier JSON file.
+"""
+import argparse
+import contextlib
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from importlib import metadata
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    # We chdir into a scratch directory, so the backend must be importable by absolute path
+    sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.corpus import CORPUS
+
+STAGES = ("execute", "tessellate", "glb", "stl", "export_stl")
+E2E_STAGES = ("generate", "fine")
+
+def summarize(samples_ms: list) -> dict:
+    values = np.asarray(samples_ms, dtype=float)
+    return {
+        "n": len(values),
+        "p50_ms": round(float(np.percentile(values, 50)), 2),
+        "p95_ms": round(float(np.percentile(values, 95)), 2),
+        "mean_ms": round(float(values.mean()), 2),
+        "min_ms": round(float(values.min()), 2),
+        "max_ms": round(float(values.max()), 2),
+    }
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+@contextlib.contextmanager
+def _quiet():
+    """
+    Sends stdout (print() calls of the benchmarked scripts, OCCT's native messages)
+    to /dev/null at the file descriptor level, so worker processes started inside
+    the block are silenced too. The services themselves log to stderr.
+    """
+    sys.stdout.flush()
+    saved = os.dup(1)
+    with open(os.devnull, "w") as devnull:
+        os.dup2(devnull.fileno(), 1)
+        try:
+            yield
+        finally:
+            sys.stdout.flush()
+            os.dup2(saved, 1)
+            os.close(saved)
+
+def _progress(message: str):
+    print(f"--- [BENCH] {message} ---", file=sys.stderr)
+
+def _timed(samples: dict, stage: str, func, *args, **kwargs):
+    started = time.perf_counter()
+    value = func(*args, **kwargs)
+    samples[stage].append((time.perf_counter() - started) * 1000)
+    return value
+
+def bench_stages(code: str, iterations: int) -> dict:
+    """Times the in-process stages for one script. Runs in its own process."""
+    from app.services.cadquery_service import build_result, export_stl, warmup
+    from app.services.export_service import tessellate, to_glb, to_stl
+
+    samples = {stage: [] for stage in STAGES}
+    try:
+        with _quiet():
+            warmup()
+            for _ in range(iterations):
+                result = _timed(samples, "execute", build_result, code, use_cache=False)
+                meshes = _timed(samples, "tessellate", tessellate, result)
+                glb = _timed(samples, "glb", to_glb, meshes)
+                stl = _timed(samples, "stl", to_stl, meshes)
+                os.remove(_timed(samples, "export_stl", export_stl, result))
+    except Exception as e:
+        return {"error": str(e)}
+
+    return {
+        "stages": {stage: summarize(values) for stage, values in samples.items()},
+        "peak_rss_mb": _peak_rss_mb(),
+        "artifacts": {
+            "triangles": sum(len(m.triangles) for m in meshes),
+            "glb_bytes": len(glb),
+            "stl_bytes": len(stl),
+        },
+    }
+
+def run_stages(cases: list, iterations: int) -> dict:
+    ctx = multiprocessing.get_context("spawn")
+    results = {}
+    for name in cases:
+        _progress(f"stages: {name}")
+        # A fresh process per script keeps ru_maxrss attributable to that script
+        with ctx.Pool(1) as pool:
+            results[name] = pool.apply(bench_stages, (CORPUS[name], iterations))
+    return results
+
+class CorpusBackend:
+    """
+    LLM stand-in for the end-to-end runs: the prompt is a corpus name and the
+    answer is that script. Each answer gets a unique trailing assignment, which
+    changes the AST so the geometry cache never serves a repeat.
+    """
+    def __init__(self):
+        self._runs = itertools.count()
+
+    async def generate(self, prompt: str, history: list = None, image: bytes = None, temperature: float = None) -> str:
+        return f"{CORPUS[prompt.strip()]}\n_benchmark_run = {next(self._runs)}\n"
+
+    async def stream(self, prompt: str, history: list = None, image: bytes = None):
+        yield await self.generate(prompt, history, image)
+
+def run_e2e(cases: list, iterations: int) -> dict:
+    from fastapi.testclient import TestClient
+    import main
+    from app.services.gemini_service import gemini_service
+
+    gemini_service.backend = CorpusBackend()
+    results = {}
+    with _quiet(), TestClient(main.app) as client:
+        # Let the worker pool come up and warm before timing anything
+        client.post("/api/generate", json={"prompt": "box", "use_cache": False})
+        for name in cases:
+            _progress(f"e2e: {name}")
+            samples = {stage: [] for stage in E2E_STAGES}
+            error = None
+            for _ in range(iterations):
+                started = time.perf_counter()
+                response = client.post("/api/generate", json={"prompt": name, "use_cache": False}).json()
+                samples["generate"].append((time.perf_counter() - started) * 1000)
+                if response.get("error"):
+                    error = response["error"]
+                    break
+                fine = client.get(f"/api/download/{response['session_id']}", params={"format": "glb"})
+                samples["fine"].append((time.perf_counter() - started) * 1000)
+            if error:
+                results[name] = {"error": error}
+                continue
+            results[name] = {
+                "stages": {stage: summarize(values) for stage, values in samples.items()},
+                "worker_rss_mb": client.get("/api/executor/stats").json()["max_rss_mb"],
+                "artifacts": {
+                    "preview_glb_bytes": len(client.get(response["glb_url"]).content),
+                    "fine_glb_bytes": len(fine.content),
+                },
+            }
+    return results
+
+def _git_commit() -> dict:
+    def git(*args):
+        return subprocess.run(["git", *args], cwd=BACKEND_DIR, capture_output=True, text=True).stdout.strip()
+    try:
+        return {"commit": git("rev-parse", "HEAD") or None, "dirty": bool(git("status", "--porcelain"))}
+    except OSError:
+        return {"commit": None, "dirty": None}
+
+def _version(package: str) -> str:
+    try:
+        return metadata.version(package)
+    except metadata.PackageNotFoundError:
+        return None
+
+def print_report(report: dict, baseline: dict = None):
+    for section in ("stages", "e2e"):
+        for name, result in report.get(section, {}).items():
+            if "error" in result:
+                print(f"{section:6} {name:18} ERROR {result['error']}")
+                continue
+            base = (baseline or {}).get(section, {}).get(name, {}).get("stages", {})
+            for stage, stats in result["stages"].items():
+                line = f"{section:6} {name:18} {stage:11} p50 {stats['p50_ms']:10.1f} ms  p95 {stats['p95_ms']:10.1f} ms"
+                if stage in base:
+                    change = (stats["p50_ms"] - base[stage]["p50_ms"]) / max(base[stage]["p50_ms"], 1e-9) * 100
+                    line += f"  ({change:+.1f}% vs baseline)"
+                print(line)
+            extras = {k: v for k, v in result.items() if k != "stages"}
+            print(f"{section:6} {name:18} {json.dumps(extras)}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the generate -> execute -> export pipeline (offline).")
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--cases", help=f"Comma-separated subset of: {', '.join(CORPUS)}")
+    parser.add_argument("--skip-stages", action="store_true", help="Skip the per-stage (in-process) runs")
+    parser.add_argument("--skip-e2e", action="store_true", help="Skip the end-to-end /api/generate runs")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--baseline", help="Earlier --output file to compare p50 latencies against")
+    parser.add_argument("--workdir", help="Scratch directory for the database, caches and artifacts (default: a temp dir)")
+    args = parser.parse_args()
+
+    cases = [c.strip() for c in args.cases.split(",")] if args.cases else list(CORPUS)
+    unknown = [c for c in cases if c not in CORPUS]
+    if unknown:
+        parser.error(f"Unknown cases: {', '.join(unknown)}")
+    output = os.path.abspath(args.output) if args.output else None
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    # Isolate everything the app writes, and make sure nothing goes to the network.
+    # Must happen before app.config is imported (here or in the stage processes).
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="cq-bench-"))
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+    os.environ.update({
+        "LLM_BACKEND": "stub",
+        "SPECULATIVE_CANDIDATES": "1",
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        "LLM_CACHE_PATH": os.path.join(workdir, "llm_cache.db"),
+        "GEOMETRY_CACHE_DIR": os.path.join(workdir, "geometry"),
+        # Repeated iterations would otherwise resume from their own checkpoints
+        "CHECKPOINTS": "0",
+        "IMAGE_STORE_DIR": os.path.join(workdir, "images"),
+    })
+    _progress(f"workdir {workdir}")
+
+    report = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        **_git_commit(),
+        "python": platform.python_version(),
+        "cadquery": _version("cadquery"),
+        "platform": platform.platform(),
+        "iterations": args.iterations,
+    }
+    if not args.skip_stages:
+        report["stages"] = run_stages(cases, args.iterations)
+    if not args.skip_e2e:
+        report["e2e"] = run_e2e(cases, args.iterations)
+
+    print_report(report, baseline)
+    if output:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+        _progress(f"wrote {output}")
+
+if __name__ == "__main__":
+    main()
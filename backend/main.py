@@ -7,30 +7,82 @@ load_dotenv()
 # 1. Parse Args and Set Env Vars BEFORE importing app components
 # We check sys.argv directly or use a partial parser to set envs before imports.
 # This ensures 'app.config' picks up the correct values.
-if __name__ == "__main__":
+def parse_args(argv=None):
     parser = argparse.ArgumentParser(add_help=False) # Helper parser
     parser.add_argument("--gemini-key")
     parser.add_argument("--model", help="Gemini Model Name (default: gemini-2.5-pro)")
+    parser.add_argument("--llm-backend", choices=["gemini", "stub"], help="LLM backend (stub answers offline, for load tests)")
+    parser.add_argument("--exec-workers", type=int, help="Number of CadQuery worker processes (per server process)")
+    parser.add_argument("--workers", type=int, help="Number of server processes sharing the port (default: 1)")
+    parser.add_argument("--data-dir", help="Directory for the database, caches and artifacts (default: current directory)")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
     # Parse known args only, ignore uvicorn args or others if any
-    args, _ = parser.parse_known_args()
-    
+    args, _ = parser.parse_known_args(argv)
+    return args
+
+def set_env(args):
     if args.gemini_key:
         os.environ["GEMINI_API_KEY"] = args.gemini_key
     if args.model:
         os.environ["GEMINI_MODEL"] = args.model
+    if args.llm_backend:
+        os.environ["LLM_BACKEND"] = args.llm_backend
+    if args.exec_workers:
+        os.environ["EXEC_WORKERS"] = str(args.exec_workers)
+    # Inherited by the worker processes, which import this module as "main"
+    if args.workers:
+        os.environ["WEB_WORKERS"] = str(args.workers)
+    if args.data_dir:
+        os.environ["DATA_DIR"] = os.path.abspath(args.data_dir)
+
+if __name__ == "__main__":
+    set_env(parse_args())
 
 # 2. Imports (Now Safe)
-from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from app.config import settings
-from app.database import engine, Base
-from app.routers import generation
+from app.database import async_engine
+from app.routers import artifacts, batches, generation, health, images, metrics, parameters, streaming
+from app.services.artifact_store import artifact_store
+from app.services.batch_queue import batch_scheduler
+from app.services.image_store import image_store
+from app.services.executor import ExecutorUnavailableError, executor
+from app.startup import startup
+from app.telemetry import ProfilingMiddleware, configure_logging
 
-# Create Tables
-Base.metadata.create_all(bind=engine)
+configure_logging()
 
-app = FastAPI(title="CadQuery GenAI Server")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Migration, CadQuery worker pool and import warmup run in the background while we
+    # accept traffic; /readyz reports when they are done, DB routes wait for the migration
+    startup_task = asyncio.create_task(startup.run())
+    # Periodic artifact GC (unreferenced files, disk quota)
+    gc_task = asyncio.create_task(artifact_store.run_gc(settings.ARTIFACT_GC_INTERVAL_SECONDS))
+    # Same for uploaded snapshots
+    image_gc_task = asyncio.create_task(image_store.run_gc(settings.IMAGE_GC_INTERVAL_SECONDS))
+    # Batch jobs queued in the database (including ones interrupted by a restart)
+    batch_task = asyncio.create_task(batch_scheduler.run())
+    yield
+    batch_task.cancel()
+    gc_task.cancel()
+    image_gc_task.cancel()
+    startup_task.cancel()
+    executor.stop()
+    await async_engine.dispose()
+
+app = FastAPI(title="CadQuery GenAI Server", lifespan=lifespan)
+
+@app.exception_handler(ExecutorUnavailableError)
+async def executor_unavailable(request: Request, exc: ExecutorUnavailableError):
+    # No worker to run the job (pool failed to start or stayed busy): a server condition, not a code error
+    return JSONResponse(status_code=503, content={"detail": str(exc)})
 
 # CORS (Allow Frontend)
 app.add_middleware(
@@ -41,28 +93,44 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Mount Generated Static Files
-os.makedirs("static", exist_ok=True)
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# cProfile capture per request (PROFILE_MODE); no-op when off
+app.add_middleware(ProfilingMiddleware)
+
+# Mount Generated Static Files (models saved before the artifact store; new ones are under /artifacts)
+os.makedirs(settings.STATIC_DIR, exist_ok=True)
+app.mount("/static", StaticFiles(directory=settings.STATIC_DIR), name="static")
 
-# Include Router
+# Include Routers
 app.include_router(generation.router)
+app.include_router(streaming.router)
+app.include_router(images.router)
+app.include_router(parameters.router)
+app.include_router(batches.router)
+app.include_router(artifacts.router)
+app.include_router(metrics.router)
+app.include_router(health.router)
 
 # Mount Frontend Build
-if os.path.exists("../frontend/dist"):
-    app.mount("/", StaticFiles(directory="../frontend/dist", html=True), name="frontend")
+FRONTEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "frontend", "dist")
+if os.path.exists(FRONTEND_DIR):
+    app.mount("/", StaticFiles(directory=FRONTEND_DIR, html=True), name="frontend")
 else:
     @app.get("/")
     def read_root():
         return {"message": "Frontend build not found. Please run 'npm run build' in frontend/ and restart."}
 
 # 3. Main Entry
-def main():
-    # We already parsed args for env vars above.
-    # We can just run the server.
+def main(args=None):
+    # Env vars were already set from the same arguments above (or by the caller)
+    if args is None:
+        args = parse_args()
     import uvicorn
-    # Use 'main:app' (reload=False usually for prod) or pass app object directly
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    if settings.WEB_WORKERS > 1:
+        # Each worker process imports 'main:app' itself and runs its own lifespan (executor pool included)
+        uvicorn.run("main:app", host=args.host, port=args.port, workers=settings.WEB_WORKERS,
+                    app_dir=os.path.dirname(os.path.abspath(__file__)))
+    else:
+        uvicorn.run(app, host=args.host, port=args.port)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,16 @@
+import os
+import tempfile
+
+import pytest
+
+# Settings are read at import time: point every data path (database, caches, artifacts) at a scratch directory
+os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="cq-genai-tests-")
+os.environ.setdefault("LLM_BACKEND", "stub")
+
+@pytest.fixture
+def db():
+    """Sync session on the (migrated) scratch database; rows persist across tests."""
+    from app.database import SessionLocal, migrate
+    migrate()
+    with SessionLocal() as session:
+        yield session
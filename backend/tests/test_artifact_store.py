@@ -0,0 +1,69 @@
+import hashlib
+import os
+
+from app.models import GeneratedModel
+from app.services.artifact_store import ArtifactStore
+
+def _store(tmp_path, max_bytes=10 ** 9, grace_seconds=0) -> ArtifactStore:
+    return ArtifactStore(str(tmp_path), max_bytes=max_bytes, grace_seconds=grace_seconds)
+
+def _data(seed: str) -> bytes:
+    # Compressible, so .gz (and .br) variants are written
+    return (seed * 4096).encode()
+
+def _reference(db, path: str):
+    db.add(GeneratedModel(session_id=0, filename=os.path.basename(path), file_path=path, lod_status="ready"))
+    db.commit()
+
+def test_put_is_content_addressed(tmp_path):
+    store = _store(tmp_path)
+    first = store.put(_data("a"), "stl")
+    assert store.put(_data("a"), "stl") == first
+    assert os.path.basename(first).startswith(hashlib.sha256(_data("a")).hexdigest())
+    assert os.path.exists(first + ".gz")
+    assert store.variant(first, "gzip, deflate")[1] in ("gzip", "br")
+    assert store.variant(first, "identity") == (first, None)
+
+def test_gc_removes_only_unreferenced_files(tmp_path, db):
+    store = _store(tmp_path)
+    kept = store.put(_data("kept"), "stl")
+    dropped = store.put(_data("dropped"), "stl")
+    _reference(db, kept)
+    store.collect(db)
+    assert os.path.exists(kept)
+    assert not os.path.exists(dropped) and not os.path.exists(dropped + ".gz")
+
+def test_gc_keeps_recent_unreferenced_files(tmp_path, db):
+    store = _store(tmp_path, grace_seconds=3600)
+    fresh = store.put(_data("fresh"), "stl")
+    store.collect(db)
+    assert os.path.exists(fresh)
+
+def test_quota_never_evicts_referenced_files(tmp_path, db):
+    store = _store(tmp_path, max_bytes=1)
+    paths = [store.put(_data(seed), "glb") for seed in ("x", "y")]
+    for path in paths:
+        _reference(db, path)
+    result = store.collect(db)
+    for path in paths:
+        assert os.path.exists(path)
+        # Precompressed variants are what the quota gives up
+        assert not os.path.exists(path + ".gz") and not os.path.exists(path + ".br")
+        assert store.variant(path, "br, gzip") == (path, None)
+    assert result["entries"] == 2
+
+def test_gc_keeps_files_reused_after_the_scan(tmp_path, db, monkeypatch):
+    store = _store(tmp_path, grace_seconds=3600)
+    path = store.put(_data("reused"), "stl")
+    os.utime(path, (1, 1))
+    scan = store._entries
+
+    def scan_then_reuse(clean=False):
+        entries = scan(clean)
+        # A turn produced the same mesh while GC was deciding
+        assert store.put(_data("reused"), "stl") == path
+        return entries
+
+    monkeypatch.setattr(store, "_entries", scan_then_reuse)
+    assert store.collect(db)["removed"] == 0
+    assert os.path.exists(path) and os.path.exists(path + ".gz")
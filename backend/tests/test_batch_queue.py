@@ -0,0 +1,84 @@
+import asyncio
+
+from app.database import async_engine
+from app.models import BatchItem, BatchJob
+from app.services.batch_queue import BatchScheduler, sweep_grid
+from app.services.executor import executor
+
+def _run(coro):
+    async def scenario():
+        try:
+            return await coro
+        finally:
+            # Pooled connections belong to this event loop
+            await async_engine.dispose()
+    return asyncio.run(scenario())
+
+def _batch(db, *items, code: str = "result = 1") -> int:
+    batch = BatchJob(kind="sweep", status="running", formats="stl")
+    db.add(batch)
+    db.flush()
+    for index, (status, attempts) in enumerate(items):
+        db.add(BatchItem(batch_id=batch.id, item_index=index, code=code, status=status, attempts=attempts))
+    db.commit()
+    return batch.id
+
+def _items(db, batch_id: int) -> list:
+    db.expire_all()
+    items = db.query(BatchItem).filter(BatchItem.batch_id == batch_id).order_by(BatchItem.item_index)
+    return [(item.status, item.attempts) for item in items]
+
+def test_recover_requeues_interrupted_items(db):
+    batch_id = _batch(db, ("running", 1), ("running", 3), ("queued", 0), ("done", 1))
+    scheduler = BatchScheduler(max_parallel=1, poll_seconds=1, max_attempts=3)
+
+    async def recover():
+        scheduler._finishing = asyncio.Lock()  # Created by run()
+        await scheduler._recover()
+
+    _run(recover())
+    assert _items(db, batch_id) == [("queued", 1), ("failed", 3), ("queued", 0), ("done", 1)]
+    given_up = db.query(BatchItem).filter(BatchItem.batch_id == batch_id, BatchItem.item_index == 1).one()
+    assert "Interrupted" in given_up.error and given_up.finished_at is not None
+
+def test_claim_takes_items_in_order_and_counts_attempts(db):
+    # Earlier tests' queued items would be claimed first
+    db.query(BatchItem).filter(BatchItem.status == "queued").update({"status": "cancelled"})
+    db.commit()
+    batch_id = _batch(db, ("queued", 0), ("queued", 0))
+    scheduler = BatchScheduler(max_parallel=1, poll_seconds=1, max_attempts=3)
+
+    async def claim_all():
+        return [await scheduler._claim() for _ in range(3)]
+
+    first, second, none = _run(claim_all())
+    assert none is None
+    assert first < second
+    assert _items(db, batch_id) == [("running", 1), ("running", 1)]
+
+def test_sweep_exports_only_the_batch_formats(db, monkeypatch):
+    batch_id = _batch(db, ("running", 1), code="result = cq.Workplane().box(1, 2, 3)")
+    item = db.query(BatchItem).filter(BatchItem.batch_id == batch_id).one()
+    scheduler = BatchScheduler(max_parallel=1, poll_seconds=1, max_attempts=3)
+    jobs = []
+
+    async def submit(fn, *args, **kwargs):
+        jobs.append(kwargs["formats"])
+        return await asyncio.to_thread(fn, *args, **kwargs)
+
+    async def process():
+        scheduler._finishing = asyncio.Lock()  # Created by run()
+        await scheduler._process(item.id)
+
+    monkeypatch.setattr(executor, "submit", submit)
+    _run(process())
+    db.expire_all()
+    item = db.get(BatchItem, item.id)
+    assert jobs == [("stl",)]
+    assert item.status == "done"
+    assert item.stl_path and item.glb_path is None and item.threemf_path is None
+
+def test_sweep_grid():
+    assert sweep_grid({"a": [1, 2], "b": ["x", "y"]}) == [
+        {"a": 1, "b": "x"}, {"a": 1, "b": "y"}, {"a": 2, "b": "x"}, {"a": 2, "b": "y"},
+    ]
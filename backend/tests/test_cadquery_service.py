@@ -0,0 +1,172 @@
+import json
+import math
+import os
+import struct
+
+import pytest
+
+from app.services import cadquery_service
+from app.services.cadquery_service import (
+    AssemblyCache, CheckpointStore, GeometryCache, build_artifacts, build_preview, build_result, geometry_key,
+)
+from app.services.export_service import export_artifacts
+
+ASSEMBLY = """
+base = cq.Workplane("XY").box(20, 20, 5)
+ball = cq.Workplane("XY").sphere(4)
+result = (
+    cq.Assembly(name="model")
+    .add(base, name="base", color=cq.Color(1, 0, 0, 1))
+    .add(ball, name="ball", color=cq.Color(0, 0, 1, 1), loc=cq.Location((0, 0, 10)))
+)
+"""
+
+@pytest.fixture(autouse=True)
+def caches(tmp_path, monkeypatch):
+    """Empty geometry caches and checkpoint store per test."""
+    monkeypatch.setattr(cadquery_service, "geometry_cache", GeometryCache(str(tmp_path)))
+    monkeypatch.setattr(cadquery_service, "assembly_cache", AssemblyCache(str(tmp_path)))
+    monkeypatch.setattr(cadquery_service, "checkpoint_store", CheckpointStore(str(tmp_path / "checkpoints")))
+
+def _glb_parts(glb: bytes) -> list:
+    """(node name, base color, translation) of every mesh node."""
+    length, = struct.unpack_from("<I", glb, 12)
+    gltf = json.loads(glb[20:20 + length])
+    parts = []
+    for node in gltf["nodes"]:
+        if "mesh" in node:
+            primitive = gltf["meshes"][node["mesh"]]["primitives"][0]
+            color = gltf["materials"][primitive["material"]]["pbrMetallicRoughness"]["baseColorFactor"]
+            parts.append((node["name"], color, node.get("translation")))
+    return parts
+
+def test_cached_assembly_keeps_parts_and_colors():
+    preview = build_preview(ASSEMBLY)
+    # The pipeline's fine LOD is served from the geometry cache the preview filled
+    fine = build_artifacts(ASSEMBLY, formats=("glb",))
+    preview_parts = _glb_parts(preview["glb"])
+    fine_parts = _glb_parts(fine["glb"])
+    assert [name for name, _, _ in preview_parts] == ["base", "ball"]
+    assert [(name, color) for name, color, _ in fine_parts] == [(name, color) for name, color, _ in preview_parts]
+    assert fine_parts[0][1] == pytest.approx([1, 0, 0, 1])
+    assert fine_parts[1][1] == pytest.approx([0, 0, 1, 1])
+
+def test_cached_assembly_keeps_placement():
+    built = export_artifacts(build_result(ASSEMBLY, use_cache=False), formats=("glb",))
+    build_result(ASSEMBLY)
+    cached = build_result(ASSEMBLY)
+    assert cadquery_service.assembly_cache.memory_hits == 1
+    assert _glb_parts(export_artifacts(cached, formats=("glb",))["glb"]) == _glb_parts(built["glb"])
+
+def test_cached_assembly_from_disk():
+    build_result(ASSEMBLY)
+    cadquery_service.assembly_cache._memory.clear()
+    cached = build_result(ASSEMBLY)
+    assert cadquery_service.assembly_cache.disk_hits == 1
+    assert [name for name, _, _ in _glb_parts(export_artifacts(cached, formats=("glb",))["glb"])] == ["base", "ball"]
+
+def test_cached_workplane_result():
+    build_result("result = cq.Workplane().box(1, 2, 3)")
+    cached = build_result("result = cq.Workplane().box(1, 2, 3)")
+    assert cadquery_service.geometry_cache.memory_hits == 1
+    assert cached.Volume() == pytest.approx(6.0)
+
+def test_shape_and_assembly_caches_share_the_disk_quota(tmp_path):
+    shape = build_result("result = cq.Workplane().sphere(5)", use_cache=False).val()
+    entry = cadquery_service._assembly_entry(build_result(ASSEMBLY, use_cache=False))
+    shapes = GeometryCache(str(tmp_path / "shared"))
+    shapes.put("a", shape)
+    assemblies = AssemblyCache(str(tmp_path / "shared"))
+    assemblies.put("b", entry)
+    size = {name: os.path.getsize(tmp_path / "shared" / name) for name in ("a.brep", "b.assy")}
+    os.utime(tmp_path / "shared" / "a.brep", (1, 1))
+    os.utime(tmp_path / "shared" / "b.assy", (2, 2))
+    assert size["a.brep"] < size["b.assy"]
+
+    # Two assemblies fit; the assembly cache makes room by evicting the older shape
+    shapes.max_bytes = assemblies.max_bytes = 2 * size["b.assy"]
+    assemblies.put("c", entry)
+    assert sorted(os.listdir(tmp_path / "shared")) == ["b.assy", "c.assy"]
+    # And the other way round
+    shapes.put("d", shape)
+    assert sorted(os.listdir(tmp_path / "shared")) == ["c.assy", "d.brep"]
+
+def test_geometry_key_ignores_formatting():
+    assert geometry_key("result = cq.Workplane().box(1, 2, 3)") == geometry_key("# box\nresult = cq.Workplane().box(1,2,3)\n")
+    assert geometry_key("result = cq.Workplane().box(1, 2, 3)") != geometry_key("result = cq.Workplane().box(1, 2, 4)")
+
+BRACKET = """
+plate = cq.Workplane("XY").box(40, 20, 4)
+plate = plate.faces(">Z").workplane().rect(30, 10, forConstruction=True).vertices().hole(3)
+plate = plate.edges("|Z").fillet(2)
+result = plate
+"""
+
+@pytest.fixture
+def executed(monkeypatch):
+    """Checkpoint after every statement; records the first line of each statement executed (or replayed)."""
+    monkeypatch.setattr(cadquery_service.settings, "CHECKPOINTS", True)
+    monkeypatch.setattr(cadquery_service.settings, "CHECKPOINT_MIN_MS", 0)
+    lines = []
+    exec_statement = cadquery_service._exec_statement
+
+    def record(statement, scope):
+        lines.append(statement.lineno)
+        exec_statement(statement, scope)
+
+    monkeypatch.setattr(cadquery_service, "_exec_statement", record)
+    return lines
+
+def _measure(shape) -> tuple:
+    bbox = shape.BoundingBox()
+    return shape.Volume(), (bbox.xmin, bbox.ymin, bbox.zmin, bbox.xmax, bbox.ymax, bbox.zmax)
+
+def test_refinement_resumes_from_checkpoint(executed, monkeypatch):
+    refined = BRACKET.replace("result = plate", "result = plate.faces(\"<Z\").chamfer(0.5)")
+    monkeypatch.setattr(cadquery_service.settings, "CHECKPOINTS", False)
+    cold = _measure(cadquery_service._run_script(refined).val())
+    monkeypatch.setattr(cadquery_service.settings, "CHECKPOINTS", True)
+
+    cadquery_service._run_script(BRACKET)
+    executed.clear()
+    resumed = _measure(cadquery_service._run_script(refined).val())
+    # Only the changed last line ran
+    assert executed == [5]
+    assert resumed[0] == pytest.approx(cold[0])
+    assert resumed[1] == pytest.approx(cold[1])
+
+@pytest.mark.parametrize("statement", [
+    "scale = lambda v: v * 2",
+    "sizes = (v for v in range(3))",
+    "m = math",
+])
+def test_unpicklable_scope_skips_checkpoint(executed, statement):
+    code = f"{statement}\nresult = cq.Workplane().box(1, 2, 3)\n"
+    assert cadquery_service._run_script(code).val().Volume() == pytest.approx(6.0)
+    assert cadquery_service.checkpoint_store.stats()["disk_entries"] == 0
+    executed.clear()
+    cadquery_service._run_script(code)
+    assert executed == [1, 2]
+
+def test_restored_prefix_replays_defs_and_imports(executed):
+    prefix = """
+import math as m
+def leg(height):
+    return cq.Workplane().box(2, 2, height)
+height = m.sqrt(16)
+"""
+    cadquery_service._run_script(prefix + "result = leg(height)\n")
+    executed.clear()
+    result = cadquery_service._run_script(prefix + "result = leg(height).translate((0, 0, m.pi))\n")
+    # import and def replayed, height unpickled, last line executed
+    assert executed == [2, 3, 6]
+    assert result.val().Volume() == pytest.approx(16.0)
+    assert result.val().BoundingBox().zmax == pytest.approx(2 + math.pi)
+
+def test_edited_line_invalidates_later_checkpoints(executed):
+    cadquery_service._run_script(BRACKET)
+    executed.clear()
+    edited = BRACKET.replace("box(40, 20, 4)", "box(40, 20, 6)")
+    result = cadquery_service._run_script(edited + "result = result.translate((1, 0, 0))\n")
+    assert executed == [2, 3, 4, 5, 6]
+    assert result.val().BoundingBox().zlen == pytest.approx(6)
@@ -0,0 +1,79 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from app.services import jobs
+from app.services.code_validator import CodeValidationError, validate_code
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _error(code: str) -> CodeValidationError:
+    with pytest.raises(CodeValidationError) as e:
+        validate_code(code)
+    return e.value
+
+def test_accepts_a_plain_script():
+    validate_code(
+        "import cadquery as cq\n"
+        "width = 20\n"
+        "def post(x):\n"
+        "    return cq.Workplane().center(x, 0).circle(1).extrude(5)\n"
+        "result = cq.Workplane().box(width, 10, 2)\n"
+        "for i in range(4):\n"
+        "    result = result.union(post(i * 4))\n"
+    )
+
+def test_reports_the_first_offending_line():
+    error = _error("a = 1\nimport os\nresult = cq.Workplane().box(1, 1, 1)\n")
+    assert error.line_number == 2
+    assert "os" in str(error)
+
+@pytest.mark.parametrize("code", [
+    "result = eval('1')",
+    "result = ().__class__.__bases__",
+    "result = cq.Workplanee().box(1, 1, 1)",
+    "result = undefined_name",
+    "box = cq.Workplane().box(1, 1, 1)",
+    "while True:\n    pass\nresult = 1",
+    "result = cq.Workplane()\nfor i in range(100000):\n    result = result.box(1, 1, 1)",
+])
+def test_rejects(code):
+    _error(code)
+
+@pytest.mark.parametrize("call", [
+    "polarArray(10, 0, 360, 100000)",
+    "polarArray(10, 0, 360, count=100000)",
+    "polarArray(radius=10, startAngle=0, angle=360, count=100000)",
+    "rarray(1, 1, 500, 500)",
+    "rarray(1, 1, xCount=500, yCount=500)",
+    "rarray(1, 1, 500, yCount=500)",
+])
+def test_rejects_large_patterns(call):
+    error = _error(f"n = 1\nresult = cq.Workplane().{call}.box(1, 1, 1)")
+    assert error.line_number == 2
+
+def test_accepts_small_patterns():
+    validate_code("result = cq.Workplane().rarray(1, 1, xCount=5, yCount=5).polarArray(10, 0, 360, count=6).box(1, 1, 1)")
+
+def test_use_before_definition():
+    assert _error("result = size * 2\nsize = 3\n").line_number == 1
+
+def test_executor_jobs_validate_on_request():
+    code = "import subprocess\nresult = cq.Workplane().box(1, 1, 1)"
+    with pytest.raises(CodeValidationError):
+        jobs.build_preview(code, validate=True)
+    with pytest.raises(CodeValidationError):
+        jobs.build_artifacts(code, formats=("stl",), validate=True)
+
+def test_server_does_not_import_cadquery():
+    # Validation happens in the executor workers; the server processes stay free of CadQuery/OCP
+    check = (
+        "import sys, main\n"
+        "from app.startup import _warmup\n"
+        "_warmup()\n"
+        "assert 'cadquery' not in sys.modules and 'OCP' not in sys.modules, 'cadquery imported'\n"
+    )
+    env = {**os.environ, "LLM_BACKEND": "stub"}
+    subprocess.run([sys.executable, "-c", check], cwd=BACKEND_DIR, env=env, check=True, timeout=120)
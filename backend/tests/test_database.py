@@ -0,0 +1,50 @@
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, Text, create_engine, event, inspect
+
+from app import database
+
+def _baseline(metadata: MetaData):
+    """The schema as first released, before nullable columns and indexes were added."""
+    Table("chat_sessions", metadata,
+          Column("id", Integer, primary_key=True, index=True),
+          Column("title", String),
+          Column("created_at", DateTime(timezone=True)))
+    Table("chat_messages", metadata,
+          Column("id", Integer, primary_key=True, index=True),
+          Column("session_id", Integer, index=True),
+          Column("role", String),
+          Column("content", Text),
+          Column("code_snippet", Text, nullable=True),
+          Column("created_at", DateTime(timezone=True)))
+    Table("generated_models", metadata,
+          Column("id", Integer, primary_key=True, index=True),
+          Column("session_id", Integer, index=True),
+          Column("filename", String),
+          Column("file_path", String),
+          Column("created_at", DateTime(timezone=True)))
+
+def test_migrate_baseline_database(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'baseline.db'}")
+    metadata = MetaData()
+    _baseline(metadata)
+    metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.exec_driver_sql("INSERT INTO chat_messages (session_id, role, content) VALUES (1, 'user', 'a box')")
+    monkeypatch.setattr(database, "engine", engine)
+
+    database.migrate()
+    inspector = inspect(engine)
+    messages = {c["name"]: c for c in inspector.get_columns("chat_messages")}
+    assert messages["image_hash"]["nullable"]
+    models = {c["name"] for c in inspector.get_columns("generated_models")}
+    assert {"preview_path", "lod_status", "stl_path", "threemf_path"} <= models
+    assert {"ix_chat_messages_session_created"} <= {i["name"] for i in inspector.get_indexes("chat_messages")}
+    assert {"ix_generated_models_session_created"} <= {i["name"] for i in inspector.get_indexes("generated_models")}
+    assert {"ix_batch_items_status_batch"} <= {i["name"] for i in inspector.get_indexes("batch_items")}
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("SELECT content, image_hash FROM chat_messages").all() == [("a box", None)]
+
+    # Already current: a second run changes nothing
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda conn, cursor, statement, *args: statements.append(statement))
+    database.migrate()
+    assert statements and not [s for s in statements if s.lstrip().upper().startswith(("ALTER", "CREATE", "DROP"))]
@@ -0,0 +1,120 @@
+import asyncio
+import os
+import time
+
+import pytest
+
+from app.services.executor import ExecutorPool, ExecutorUnavailableError, WorkerCrashedError
+
+def _pool(**kwargs) -> ExecutorPool:
+    options = {"size": 1, "timeout": 30, "memory_limit_mb": 0, "max_jobs_per_worker": 0, "queue_timeout": 30}
+    return ExecutorPool(**{**options, **kwargs})
+
+def test_runs_jobs_and_recycles_workers():
+    async def scenario():
+        pool = _pool(max_jobs_per_worker=1)
+        await pool.astart()
+        try:
+            first = await pool.submit(os.getpid)
+            second = await pool.submit(os.getpid)
+            assert await pool.submit(pow, 2, 10) == 1024
+        finally:
+            pool.stop()
+        # One job per worker: every job ran in a fresh process
+        assert first != second
+
+    asyncio.run(scenario())
+
+def test_worker_replacement_does_not_block(monkeypatch):
+    async def scenario():
+        pool = _pool(max_jobs_per_worker=1)
+        await pool.astart()
+        spawn = pool._spawn
+
+        def slow_spawn():
+            time.sleep(0.5)
+            return spawn()
+
+        monkeypatch.setattr(pool, "_spawn", slow_spawn)
+        try:
+            started = time.monotonic()
+            # The used-up worker is replaced in the background: the result is not held back
+            assert await pool.submit(pow, 2, 10) == 1024
+            assert time.monotonic() - started < 0.4
+            assert await pool.submit(pow, 2, 3) == 8
+        finally:
+            pool.stop()
+
+    asyncio.run(scenario())
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/statm"), reason="the address-space cap needs /proc")
+def test_memory_cap_fails_the_job_and_replaces_the_worker():
+    async def scenario():
+        pool = _pool(memory_limit_mb=512)
+        await pool.astart()
+        try:
+            first = await pool.submit(os.getpid)
+            with pytest.raises(WorkerCrashedError, match="memory limit"):
+                # Address space is capped, so this fails at once instead of being caught by the RSS poll
+                await pool.submit(bytearray, 4 * 1024 ** 3)
+            assert await pool.submit(os.getpid) != first
+        finally:
+            pool.stop()
+
+    asyncio.run(scenario())
+
+def test_failed_startup_fails_jobs_at_once(monkeypatch):
+    async def scenario():
+        pool = _pool()
+
+        def spawn():
+            raise OSError("cannot fork")
+
+        monkeypatch.setattr(pool, "_spawn", spawn)
+        with pytest.raises(RuntimeError):
+            await pool.astart()
+        assert pool.startup_error
+        started = time.monotonic()
+        with pytest.raises(ExecutorUnavailableError):
+            await pool.submit(pow, 2, 10)
+        assert time.monotonic() - started < 1
+
+    asyncio.run(scenario())
+
+def test_jobs_waiting_during_startup_fail_with_it(monkeypatch):
+    async def scenario():
+        pool = _pool()
+        release = asyncio.Event()
+
+        async def start_worker():
+            await release.wait()
+            return False
+
+        monkeypatch.setattr(pool, "_start_worker", start_worker)
+        startup = asyncio.create_task(pool.astart())
+        await asyncio.sleep(0)
+        waiting = [asyncio.create_task(pool.submit(pow, 2, 10)) for _ in range(3)]
+        await asyncio.sleep(0.05)
+        release.set()
+        with pytest.raises(RuntimeError):
+            await startup
+        for job in waiting:
+            with pytest.raises(ExecutorUnavailableError):
+                await asyncio.wait_for(job, 1)
+
+    asyncio.run(scenario())
+
+def test_wait_for_a_free_worker_times_out(monkeypatch):
+    async def scenario():
+        pool = _pool(queue_timeout=0.1)
+
+        async def start_worker():
+            # Ready, but busy elsewhere: never handed out
+            return True
+
+        monkeypatch.setattr(pool, "_start_worker", start_worker)
+        await pool.astart()
+        with pytest.raises(ExecutorUnavailableError, match="became free"):
+            await pool.submit(pow, 2, 10)
+
+    asyncio.run(scenario())
@@ -0,0 +1,111 @@
+import io
+import json
+import struct
+import xml.etree.ElementTree as ET
+import zipfile
+
+import cadquery as cq
+import numpy as np
+import pytest
+
+from app.services.export_service import export_artifacts, tessellate, to_3mf, to_glb, to_stl
+
+COMPONENT_TYPES = {5120: np.int8, 5123: np.uint16, 5125: np.uint32, 5126: np.float32}
+
+def _box():
+    return cq.Workplane("XY").box(20, 10, 5)
+
+def _assembly():
+    return (
+        cq.Assembly(name="model")
+        .add(cq.Workplane().box(20, 20, 5), name="base", color=cq.Color(1, 0, 0, 1))
+        .add(cq.Workplane().cylinder(10, 3), name="post", color=cq.Color(0, 0, 1, 0.5), loc=cq.Location((0, 0, 7.5)))
+    )
+
+def read_glb(glb: bytes):
+    """(gltf json, binary chunk)."""
+    magic, version, total = struct.unpack_from("<4sII", glb, 0)
+    assert (magic, version, total) == (b"glTF", 2, len(glb))
+    json_length, json_type = struct.unpack_from("<I4s", glb, 12)
+    assert json_type == b"JSON"
+    gltf = json.loads(glb[20:20 + json_length])
+    bin_length, bin_type = struct.unpack_from("<I4s", glb, 20 + json_length)
+    assert bin_type == b"BIN\x00"
+    return gltf, glb[28 + json_length:28 + json_length + bin_length]
+
+def read_accessor(gltf: dict, binary: bytes, index: int):
+    accessor = gltf["accessors"][index]
+    view = gltf["bufferViews"][accessor["bufferView"]]
+    dtype = np.dtype(COMPONENT_TYPES[accessor["componentType"]])
+    width = {"SCALAR": 1, "VEC3": 3}[accessor["type"]]
+    stride = view.get("byteStride", dtype.itemsize * width) // dtype.itemsize
+    data = np.frombuffer(binary, dtype=dtype, count=view["byteLength"] // dtype.itemsize, offset=view["byteOffset"])
+    return data.reshape(-1, stride)[:accessor["count"], :width]
+
+@pytest.mark.parametrize("quantize", [False, True])
+def test_glb_round_trip(quantize):
+    meshes = tessellate(_box())
+    gltf, binary = read_glb(to_glb(meshes, quantize=quantize))
+    node = gltf["nodes"][1]
+    primitive = gltf["meshes"][node["mesh"]]["primitives"][0]
+    positions = read_accessor(gltf, binary, primitive["attributes"]["POSITION"]).astype(float)
+    if quantize:
+        assert gltf["extensionsRequired"] == ["KHR_mesh_quantization"]
+        positions = positions * node["scale"] + node["translation"]
+    indices = read_accessor(gltf, binary, primitive["indices"]).reshape(-1, 3)
+    assert len(indices) == len(meshes[0].triangles)
+    assert np.allclose(positions.min(axis=0), [-10, -5, -2.5], atol=1e-3)
+    assert np.allclose(positions.max(axis=0), [10, 5, 2.5], atol=1e-3)
+    normals = read_accessor(gltf, binary, primitive["attributes"]["NORMAL"]).astype(float)
+    if quantize:
+        normals /= 127
+    assert np.allclose(np.linalg.norm(normals, axis=1), 1, atol=0.02)
+
+def test_glb_assembly_parts_and_materials():
+    gltf, _ = read_glb(to_glb(tessellate(_assembly())))
+    nodes = [n for n in gltf["nodes"] if "mesh" in n]
+    assert [n["name"] for n in nodes] == ["base", "post"]
+    materials = [gltf["materials"][gltf["meshes"][n["mesh"]]["primitives"][0]["material"]] for n in nodes]
+    assert materials[0]["pbrMetallicRoughness"]["baseColorFactor"] == pytest.approx([1, 0, 0, 1])
+    assert materials[1]["alphaMode"] == "BLEND"
+
+def test_stl_round_trip():
+    meshes = tessellate(_box())
+    stl = to_stl(meshes)
+    count, = struct.unpack_from("<I", stl, 80)
+    assert count == len(meshes[0].triangles)
+    assert len(stl) == 84 + 50 * count
+    records = np.frombuffer(stl, dtype=np.dtype([("normal", "<f4", (3,)), ("vertices", "<f4", (3, 3)), ("attr", "<u2")]), offset=84)
+    vertices = records["vertices"].reshape(-1, 3)
+    assert np.allclose(vertices.min(axis=0), [-10, -5, -2.5]) and np.allclose(vertices.max(axis=0), [10, 5, 2.5])
+    # Normals agree with the winding
+    v = records["vertices"]
+    winding = np.cross(v[:, 1] - v[:, 0], v[:, 2] - v[:, 0])
+    assert (np.einsum("ij,ij->i", winding, records["normal"]) > 0).all()
+
+def test_3mf_round_trip():
+    meshes = tessellate(_assembly())
+    with zipfile.ZipFile(io.BytesIO(to_3mf(meshes))) as zf:
+        assert {"[Content_Types].xml", "_rels/.rels", "3D/3dmodel.model"} <= set(zf.namelist())
+        model = ET.fromstring(zf.read("3D/3dmodel.model"))
+    ns = {"m": "http://schemas.microsoft.com/3dmanufacturing/core/2015/02"}
+    assert model.get("unit") == "millimeter"
+    colors = [base.get("displaycolor") for base in model.findall(".//m:basematerials/m:base", ns)]
+    assert colors == ["#FF0000FF", "#0000FF80"]
+    objects = model.findall(".//m:object", ns)
+    assert len(objects) == 2 and len(model.findall(".//m:build/m:item", ns)) == 2
+    # Welded: the box needs only its 8 corners
+    assert len(objects[0].findall(".//m:vertex", ns)) == 8
+    assert len(objects[0].findall(".//m:triangle", ns)) == 12
+
+def test_export_artifacts_with_printability():
+    artifacts = export_artifacts(_box(), formats=("glb", "stl", "3mf"), analyze_mesh=True)
+    assert set(artifacts) == {"glb", "stl", "3mf", "printability"}
+    report = artifacts["printability"]
+    assert report["watertight"]
+    assert report["volume_mm3"] == pytest.approx(1000, rel=1e-3)
+    assert report["bbox"]["size"] == pytest.approx([20, 10, 5])
+
+def test_export_without_geometry():
+    with pytest.raises(ValueError):
+        export_artifacts(cq.Workplane(), formats=("stl",))
@@ -0,0 +1,111 @@
+import asyncio
+
+import pytest
+from google.genai import errors
+
+from app.services import gemini_service as gemini_module
+from app.services.gemini_service import GeminiService, LLMTimeoutError
+
+RESPONSE = "```python\nresult = cq.Workplane().box(1, 2, 3)\n```"
+
+def _api_error(code: int) -> errors.APIError:
+    cls = errors.ClientError if code < 500 else errors.ServerError
+    return cls(code, {"error": {"code": code, "message": "try again", "status": "UNAVAILABLE"}})
+
+class FakeBackend:
+    """Raises the queued errors one call at a time, then answers (after delay seconds)."""
+    def __init__(self, *failures, delay: float = 0):
+        self.failures = list(failures)
+        self.delay = delay
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def generate(self, prompt, history=None, image=None, temperature=None) -> str:
+        self.calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+            if self.failures:
+                raise self.failures.pop(0)
+            return RESPONSE
+        finally:
+            self.in_flight -= 1
+
+    async def stream(self, prompt, history=None, image=None):
+        text = await self.generate(prompt, history, image)
+        for line in text.splitlines(keepends=True):
+            yield line
+
+@pytest.fixture
+def settings(monkeypatch):
+    settings = gemini_module.settings
+    monkeypatch.setattr(settings, "LLM_MAX_RETRIES", 3)
+    monkeypatch.setattr(settings, "LLM_BACKOFF_SECONDS", 0)
+    monkeypatch.setattr(settings, "LLM_TIMEOUT_SECONDS", 5)
+    return settings
+
+def _service(backend: FakeBackend) -> GeminiService:
+    service = GeminiService()
+    service.backend = backend
+    return service
+
+def test_retries_rate_limits_then_succeeds(settings):
+    backend = FakeBackend(_api_error(429), _api_error(503))
+    code = asyncio.run(_service(backend).generate_code("box"))
+    assert code == "result = cq.Workplane().box(1, 2, 3)"
+    assert backend.calls == 3
+
+def test_retries_are_bounded(settings):
+    backend = FakeBackend(*(_api_error(503) for _ in range(10)))
+    with pytest.raises(errors.ServerError):
+        asyncio.run(_service(backend).generate_code("box"))
+    assert backend.calls == settings.LLM_MAX_RETRIES + 1
+
+@pytest.mark.parametrize("error", [_api_error(400), ValueError("bad request")])
+def test_other_errors_are_not_retried(settings, error):
+    backend = FakeBackend(error)
+    with pytest.raises(type(error)):
+        asyncio.run(_service(backend).generate_code("box"))
+    assert backend.calls == 1
+
+def test_timeout_raises(settings):
+    settings.LLM_TIMEOUT_SECONDS = 0.05
+    backend = FakeBackend(delay=1)
+    with pytest.raises(LLMTimeoutError):
+        asyncio.run(_service(backend).generate_code("box"))
+    assert backend.calls == 1
+
+def test_semaphore_bounds_concurrent_calls(settings, monkeypatch):
+    monkeypatch.setattr(settings, "LLM_MAX_CONCURRENCY", 4)
+    monkeypatch.setattr(settings, "WEB_WORKERS", 2)
+    backend = FakeBackend(delay=0.02)
+    service = _service(backend)
+
+    async def scenario():
+        return await asyncio.gather(*(service.generate_code("box") for _ in range(6)))
+
+    assert len(asyncio.run(scenario())) == 6
+    # Each of the 2 server processes gets half of the limit
+    assert backend.max_in_flight == 2
+
+def test_stream_retries_only_before_the_first_chunk(settings):
+    backend = FakeBackend(_api_error(429))
+
+    async def collect(service):
+        return "".join([text async for text in service.stream_code("box")])
+
+    assert asyncio.run(collect(_service(backend))) == RESPONSE
+    assert backend.calls == 2
+
+    class FailingMidStream(FakeBackend):
+        async def stream(self, prompt, history=None, image=None):
+            self.calls += 1
+            yield "```python\n"
+            raise _api_error(503)
+
+    backend = FailingMidStream()
+    with pytest.raises(errors.ServerError):
+        asyncio.run(collect(_service(backend)))
+    assert backend.calls == 1
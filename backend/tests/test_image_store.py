@@ -0,0 +1,66 @@
+import io
+import os
+import time
+
+import pytest
+from PIL import Image
+
+from app.models import ChatMessage
+from app.services.image_store import ImageNotFoundError, ImageStore, InvalidImageError
+
+def _store(tmp_path, max_bytes=10 ** 9, grace_seconds=0) -> ImageStore:
+    return ImageStore(str(tmp_path), max_side=64, quality=80, max_bytes=max_bytes, grace_seconds=grace_seconds)
+
+def _png(color) -> bytes:
+    out = io.BytesIO()
+    Image.new("RGB", (256, 128), color).save(out, format="PNG")
+    return out.getvalue()
+
+def _age(store: ImageStore, image_id: str, seconds: float):
+    path = os.path.join(store.directory, f"{image_id}.jpg")
+    past = time.time() - seconds
+    os.utime(path, (past, past))
+
+def test_put_downscales_and_deduplicates(tmp_path):
+    store = _store(tmp_path)
+    stored = store.put(_png("red"))
+    assert not stored["deduplicated"]
+    assert Image.open(io.BytesIO(store.get(stored["image_id"]))).size == (64, 32)
+    assert store.put(_png("red"))["deduplicated"]
+    with pytest.raises(InvalidImageError):
+        store.put(b"not an image")
+    with pytest.raises(ImageNotFoundError):
+        store.get("../etc/passwd")
+
+def test_gc_removes_unreferenced_images_after_grace(tmp_path, db):
+    store = _store(tmp_path, grace_seconds=60)
+    used = store.put(_png("green"))["image_id"]
+    abandoned = store.put(_png("blue"))["image_id"]
+    fresh = store.put(_png("white"))["image_id"]
+    db.add(ChatMessage(session_id=0, role="user", content="refine", image_hash=used))
+    db.commit()
+    _age(store, used, 120)
+    _age(store, abandoned, 120)
+    store.collect(db)
+    store.get(used)
+    store.get(fresh)
+    with pytest.raises(ImageNotFoundError):
+        store.get(abandoned)
+
+def test_gc_quota_evicts_least_recently_used(tmp_path, db):
+    store = _store(tmp_path, max_bytes=1, grace_seconds=60)
+    old = store.put(_png("black"))["image_id"]
+    recent = store.put(_png("yellow"))["image_id"]
+    for image_id in (old, recent):
+        db.add(ChatMessage(session_id=0, role="user", content="refine", image_hash=image_id))
+    db.commit()
+    _age(store, old, 300)
+    _age(store, recent, 200)
+    # Re-sent snapshot: counts as recently used
+    store.put(_png("yellow"))
+    result = store.collect(db)
+    with pytest.raises(ImageNotFoundError):
+        store.get(old)
+    # Within the grace period again, so kept even over quota
+    store.get(recent)
+    assert result["entries"] == 1
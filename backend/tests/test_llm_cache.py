@@ -0,0 +1,25 @@
+from app.services.llm_cache import LLMResponseCache, cache_key
+
+HISTORY = [
+    {"role": "user", "content": "a box"},
+    {"role": "model", "content": "for i in range(3):\n    result = result.box(1, 1, 1)\nresult = result.fillet(1)"},
+]
+
+def test_prompt_whitespace_and_case_share_a_key():
+    assert cache_key("m", "s", HISTORY, "Simple box  100x100x50") == cache_key("m", "s", HISTORY, " simple BOX 100x100x50")
+
+def test_history_code_is_keyed_verbatim():
+    reindented = [HISTORY[0], {"role": "model", "content": HISTORY[1]["content"].replace("\n    ", "\n")}]
+    recased = [HISTORY[0], {"role": "model", "content": HISTORY[1]["content"].replace("result", "Result")}]
+    key = cache_key("m", "s", HISTORY, "make it taller")
+    assert cache_key("m", "s", reindented, "make it taller") != key
+    assert cache_key("m", "s", recased, "make it taller") != key
+
+def test_put_get_invalidate(tmp_path):
+    cache = LLMResponseCache(str(tmp_path / "llm.db"), ttl_seconds=60, max_entries=2)
+    for i in range(3):
+        cache.put(f"k{i}", f"code {i}")
+    assert cache.get("k2") == "code 2"
+    assert cache.stats()["entries"] == 2
+    cache.invalidate("k2")
+    assert cache.get("k2") is None
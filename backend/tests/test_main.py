@@ -0,0 +1,15 @@
+import sys
+
+import uvicorn
+
+import main
+
+def test_main_parses_its_own_arguments(monkeypatch):
+    calls = []
+    monkeypatch.setattr(uvicorn, "run", lambda *args, **kwargs: calls.append(kwargs))
+    monkeypatch.setattr(sys, "argv", ["main.py", "--port", "9001", "--reload"])
+    # Imported, not run as a script: no module-level args
+    assert not hasattr(main, "args")
+    main.main()
+    main.main(main.parse_args(["--host", "127.0.0.1"]))
+    assert [(call["host"], call["port"]) for call in calls] == [("0.0.0.0", 9001), ("127.0.0.1", 8000)]
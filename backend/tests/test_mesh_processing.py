@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from app.services.mesh_processing import drop_degenerate, edge_stats, printability, triangle_areas, weld
+
+# Outward-facing (counter-clockwise) quads of the unit cube
+CUBE_QUADS = [
+    [(0, 0, 0), (0, 1, 0), (1, 1, 0), (1, 0, 0)],  # bottom
+    [(0, 0, 1), (1, 0, 1), (1, 1, 1), (0, 1, 1)],  # top
+    [(0, 0, 0), (1, 0, 0), (1, 0, 1), (0, 0, 1)],  # front
+    [(0, 1, 0), (0, 1, 1), (1, 1, 1), (1, 1, 0)],  # back
+    [(0, 0, 0), (0, 0, 1), (0, 1, 1), (0, 1, 0)],  # left
+    [(1, 0, 0), (1, 1, 0), (1, 1, 1), (1, 0, 1)],  # right
+]
+
+def cube_soup(size=10.0, offset=(0, 0, 0)):
+    """A cube as tessellators deliver it: every face with its own vertices."""
+    vertices, triangles = [], []
+    for quad in CUBE_QUADS:
+        base = len(vertices)
+        vertices.extend(np.asarray(quad, dtype=float) * size + offset)
+        triangles.extend([(base, base + 1, base + 2), (base, base + 2, base + 3)])
+    return np.asarray(vertices, dtype=np.float32), np.asarray(triangles, dtype=np.uint32)
+
+def test_weld_merges_coincident_vertices():
+    vertices, triangles = cube_soup()
+    welded_v, welded_t = weld(vertices, triangles, 1e-4)
+    assert len(welded_v) == 8 and welded_t.shape == (12, 3)
+    # Same triangles, by position
+    assert np.allclose(welded_v[welded_t], vertices[triangles])
+    # First-occurrence order
+    assert np.allclose(welded_v[:4], vertices[:4])
+
+def test_weld_tolerance():
+    vertices = np.array([(0, 0, 0), (0.00001, 0, 0), (1, 0, 0), (0, 1, 0)], dtype=np.float32)
+    triangles = np.array([(0, 2, 3), (1, 2, 3)], dtype=np.uint32)
+    assert len(weld(vertices, triangles, 1e-3)[0]) == 3
+    assert len(weld(vertices, triangles, 1e-7)[0]) == 4
+
+def test_drop_degenerate():
+    vertices = np.array([(0, 0, 0), (1, 0, 0), (0, 1, 0), (2, 0, 0), (5, 5, 5)], dtype=np.float32)
+    triangles = np.array([(0, 1, 2), (0, 1, 3), (0, 0, 2), (4, 4, 4)], dtype=np.uint32)
+    kept_v, kept_t = drop_degenerate(vertices, triangles, min_area=1e-9)
+    assert kept_t.tolist() == [[0, 1, 2]]
+    assert len(kept_v) == 3
+    assert triangle_areas(kept_v, kept_t).tolist() == [0.5]
+
+def test_edge_stats():
+    vertices, triangles = weld(*cube_soup(), 1e-4)
+    assert edge_stats(triangles, len(vertices)) == {"open_edges": 0, "non_manifold_edges": 0, "flipped_edges": 0}
+    assert edge_stats(triangles[1:], len(vertices))["open_edges"] == 3
+    flipped = triangles.copy()
+    flipped[0] = flipped[0, ::-1]
+    assert edge_stats(flipped, len(vertices))["flipped_edges"] == 3
+    # A fin on an existing edge
+    extra_v = np.vstack([vertices, [(5, 5, 20)]])
+    fin = np.vstack([triangles, [(triangles[0, 0], triangles[0, 1], len(vertices))]])
+    assert edge_stats(fin, len(extra_v))["non_manifold_edges"] == 1
+
+def test_printability_of_a_closed_cube():
+    report = printability([weld(*cube_soup(), 1e-4)], overhang_angle=45)
+    assert report["watertight"]
+    assert report["volume_mm3"] == pytest.approx(1000)
+    assert report["surface_area_mm2"] == pytest.approx(600)
+    assert report["bbox"]["size"] == [10, 10, 10]
+    # The bottom face lies on the bed
+    assert report["overhang_area_mm2"] == 0
+
+def test_printability_reports_overhangs_and_open_surfaces():
+    floating = weld(*cube_soup(offset=(0, 0, 20)), 1e-4)
+    report = printability([weld(*cube_soup(), 1e-4), floating], overhang_angle=45)
+    assert report["parts"] == 2
+    assert report["volume_mm3"] == pytest.approx(2000)
+    assert report["overhang_area_mm2"] == pytest.approx(100)
+    assert report["overhang_fraction"] == pytest.approx(100 / 1200, abs=1e-4)
+
+    vertices, triangles = weld(*cube_soup(), 1e-4)
+    open_box = printability([(vertices, triangles[2:])], overhang_angle=45)
+    assert not open_box["watertight"] and open_box["open_edges"] == 4
+    assert open_box["volume_mm3"] is None
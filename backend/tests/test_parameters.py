@@ -0,0 +1,61 @@
+import asyncio
+
+import pytest
+
+from app.services.parameters import LatestWins, ParameterError, apply_overrides, extract_parameters
+
+CODE = """# Bracket
+width = 40  # mm
+height = 2.5
+label = "A"
+fillet = True
+offset = -3
+width = 50
+result = cq.Workplane().box(width, height, 1)
+"""
+
+def test_extract_parameters():
+    assert extract_parameters(CODE) == [
+        {"name": "width", "type": "int", "value": 40, "line": 2},
+        {"name": "height", "type": "float", "value": 2.5, "line": 3},
+        {"name": "label", "type": "str", "value": "A", "line": 4},
+        {"name": "fillet", "type": "bool", "value": True, "line": 5},
+        {"name": "offset", "type": "int", "value": -3, "line": 6},
+    ]
+
+def test_apply_overrides_keeps_formatting():
+    code = apply_overrides(CODE, {"width": 45, "height": 3, "label": "B", "fillet": False, "offset": -1})
+    assert code == CODE.replace("width = 40  # mm", "width = 45  # mm").replace("2.5", "3.0") \
+        .replace('"A"', "'B'").replace("True", "False").replace("-3", "-1")
+    # Only the first assignment is the parameter
+    assert "width = 50" in code
+
+def test_apply_overrides_after_non_ascii_text():
+    code = 'name = "Ø20 flange"; size = 20\nresult = None\n'
+    assert apply_overrides(code, {"size": 25}) == 'name = "Ø20 flange"; size = 25\nresult = None\n'
+
+@pytest.mark.parametrize("overrides", [
+    {"depth": 1},
+    {"width": "wide"},
+    {"width": 2.5},
+    {"fillet": 1},
+    {"result": 1},
+])
+def test_apply_overrides_rejects(overrides):
+    with pytest.raises(ParameterError):
+        apply_overrides(CODE, overrides)
+
+def test_unparseable_code():
+    with pytest.raises(ParameterError):
+        extract_parameters("width = (")
+
+def test_latest_wins():
+    async def scenario():
+        updates = LatestWins(debounce_seconds=0.02)
+
+        async def build(value):
+            return value
+
+        return await asyncio.gather(*(updates.run("session", build, value) for value in range(3)))
+
+    assert asyncio.run(scenario()) == [(True, None), (True, None), (False, 2)]
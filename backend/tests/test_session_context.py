@@ -0,0 +1,83 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from app.database import AsyncSessionLocal, async_engine
+from app.models import ChatMessage, ChatSession
+from app.services.session_context import SessionContext, SessionContextManager
+
+def _run(coro):
+    async def scenario():
+        try:
+            return await coro
+        finally:
+            # Pooled connections belong to this event loop
+            await async_engine.dispose()
+    return asyncio.run(scenario())
+
+def _session(db) -> int:
+    session = ChatSession(title="test")
+    db.add(session)
+    db.commit()
+    return session.id
+
+def _message(db, session_id: int, role: str, content: str, code: str = None, created_at: datetime = None) -> int:
+    message = ChatMessage(session_id=session_id, role=role, content=content, code_snippet=code, created_at=created_at)
+    db.add(message)
+    db.commit()
+    return message.id
+
+def _get(manager: SessionContextManager, *session_ids) -> list:
+    async def get():
+        async with AsyncSessionLocal() as session:
+            return [await manager.get(session, session_id) for session_id in session_ids]
+    return _run(get())
+
+def test_load_orders_turns_by_time_then_id(db):
+    session_id = _session(db)
+    now = datetime(2026, 1, 1, 12, 0, 0)
+    # Same second: the id decides; the last message was saved later but is older
+    _message(db, session_id, "user", "second", created_at=now)
+    _message(db, session_id, "model", "Generated Code", code="code 2", created_at=now)
+    _message(db, session_id, "user", "third, no reply", created_at=now)
+    _message(db, session_id, "user", "first", created_at=now - timedelta(minutes=1))
+    _message(db, session_id, "model", "Generated Code", code="code 1", created_at=now - timedelta(minutes=1))
+
+    context, = _get(SessionContextManager(max_sessions=4), session_id)
+    assert list(context.recent) == ["first", "second", "third, no reply"]
+    assert context.latest_code == "code 2"
+
+def test_compact_keeps_prompt_within_budget(monkeypatch):
+    from app.services import session_context
+    monkeypatch.setattr(session_context.settings, "SESSION_RECENT_TURNS", 2)
+    monkeypatch.setattr(session_context.settings, "SESSION_SUMMARY_CHARS", 40)
+    monkeypatch.setattr(session_context.settings, "SESSION_TOKEN_BUDGET", 200)
+    context = SessionContext(1)
+    for turn in range(30):
+        context.add_turn(f"turn {turn}: make the   wall " + "much thicker " * 10, code=f"result = {turn}  # " + "x" * 200)
+
+    assert context._budget_used() <= 200
+    assert [prompt.split(":")[0] for prompt in context.recent] == ["turn 28", "turn 29"]
+    # Oldest summaries dropped first; the rest are whitespace-collapsed and truncated
+    assert context.summary and context.summary[-1].startswith("turn 27: make the wall")
+    assert all(len(line) <= 40 and line.endswith("...") for line in context.summary)
+    history = context.history()
+    assert history[-1] == {"role": "model", "content": context.latest_code}
+    assert context.latest_code.startswith("result = 29")
+
+def test_manager_reloads_on_new_messages_and_evicts(db):
+    first, second, third = (_session(db) for _ in range(3))
+    for session_id in (first, second, third):
+        _message(db, session_id, "user", f"box for {session_id}")
+    manager = SessionContextManager(max_sessions=2)
+
+    cached, = _get(manager, first)
+    assert _get(manager, first) == [cached]
+    # Another worker saved a turn: the max message id moved
+    _message(db, first, "model", "Generated Code", code="result = 1")
+    reloaded, = _get(manager, first)
+    assert reloaded is not cached
+    assert reloaded.latest_code == "result = 1"
+
+    # first is the most recently used when third pushes the cache over capacity
+    _get(manager, second, first, third)
+    assert list(manager._contexts) == [first, third]
@@ -0,0 +1,38 @@
+import asyncio
+
+import pytest
+from pydantic import ValidationError
+
+from app.config import settings
+from app.schemas import GenerateRequest
+
+def test_candidates_are_bounded():
+    assert GenerateRequest(prompt="box", candidates=settings.SPECULATIVE_MAX_CANDIDATES).candidates == settings.SPECULATIVE_MAX_CANDIDATES
+    for candidates in (0, settings.SPECULATIVE_MAX_CANDIDATES + 1, 10_000):
+        with pytest.raises(ValidationError):
+            GenerateRequest(prompt="box", candidates=candidates)
+
+def test_a_failing_candidate_does_not_abort_the_turn(monkeypatch):
+    from app.services import speculative
+
+    async def generate_code(prompt, history=None, image=None, temperature=None):
+        return "result = cq.Workplane()" if temperature == 0.2 else "result = cq.Workplane().box(1, 1, 1)"
+
+    async def submit(func, code, **kwargs):
+        if "box" not in code:
+            raise ValueError("The result has no geometry to export.")
+        await asyncio.sleep(0.05)
+        return {"glb": b"glb"}
+
+    monkeypatch.setattr(settings, "SPECULATIVE_TEMPERATURES", "0.2,0.7")
+    monkeypatch.setattr(speculative.gemini_service, "generate_code", generate_code)
+    monkeypatch.setattr(speculative.executor, "submit", submit)
+
+    async def run():
+        return [event async for event in speculative.speculate("box", [], None, 2)]
+
+    events = asyncio.run(run())
+    done = events[-1]
+    assert done["winner"]["code"] == "result = cq.Workplane().box(1, 1, 1)"
+    failed = [o for o in done["outcomes"] if o["outcome"] == "failed"]
+    assert len(failed) == 1 and "no geometry" in failed[0]["error"]
@@ -0,0 +1,115 @@
+import asyncio
+import json
+
+import pytest
+
+from app.database import async_engine
+from app.routers.streaming import generate_model_stream
+from app.schemas import GenerateRequest
+from app.services.executor import executor
+from app.telemetry import TURNS
+
+class _Client:
+    """The parts of the HTTP request the stream looks at."""
+    def __init__(self, disconnect_after: int = None):
+        self.disconnect_after = disconnect_after
+        self.checks = 0
+
+    async def is_disconnected(self) -> bool:
+        self.checks += 1
+        return self.disconnect_after is not None and self.checks >= self.disconnect_after
+
+def _parse(chunk: str) -> tuple:
+    lines = dict(line.split(": ", 1) for line in chunk.strip().splitlines())
+    return lines["event"], json.loads(lines["data"])
+
+async def _stream(client: _Client, prompt: str = "box 30 20 10"):
+    response = await generate_model_stream(GenerateRequest(prompt=prompt, use_cache=False, candidates=1), client)
+    async for chunk in response.body_iterator:
+        yield _parse(chunk)
+
+def _cancelled_turns() -> float:
+    return TURNS._values.get(("cancelled",), 0)
+
+def _run(scenario):
+    async def run():
+        try:
+            return await scenario()
+        finally:
+            # Pooled connections belong to this event loop
+            await async_engine.dispose()
+    return asyncio.run(run())
+
+@pytest.fixture
+def jobs(db, monkeypatch):
+    """Executor jobs run in a thread of this process; records (job name, outcome)."""
+    record = []
+
+    async def submit(fn, *args, **kwargs):
+        try:
+            result = await asyncio.to_thread(fn, *args, **kwargs)
+        except asyncio.CancelledError:
+            record.append((fn.__name__, "cancelled"))
+            raise
+        record.append((fn.__name__, "done"))
+        return result
+
+    monkeypatch.setattr(executor, "submit", submit)
+    return record
+
+def test_stream_event_order(jobs):
+    async def scenario():
+        return [event async for event in _stream(_Client())]
+
+    events = _run(scenario)
+    names = [name for name, _ in events]
+    tokens = names.count("token")
+    assert tokens > 0
+    assert names == ["llm_start"] + ["token"] * tokens + ["code", "exec_start", "exec_done", "session", "done", "lod_ready"]
+    data = dict(events)
+    assert data["exec_done"]["ok"]
+    assert data["done"]["response"]["session_id"] == data["session"]["session_id"]
+    assert data["lod_ready"]["lod_status"] == "ready"
+    assert data["lod_ready"]["model_id"] == data["done"]["response"]["model_id"]
+    assert jobs == [("build_preview", "done"), ("build_artifacts", "done")]
+
+def test_disconnect_stops_the_stream(jobs):
+    async def scenario():
+        return [name async for name, _ in _stream(_Client(disconnect_after=1))]
+
+    cancelled = _cancelled_turns()
+    assert _run(scenario) == ["llm_start"]
+    assert _cancelled_turns() == cancelled + 1
+    assert jobs == []
+
+def test_disconnect_cancels_the_executor_job(jobs, monkeypatch):
+    started = asyncio.Event()
+
+    async def stuck_submit(fn, *args, **kwargs):
+        started.set()
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            jobs.append((fn.__name__, "cancelled"))
+            raise
+
+    async def scenario():
+        names = []
+
+        async def consume():
+            async for name, _ in _stream(_Client()):
+                names.append(name)
+
+        # The server cancels the response task when the client goes away
+        task = asyncio.create_task(consume())
+        await asyncio.wait_for(started.wait(), 5)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return names
+
+    monkeypatch.setattr(executor, "submit", stuck_submit)
+    cancelled = _cancelled_turns()
+    assert _run(scenario)[-1] == "exec_start"
+    assert jobs == [("build_preview", "cancelled")]
+    assert _cancelled_turns() == cancelled + 1
@@ -0,0 +1,66 @@
+import asyncio
+import uuid
+
+import pytest
+
+from app.services.errors import CadQueryExecutionError
+from app.services.executor import ExecutorPool
+from app.services.jobs import build_preview
+from app.telemetry import STAGE_SECONDS, VALIDATION_FAILURES, Registry
+
+def test_render_text_format():
+    registry = Registry()
+    jobs = registry.counter("jobs_total", "Jobs run\nby path \\ kind", ("path",))
+    workers = registry.gauge("workers", "Workers")
+    latency = registry.histogram("latency_seconds", "Latency", ("stage",), buckets=(0.1, 1))
+    jobs.inc(path='C:\\tmp\\"a"\nb')
+    jobs.inc(2, path='C:\\tmp\\"a"\nb')
+    workers.set(3)
+    for value in (0.05, 0.5, 0.5, 7):
+        latency.observe(value, stage="run")
+
+    assert registry.render().splitlines() == [
+        "# HELP jobs_total Jobs run\\nby path \\\\ kind",
+        "# TYPE jobs_total counter",
+        'jobs_total{path="C:\\\\tmp\\\\\\"a\\"\\nb"} 3',
+        "# HELP workers Workers",
+        "# TYPE workers gauge",
+        "workers 3",
+        "# HELP latency_seconds Latency",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{stage="run",le="0.1"} 1',
+        'latency_seconds_bucket{stage="run",le="1"} 3',
+        'latency_seconds_bucket{stage="run",le="+Inf"} 4',
+        'latency_seconds_sum{stage="run"} 8.05',
+        'latency_seconds_count{stage="run"} 4',
+    ]
+
+def test_histogram_bucket_bounds_are_inclusive():
+    registry = Registry()
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(1,))
+    latency.observe(1)
+    assert 'latency_seconds_bucket{le="1"} 1' in registry.render().splitlines()
+
+def _observations(histogram, **labels) -> int:
+    key = tuple(str(labels.get(name, "")) for name in histogram.labelnames)
+    counts, _ = histogram._values.get(key, ([0], 0.0))
+    return sum(counts)
+
+def test_worker_metrics_merge_into_parent():
+    async def scenario():
+        pool = ExecutorPool(size=1, timeout=60, memory_limit_mb=0, max_jobs_per_worker=0, queue_timeout=60)
+        await pool.astart()
+        try:
+            executed = _observations(STAGE_SECONDS, stage="execute")
+            rejected = VALIDATION_FAILURES._values.get(("syntax",), 0)
+            # A script no other test built, so the worker's geometry cache can't answer it
+            await pool.submit(build_preview, f"height_{uuid.uuid4().hex} = 3\nresult = cq.Workplane().box(1, 2, 3)")
+            # Recorded in the worker, by a job that succeeded and one that failed
+            assert _observations(STAGE_SECONDS, stage="execute") == executed + 1
+            with pytest.raises(CadQueryExecutionError):
+                await pool.submit(build_preview, "result = (", validate=True)
+            assert VALIDATION_FAILURES._values.get(("syntax",), 0) == rejected + 1
+        finally:
+            pool.stop()
+
+    asyncio.run(scenario())
@@ -5,18 +5,25 @@ import PromptInput from './components/PromptInput';
 import LandingPage from './components/LandingPage';
 import Viewer from './components/Viewer';
 import Toast from './components/Toast';
-import api from './api';
+import ParametersPanel from './components/ParametersPanel';
+import { streamGenerate, uploadSnapshot, waitForFineLod } from './api';
 
 function App() {
   const [session, setSession] = useState(null); // { id: 1 }
   const [messages, setMessages] = useState([]);
   const [modelUrl, setModelUrl] = useState(null);
+  const [placeholderUrl, setPlaceholderUrl] = useState(null); // Coarse LOD shown while the fine mesh loads
   const [loading, setLoading] = useState(false);
   const [showLanding, setShowLanding] = useState(true);
   const [sidebarOpen, setSidebarOpen] = useState(true);
   const [toast, setToast] = useState(null); // { message, type }
+  const [status, setStatus] = useState('Generating Model...');
+  const [paramsVersion, setParamsVersion] = useState(0); // Bumped per LLM turn to reload parameters
 
   const viewerRef = React.useRef(null);
+  const abortRef = React.useRef(null);
+  const snapshotRef = React.useRef(null); // image_id of the last uploaded snapshot
+  const latestModelRef = React.useRef(null); // model_id of the latest parameter edit
 
   // No Auth State needed
   // const [username, setUsername] = useState('');
@@ -35,49 +42,114 @@ function App() {
     const newMsg = { role: 'user', content: text };
     setMessages(prev => [...prev, newMsg]);
 
+    let finished = false;
     try {
-      let imageData = null;
+      let imageId = null;
       // If refinement (session exists and we have a model), capture snapshot
       if (session?.id && modelUrl && viewerRef.current) {
         console.log("Capturing snapshot for refinement...");
-        imageData = viewerRef.current.captureSnapshot();
+        const snapshot = await viewerRef.current.captureSnapshot();
+        if (snapshot) {
+          imageId = await uploadSnapshot(snapshot, snapshotRef.current);
+          snapshotRef.current = imageId;
+        }
       }
 
-      const res = await api.post('/generate', {
+      const controller = new AbortController();
+      abortRef.current = controller;
+      setStatus('Generating Model...');
+
+      const handleResult = (data) => {
+        finished = true;
+        setSession({ id: data.session_id });
+
+        if (data.error) {
+          // Handle execution error (200 OK but logic failed)
+          const errorMsg = { role: 'model', content: `Error: ${data.error}` };
+          setMessages(prev => [...prev, errorMsg]);
+          setToast({ message: data.error, type: 'error' });
+        } else {
+          const modelMsg = {
+            role: 'model',
+            content: 'Model Generated',
+            code: data.code
+          };
+          setMessages(prev => [...prev, modelMsg]);
+          // Coarse preview first; swapped for the fine LOD on 'lod_ready'
+          setPlaceholderUrl(null);
+          setModelUrl(data.glb_url);
+          setParamsVersion(v => v + 1);
+        }
+        setLoading(false);
+      };
+
+      await streamGenerate({
         prompt: text,
         session_id: session?.id,
-        image: imageData
-      });
-
-      const data = res.data;
-      setSession({ id: data.session_id });
-
-      if (data.error) {
-        // Handle execution error (200 OK but logic failed)
-        const errorMsg = { role: 'model', content: `Error: ${data.error}` };
-        setMessages(prev => [...prev, errorMsg]);
-        setToast({ message: data.error, type: 'error' });
-      } else {
-        const modelMsg = {
-          role: 'model',
-          content: 'Model Generated',
-          code: data.code
-        };
-        setMessages(prev => [...prev, modelMsg]);
-        setModelUrl(data.glb_url);
-      }
+        image_id: imageId
+      }, (event, payload) => {
+        switch (event) {
+          case 'session':
+            setSession({ id: payload.session_id });
+            break;
+          case 'llm_start':
+            setStatus(payload.attempt > 1 ? `Fixing code (attempt ${payload.attempt})...` : 'Writing code...');
+            break;
+          case 'exec_start':
+            setStatus('Building geometry...');
+            break;
+          case 'retry':
+            console.warn(`Attempt ${payload.attempt} failed: ${payload.reason}`);
+            break;
+          case 'done':
+            handleResult(payload.response);
+            break;
+          case 'lod_ready':
+            if (payload.lods?.fine) {
+              setPlaceholderUrl(payload.lods.preview);
+              setModelUrl(payload.lods.fine);
+            }
+            break;
+          case 'error':
+            throw new Error(payload.detail);
+          default:
+            break;
+        }
+      }, controller.signal);
 
     } catch (err) {
+      if (err.name === 'AbortError') {
+        if (finished) return; // Only the fine LOD was pending
+        setMessages(prev => [...prev, { role: 'model', content: 'Cancelled' }]);
+        return;
+      }
       console.error(err);
       const msg = err.response?.data?.detail || err.message;
       const errorMsg = { role: 'model', content: `Error: ${msg}` };
       setMessages(prev => [...prev, errorMsg]);
       setToast({ message: msg, type: 'error' });
     } finally {
+      abortRef.current = null;
       setLoading(false);
     }
   };
 
+  // Parameter edits rebuild without the LLM: show the preview, then swap in the fine LOD
+  const handleParameterResult = async (data) => {
+    latestModelRef.current = data.model_id;
+    setPlaceholderUrl(null);
+    setModelUrl(data.glb_url);
+    const lod = await waitForFineLod(data.model_id).catch(() => null);
+    if (lod?.lods?.fine && latestModelRef.current === data.model_id) {
+      setPlaceholderUrl(lod.lods.preview);
+      setModelUrl(lod.lods.fine);
+    }
+  };
+
+  const cancelGeneration = () => {
+    abortRef.current?.abort();
+  };
+
   const handleDownload = async (format) => {
     if (!session?.id) return;
 
@@ -97,7 +169,7 @@ function App() {
       {/* Sidebar */}
       <Sidebar
         messages={messages}
-        onNewChat={() => { setMessages([]); setSession(null); setModelUrl(null); }}
+        onNewChat={() => { setMessages([]); setSession(null); setModelUrl(null); setPlaceholderUrl(null); }}
         isOpen={sidebarOpen}
         onToggle={() => setSidebarOpen(!sidebarOpen)}
       />
@@ -111,6 +183,9 @@ function App() {
               <button onClick={() => handleDownload('stl')} className="bg-gray-900/80 backdrop-blur hover:bg-gray-800 text-white px-4 py-2 rounded-lg text-sm border border-gray-700 flex items-center gap-2 shadow-lg transition-all">
                 <Download size={16} /> <span className="hidden sm:inline">STL</span>
               </button>
+              <button onClick={() => handleDownload('3mf')} className="bg-gray-900/80 backdrop-blur hover:bg-gray-800 text-white px-4 py-2 rounded-lg text-sm border border-gray-700 flex items-center gap-2 shadow-lg transition-all">
+                <Download size={16} /> <span className="hidden sm:inline">3MF</span>
+              </button>
               <button onClick={() => handleDownload('gltf')} className="bg-gray-900/80 backdrop-blur hover:bg-gray-800 text-white px-4 py-2 rounded-lg text-sm border border-gray-700 flex items-center gap-2 shadow-lg transition-all">
                 <Download size={16} /> <span className="hidden sm:inline">GLTF</span>
               </button>
@@ -125,14 +200,26 @@ function App() {
                Maybe we overlay the conversation or keep it clean?
                Let's show the Viewer always. If empty, it's just a grid.
            */}
-          <Viewer modelUrl={modelUrl} ref={viewerRef} />
+          <Viewer modelUrl={modelUrl} placeholderUrl={placeholderUrl} ref={viewerRef} />
+
+          {session && !loading && (
+            <ParametersPanel
+              sessionId={session.id}
+              version={paramsVersion}
+              onResult={handleParameterResult}
+              onError={(message) => setToast({ message, type: 'error' })}
+            />
+          )}
 
           {/* Overlay Toast for latest message if from model? */}
           {loading && (
             <div className="absolute inset-0 flex items-center justify-center bg-black/20 backdrop-blur-sm z-20 pointer-events-none">
               <div className="bg-gray-900 border border-gray-700 px-6 py-4 rounded-2xl shadow-2xl flex items-center gap-3">
                 <div className="w-2 h-2 bg-blue-500 rounded-full animate-ping" />
-                <span className="text-sm font-medium text-blue-200">Generating Model...</span>
+                <span className="text-sm font-medium text-blue-200">{status}</span>
+                <button onClick={cancelGeneration} className="pointer-events-auto ml-2 text-xs text-gray-400 hover:text-white border border-gray-700 rounded px-2 py-1">
+                  Cancel
+                </button>
               </div>
             </div>
           )}
@@ -6,4 +6,72 @@ const api = axios.create({
 
 // Auth removed
 
+// Streams /api/generate/stream (Server-Sent Events over a POST body).
+// Calls onEvent(name, data) for every event; abort via the given AbortSignal.
+export async function streamGenerate(body, onEvent, signal) {
+    const res = await fetch('/api/generate/stream', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify(body),
+        signal,
+    });
+    if (!res.ok) {
+        throw new Error(`Request failed with status ${res.status}`);
+    }
+
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        // Events are separated by a blank line
+        let sep;
+        while ((sep = buffer.indexOf('\n\n')) !== -1) {
+            const raw = buffer.slice(0, sep);
+            buffer = buffer.slice(sep + 2);
+
+            let name = 'message';
+            let data = '';
+            for (const line of raw.split('\n')) {
+                if (line.startsWith('event: ')) name = line.slice(7);
+                else if (line.startsWith('data: ')) data += line.slice(6);
+            }
+            onEvent(name, data ? JSON.parse(data) : null);
+        }
+    }
+}
+
+// SHA-256 hex of a Blob; null where WebCrypto is unavailable (non-HTTPS origins)
+async function sha256Hex(blob) {
+    if (!window.crypto?.subtle) return null;
+    const digest = await window.crypto.subtle.digest('SHA-256', await blob.arrayBuffer());
+    return Array.from(new Uint8Array(digest), b => b.toString(16).padStart(2, '0')).join('');
+}
+
+// Uploads a viewer snapshot and returns its image_id (the SHA-256 of its bytes).
+// An unchanged snapshot (same hash as `previous`) is not re-sent.
+export async function uploadSnapshot(blob, previous) {
+    const hash = await sha256Hex(blob);
+    if (hash && hash === previous) return hash;
+
+    const form = new FormData();
+    form.append('file', blob, 'snapshot.jpg');
+    const res = await api.post('/images', form);
+    return res.data.image_id;
+}
+
+// Polls a model's LOD status until the fine mesh is ready (or failed/timed out); returns the status payload.
+export async function waitForFineLod(modelId, { interval = 500, attempts = 120 } = {}) {
+    for (let i = 0; i < attempts; i++) {
+        const res = await api.get(`/models/${modelId}`);
+        if (res.data.lod_status !== 'pending') return res.data;
+        await new Promise(resolve => setTimeout(resolve, interval));
+    }
+    return null;
+}
+
 export default api;
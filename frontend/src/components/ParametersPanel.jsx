@@ -0,0 +1,96 @@
+import React, { useEffect, useRef, useState } from 'react';
+import { SlidersHorizontal, ChevronDown, ChevronUp } from 'lucide-react';
+import api from '../api';
+
+// Slider bounds around the value the LLM chose
+function rangeFor(param) {
+    const v = param.initial;
+    const min = Math.min(0, v * 2);
+    const max = Math.max(v * 2, 1);
+    const step = param.type === 'int' ? 1 : Math.max((max - min) / 200, 0.01);
+    return { min, max, step };
+}
+
+// Edits the top-level variables of the session's latest code without calling the LLM.
+// `version` changes whenever a new LLM turn lands, which reloads the parameter list.
+export default function ParametersPanel({ sessionId, version, onResult, onError }) {
+    const [params, setParams] = useState([]);
+    const [open, setOpen] = useState(true);
+    const [busy, setBusy] = useState(false);
+    const pending = useRef(0);
+
+    useEffect(() => {
+        if (!sessionId) {
+            setParams([]);
+            return;
+        }
+        api.get(`/sessions/${sessionId}/parameters`)
+            .then(res => setParams(res.data.parameters.map(p => ({ ...p, initial: p.value }))))
+            .catch(() => setParams([]));
+    }, [sessionId, version]);
+
+    const update = async (name, value) => {
+        setParams(prev => prev.map(p => (p.name === name ? { ...p, value } : p)));
+        pending.current += 1;
+        setBusy(true);
+        try {
+            // The server debounces per session; superseded updates come back empty
+            const res = await api.post(`/sessions/${sessionId}/parameters`, { values: { [name]: value } });
+            if (res.data.superseded) return;
+            if (res.data.error) onError(res.data.error);
+            else onResult(res.data);
+        } catch (err) {
+            onError(err.response?.data?.detail || err.message);
+        } finally {
+            pending.current -= 1;
+            if (pending.current === 0) setBusy(false);
+        }
+    };
+
+    if (!params.length) return null;
+
+    return (
+        <div className="absolute top-16 right-4 z-10 w-72 bg-gray-900/90 backdrop-blur border border-gray-700 rounded-lg shadow-lg text-sm">
+            <button onClick={() => setOpen(!open)} className="w-full flex items-center justify-between px-4 py-2 text-gray-300 hover:text-white">
+                <span className="flex items-center gap-2">
+                    <SlidersHorizontal size={16} /> Parameters
+                    {busy && <span className="w-2 h-2 bg-blue-500 rounded-full animate-ping" />}
+                </span>
+                {open ? <ChevronUp size={16} /> : <ChevronDown size={16} />}
+            </button>
+            {open && (
+                <div className="px-4 pb-3 space-y-3 max-h-96 overflow-y-auto">
+                    {params.map(p => (
+                        <div key={p.name}>
+                            <div className="flex justify-between text-xs text-gray-400 mb-1">
+                                <span className="font-mono">{p.name}</span>
+                                {(p.type === 'int' || p.type === 'float') && <span className="font-mono">{p.value}</span>}
+                            </div>
+                            {(p.type === 'int' || p.type === 'float') && (
+                                <input
+                                    type="range"
+                                    {...rangeFor(p)}
+                                    value={p.value}
+                                    onChange={e => update(p.name, Number(e.target.value))}
+                                    className="w-full accent-blue-500"
+                                />
+                            )}
+                            {p.type === 'bool' && (
+                                <input type="checkbox" checked={p.value} onChange={e => update(p.name, e.target.checked)} className="accent-blue-500" />
+                            )}
+                            {p.type === 'str' && (
+                                <input
+                                    type="text"
+                                    defaultValue={p.value}
+                                    onKeyDown={e => e.key === 'Enter' && update(p.name, e.target.value)}
+                                    onBlur={e => e.target.value !== p.value && update(p.name, e.target.value)}
+                                    className="w-full bg-gray-800 border border-gray-700 rounded px-2 py-1 font-mono text-white"
+                                />
+                            )}
+                        </div>
+                    ))}
+                </div>
+            )}
+        </div>
+    );
+}
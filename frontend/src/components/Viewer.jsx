@@ -12,15 +12,17 @@ function CaptureHandler({ captureRef }) {
     const { gl, scene, camera } = useThree();
 
     useImperativeHandle(captureRef, () => ({
+        // Resolves to a JPEG Blob (uploaded as binary rather than a base64 data URL)
         captureSnapshot: () => {
             gl.render(scene, camera);
-            return gl.domElement.toDataURL('image/jpeg', 0.8);
+            return new Promise(resolve => gl.domElement.toBlob(resolve, 'image/jpeg', 0.8));
         }
     }));
     return null;
 }
 
-const Viewer = forwardRef(({ modelUrl }, ref) => {
+// placeholderUrl (an already loaded, coarser LOD) stays visible while modelUrl loads
+const Viewer = forwardRef(({ modelUrl, placeholderUrl }, ref) => {
     return (
         <div className="w-full h-full bg-gray-900 rounded-lg overflow-hidden relative">
             {!modelUrl && (
@@ -36,7 +38,9 @@ const Viewer = forwardRef(({ modelUrl }, ref) => {
                 <CaptureHandler captureRef={ref} />
                 <Suspense fallback={null}>
                     <Stage environment="city" intensity={0.6}>
-                        {modelUrl && <Model url={modelUrl} key={modelUrl} />}
+                        <Suspense fallback={placeholderUrl ? <Model url={placeholderUrl} /> : null}>
+                            {modelUrl && <Model url={modelUrl} key={modelUrl} />}
+                        </Suspense>
                     </Stage>
                 </Suspense>
                 <OrbitControls makeDefault />
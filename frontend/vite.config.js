@@ -13,6 +13,10 @@ export default defineConfig({
       '/static': {
         target: 'http://localhost:8000',
         changeOrigin: true,
+      },
+      '/artifacts': {
+        target: 'http://localhost:8000',
+        changeOrigin: true,
       }
     }
   }